@@ -1,18 +1,72 @@
 import os
+import copy
+import random
+import contextlib
+import statistics
+import warnings
+import numpy as np
 import torch
 import torch.nn as nn
+import torch.multiprocessing as mp
 import torch.optim as optim
 from torch.utils.tensorboard import SummaryWriter
 from tqdm import tqdm
 import matplotlib.pyplot as plt
+from basis import make_basis
+from metrics import MetricsSink
 
 FIXED_POLICY=False
 
 torch.set_default_tensor_type(torch.DoubleTensor)
 
+_NO_PHASE = contextlib.nullcontext()
+
+def phase(profiler, name):
+    """ Phase of the profiler, if any, otherwise a no-op context """
+    return _NO_PHASE if profiler is None else profiler.phase(name)
+
+def policy_generator(coefficients, basis):
+    """ Builds the policy function from the coefficients computed by the NN.
+        Batched inputs produce an (actuators, batch) output.
+    """
+    batch_shape = coefficients.shape[:-1]
+    coefficients = torch.reshape(coefficients, (-1, basis.n_coeff))
+
+    def expand(basis_matrix):
+        policy = coefficients.mm(basis_matrix)
+        policy = policy.reshape(batch_shape + (-1, basis_matrix.shape[-1]))
+        policy = policy.permute(tuple(reversed(range(policy.dim()))))
+        return policy.reshape((len(policy),) + tuple(d for d in policy.shape[1:] if d != 1))
+
+    def policy(t):
+        """ The policy function is the expansion of the coefficients on the basis """
+        return expand(basis(t))[0]
+
+    def trajectory(dt, horizon):
+        """ Evaluates the policy on each step of the horizon with a single matmul,
+            the first dimension of the output is the time
+        """
+        return expand(basis.matrix(dt, horizon))
+
+    policy.trajectory = trajectory
+    return policy
+
+def observation(status):
+    """ Stacks the state variables of a player into a (batch, sensors) matrix """
+    return torch.stack([torch.as_tensor(s).reshape(-1) for s in status], dim=-1)
+
+def compiled_rollout(world_model, attacker_nn, defender_nn, method):
+    """ CompiledRollout of the world model, None if no method is given """
+    if method is None:
+        return None
+    # imported here, the rollout module builds on this one
+    from rollout import CompiledRollout
+    return CompiledRollout(world_model, attacker_nn, defender_nn, method)
+
 class Attacker(nn.Module):
     """ NN architecture for the attacker """
-    def __init__(self, model, n_hidden_layers, layer_size, n_coeff, noise_size):
+    def __init__(self, model, n_hidden_layers, layer_size, n_coeff, noise_size,
+                 basis='polynomial', horizon=None):
         super().__init__()
 
         assert n_hidden_layers > 0
@@ -21,6 +75,7 @@ class Attacker(nn.Module):
         self.ls = layer_size
         self.noise_size = noise_size
         self.n_coeff = n_coeff
+        self.basis = make_basis(basis, n_coeff, horizon)
 
         input_layer_size = model.environment.sensors + noise_size
         output_layer_size = model.environment.actuators * n_coeff
@@ -41,22 +96,14 @@ class Attacker(nn.Module):
     def forward(self, x):
         """ Uses the NN's output to compute the coefficients of the policy function """
         coefficients = self.nn(x)
-        coefficients = torch.reshape(coefficients, (-1, self.n_coeff))
-
-        def policy_generator(t):
-            """ The policy function is defined as polynomial """
-            basis = [t**i for i in range(self.n_coeff)]
-            basis = torch.tensor(basis, dtype=torch.get_default_dtype())
-            basis = torch.reshape(basis, (self.n_coeff, -1))
-            return coefficients.mm(basis).squeeze()
-
-        return policy_generator
+        return policy_generator(coefficients, self.basis)
 
 
 class Defender(nn.Module):
     """ NN architecture for the defender """
 
-    def __init__(self, model, n_hidden_layers, layer_size, n_coeff):
+    def __init__(self, model, n_hidden_layers, layer_size, n_coeff, basis='polynomial',
+                 horizon=None):
         super().__init__()
 
         assert n_hidden_layers > 0
@@ -64,6 +111,7 @@ class Defender(nn.Module):
         self.hid = n_hidden_layers
         self.ls = layer_size
         self.n_coeff = n_coeff
+        self.basis = make_basis(basis, n_coeff, horizon)
 
         input_layer_size = model.agent.sensors
         output_layer_size = model.agent.actuators * n_coeff
@@ -84,16 +132,7 @@ class Defender(nn.Module):
     def forward(self, x):
         """ Uses the NN's output to compute the coefficients of the policy function """
         coefficients = self.nn(x)
-        coefficients = torch.reshape(coefficients, (-1, self.n_coeff))
-
-        def policy_generator(t):
-            """ The policy function is defined as polynomial """
-            basis = [t**i for i in range(self.n_coeff)]
-            basis = torch.tensor(basis, dtype=torch.get_default_dtype())
-            basis = torch.reshape(basis, (self.n_coeff, -1))
-            return coefficients.mm(basis).squeeze()
-
-        return policy_generator
+        return policy_generator(coefficients, self.basis)
 
 
 
@@ -101,7 +140,8 @@ class Trainer:
     """ The class contains the training logic """
 
     def __init__(self, world_model, robustness_computer, \
-                attacker_nn, defender_nn, lr, logging_dir=None):
+                attacker_nn, defender_nn, lr, logging_dir=None, rho_quantile=None, \
+                profiler=None, compiled=None):
 
         self.model = world_model
         self.robustness_computer = robustness_computer
@@ -109,8 +149,25 @@ class Trainer:
         self.attacker = attacker_nn
         self.defender = defender_nn
 
-        self.attacker_loss_fn = lambda x: torch.tensor(x, requires_grad = True)
-        self.defender_loss_fn = lambda x: torch.tensor(-x, requires_grad = True)
+        # the losses keep the graph of the rollout, so that the
+        # gradients of the robustness reach the policies
+        self.attacker_loss_fn = lambda x: x
+        self.defender_loss_fn = lambda x: -x
+
+        # batched rollouts are scored with the mean robustness unless
+        # a quantile of the per-scenario robustness is requested
+        self.rho_quantile = rho_quantile
+
+        # optional PhaseProfiler that records where each step spends its time
+        self.profiler = profiler
+
+        # with compiled='trace' or 'compile' the policies and the physics
+        # of each timestep run as a single graph, see rollout.py.
+        # The fixed policies are evaluated once per episode instead.
+        if compiled is not None and FIXED_POLICY is True:
+            warnings.warn("FIXED_POLICY is set, the rollouts are not compiled")
+            compiled = None
+        self.rollout = compiled_rollout(world_model, attacker_nn, defender_nn, compiled)
 
         atk_optimizer = optim.Adam(attacker_nn.parameters(), lr=lr)
         def_optimizer = optim.Adam(defender_nn.parameters(), lr=lr)
@@ -123,114 +180,190 @@ class Trainer:
             # self.log = SummaryWriter(logging_dir)
             self.logging_dir = logging_dir
 
-
-    def train_attacker_step(self, time_horizon, dt, atk_static):
-        """ Training step for the attacker. The defender's passive. """
+    def observe(self):
+        """ Returns the noise and the observations of both players
+            as (batch, size) matrices
+        """
+        oa = observation(self.model.agent.status)
+        oe = observation(self.model.environment.status)
+        z = torch.rand(oe.shape[0], self.attacker.noise_size)
+        return z, oa, oe
+
+    def aggregate_robustness(self, rho):
+        """ Reduces the per-scenario robustness of a batch to a scalar """
+        if self.rho_quantile is None:
+            return rho.mean()
+        return torch.quantile(rho, self.rho_quantile)
+
+    def attacker_loss(self, time_horizon, dt, atk_static):
+        """ Simulates an episode and computes the loss of the attacker.
+            The defender's passive.
+        """
+        self.model.traces.reserve(time_horizon)
 
         if FIXED_POLICY is True:
-            z = torch.rand(self.attacker.noise_size)
-            oa = torch.tensor(self.model.agent.status)
-            oe = torch.tensor(self.model.environment.status)
+            with phase(self.profiler, 'policy'):
+                z, oa, oe = self.observe()
 
-            atk_policy = self.attacker(torch.cat((z, oe)))
+                atk_policy = self.attacker(torch.cat((z, oe), dim=-1))
 
-            with torch.no_grad():
-                def_policy = self.defender(oa)
+                with torch.no_grad():
+                    def_policy = self.defender(oa)
+
+                atk_inputs = atk_policy.trajectory(dt, time_horizon)
+                def_inputs = def_policy.trajectory(dt, time_horizon)
 
         t = 0
         for i in range(time_horizon):
 
+            if self.rollout is not None:
+                with phase(self.profiler, 'rollout'):
+                    self.rollout.step(0 if atk_static else t, t, dt, passive='defender')
+                t += dt
+                continue
+
             if FIXED_POLICY is False:
-                z = torch.rand(self.attacker.noise_size)
-                oa = torch.tensor(self.model.agent.status)
-                oe = torch.tensor(self.model.environment.status)
+                with phase(self.profiler, 'policy'):
+                    z, oa, oe = self.observe()
 
-                atk_policy = self.attacker(torch.cat((z, oe)))
+                    atk_policy = self.attacker(torch.cat((z, oe), dim=-1))
 
-                with torch.no_grad():
-                    def_policy = self.defender(oa)
+                    with torch.no_grad():
+                        def_policy = self.defender(oa)
 
-            # if the attacker is static (e.g. in the case it does not vary over time)
-            # the policy function is always sampled in the same point since the
-            # attacker do not vary policy over time
-            atk_input = atk_policy(0 if atk_static else t)
-            def_input = def_policy(t)
+                    # if the attacker is static (e.g. in the case it does not vary over time)
+                    # the policy function is always sampled in the same point since the
+                    # attacker do not vary policy over time
+                    atk_input = atk_policy(0 if atk_static else t)
+                    def_input = def_policy(t)
+            else:
+                atk_input = atk_inputs[0 if atk_static else i]
+                def_input = def_inputs[i]
 
-            self.model.step(atk_input, def_input, dt)
+            with phase(self.profiler, 'physics'):
+                self.model.step(atk_input, def_input, dt)
 
             t += dt
 
-        rho = self.robustness_computer.compute(self.model)
+        with phase(self.profiler, 'robustness'):
+            rho = self.robustness_computer.compute(self.model)
+            rho = self.aggregate_robustness(rho)
+
+        return self.attacker_loss_fn(rho)
 
-        self.attacker_optimizer.zero_grad()
-        loss = self.attacker_loss_fn(rho)
-        loss.backward()
-        self.attacker_optimizer.step()
+    def train_attacker_step(self, time_horizon, dt, atk_static):
+        """ Training step for the attacker. The defender's passive. """
+        loss = self.attacker_loss(time_horizon, dt, atk_static)
+
+        with phase(self.profiler, 'optimizer'):
+            self.attacker_optimizer.zero_grad()
+        with phase(self.profiler, 'backward'):
+            # the loss of a player without actuators, such as the attacker
+            # of the cartpole, does not depend on its parameters
+            if loss.requires_grad:
+                loss.backward()
+        with phase(self.profiler, 'optimizer'):
+            self.attacker_optimizer.step()
 
         # return float(loss.detach())
         return float(loss)
 
 
-    def train_defender_step(self, time_horizon, dt, atk_static):
-        """ Training step for the defender. The attacker's passive. """
+    def defender_loss(self, time_horizon, dt, atk_static):
+        """ Simulates an episode and computes the loss of the defender.
+            The attacker's passive.
+        """
+        self.model.traces.reserve(time_horizon)
 
         if FIXED_POLICY is True:
-            z = torch.rand(self.attacker.noise_size)
-            oa = torch.tensor(self.model.agent.status)
-            oe = torch.tensor(self.model.environment.status)
+            with phase(self.profiler, 'policy'):
+                z, oa, oe = self.observe()
+
+                with torch.no_grad():
+                    atk_policy = self.attacker(torch.cat((z, oe), dim=-1))
 
-            with torch.no_grad():
-                atk_policy = self.attacker(torch.cat((z, oe)))
+                def_policy = self.defender(oa)
 
-            def_policy = self.defender(oa)
+                atk_inputs = atk_policy.trajectory(dt, time_horizon)
+                def_inputs = def_policy.trajectory(dt, time_horizon)
 
         t = 0
         for i in range(time_horizon):
 
+            if self.rollout is not None:
+                with phase(self.profiler, 'rollout'):
+                    self.rollout.step(0 if atk_static else t, t, dt, passive='attacker')
+                t += dt
+                continue
+
             if FIXED_POLICY is False:
-                z = torch.rand(self.attacker.noise_size)
-                oa = torch.tensor(self.model.agent.status)
-                oe = torch.tensor(self.model.environment.status)
+                with phase(self.profiler, 'policy'):
+                    z, oa, oe = self.observe()
 
-                with torch.no_grad():
-                    atk_policy = self.attacker(torch.cat((z, oe)))
+                    with torch.no_grad():
+                        atk_policy = self.attacker(torch.cat((z, oe), dim=-1))
 
-                def_policy = self.defender(oa)
+                    def_policy = self.defender(oa)
 
-            # if the attacker is static, see the comments above
-            atk_input = atk_policy(0 if atk_static else t)
-            def_input = def_policy(t)
+                    # if the attacker is static, see the comments above
+                    atk_input = atk_policy(0 if atk_static else t)
+                    def_input = def_policy(t)
+            else:
+                atk_input = atk_inputs[0 if atk_static else i]
+                def_input = def_inputs[i]
 
-            self.model.step(atk_input, def_input, dt)
+            with phase(self.profiler, 'physics'):
+                self.model.step(atk_input, def_input, dt)
 
             t += dt
 
-        rho = self.robustness_computer.compute(self.model)
+        with phase(self.profiler, 'robustness'):
+            rho = self.robustness_computer.compute(self.model)
+            rho = self.aggregate_robustness(rho)
+
+        return self.defender_loss_fn(rho)
 
-        self.defender_optimizer.zero_grad()
-        loss = self.defender_loss_fn(rho)
-        loss.backward()
-        self.defender_optimizer.step()
+    def train_defender_step(self, time_horizon, dt, atk_static):
+        """ Training step for the defender. The attacker's passive. """
+        loss = self.defender_loss(time_horizon, dt, atk_static)
+
+        with phase(self.profiler, 'optimizer'):
+            self.defender_optimizer.zero_grad()
+        with phase(self.profiler, 'backward'):
+            # the loss of a player without actuators, such as the attacker
+            # of the cartpole, does not depend on its parameters
+            if loss.requires_grad:
+                loss.backward()
+        with phase(self.profiler, 'optimizer'):
+            self.defender_optimizer.step()
 
         # return float(loss.detach())
         return float(loss)
 
     def initialize_random_batch(self, batch_size=128):
-        return [next(self.model._param_generator) for _ in range(batch_size)]
+        """ Samples a batch of random initial states that are simulated
+            simultaneously
+        """
+        self.model.initialize_random_batch(batch_size)
 
-    def train(self, atk_steps, def_steps, time_horizon, dt, atk_static):
+    def initialize_random(self, batch_size=None):
+        """ Samples a single initial state or a batch of them """
+        if batch_size is None:
+            self.model.initialize_random()
+        else:
+            self.initialize_random_batch(batch_size)
+
+    def train(self, atk_steps, def_steps, time_horizon, dt, atk_static, batch_size=None):
         """ Trains both the attacker and the defender on the same
             initial senario (different for each)
         """
 
-        # random_batch = initialize_random_batch() 
-
-        self.model.initialize_random() # samples a random initial state
+        self.initialize_random(batch_size) # samples a random initial state
         for i in range(atk_steps):
             atk_loss = self.train_attacker_step(time_horizon, dt, atk_static)
             self.model.initialize_rewind() # restores the initial state
 
-        self.model.initialize_random() # samples a random initial state
+        self.initialize_random(batch_size) # samples a random initial state
         for i in range(def_steps):
             def_loss = self.train_defender_step(time_horizon, dt, atk_static)
             self.model.initialize_rewind() # restores the initial state
@@ -239,53 +372,205 @@ class Trainer:
 
 
     def run(self, n_steps, time_horizon=100, dt=0.05, *, atk_steps=1, def_steps=1, 
-            atk_static=False):
-        """ Trains the architecture and provides logging and visual feedback """
-        if self.logging:
-            hist_every = int(n_steps / 10)
-            hist_counter = 0
+            atk_static=False, batch_size=None, checkpointer=None, start_step=0):
+        """ Trains the architecture and provides logging and visual feedback.
+            If batch_size is given, every step simulates that many scenarios
+            at once. The checkpointer, if any, periodically saves the state
+            of the training, which is resumed from start_step.
+        """
+        # the losses are written by a background thread, only a downsampled
+        # copy is kept in memory for the final plot
+        metrics = MetricsSink(self.logging_dir if self.logging else None, append=start_step > 0)
 
-            atk_loss_vals = torch.zeros(n_steps)
-            def_loss_vals = torch.zeros(n_steps)
+        for i in tqdm(range(start_step, n_steps), initial=start_step, total=n_steps):
+            atk_loss, def_loss = self.train(atk_steps, def_steps, time_horizon, dt, atk_static,
+                                            batch_size)
 
-        for i in tqdm(range(n_steps)):
-            atk_loss, def_loss = self.train(atk_steps, def_steps, time_horizon, dt, atk_static)
-            print(f"def_rob = {-def_loss:.4f}\tatk_rob = {atk_loss:.4f}")
+            metrics.scalar('attacker loss', atk_loss, i)
+            metrics.scalar('defender loss', def_loss, i)
 
-            if self.logging:
-                atk_loss_vals[i] = atk_loss
-                def_loss_vals[i] = def_loss
+            if self.profiler is not None:
+                self.profiler.step()
 
-                # self.log.add_scalar('attacker loss', atk_loss, i)
-                # self.log.add_scalar('defender loss', def_loss, i)
+            if checkpointer is not None:
+                checkpointer.maybe_save(self, i)
 
-                # if (i + 1) % hist_every == 0:
-                #     a = hist_counter * hist_every
-                #     b = (hist_counter + 1) * hist_every
-                #     hist_counter += 1
+        metrics.close()
 
-                #     self.log.add_histogram('attacker loss hist', atk_loss_vals[a:b], i)
-                #     self.log.add_histogram('defender loss hist', def_loss_vals[a:b], i)
+        if checkpointer is not None:
+            if n_steps > start_step:
+                checkpointer.save(self, n_steps - 1)
+            checkpointer.close()
 
         def plot_loss(atk_loss, def_loss, path):
             fig, ax = plt.subplots(1)
-            ax.plot(atk_loss, label="attacker loss")
-            ax.plot(def_loss, label="defender loss")
+            ax.plot(*atk_loss, label="attacker loss")
+            ax.plot(*def_loss, label="defender loss")
             ax.legend()
             os.makedirs(os.path.dirname(path+"/"), exist_ok=True)
             fig.savefig(path+"/loss.png")
 
+        if self.profiler is not None:
+            self.profiler.close()
+
         if self.logging:
-            # self.log.close()
-            plot_loss(atk_loss_vals.detach().cpu(), def_loss_vals.detach().cpu(), self.logging_dir)
+            plot_loss(metrics.history('attacker loss'), metrics.history('defender loss'),
+                      self.logging_dir)
+
+
+
+class ParallelTrainer(Trainer):
+    """ Distributes the training episodes over a pool of worker processes.
+        Each worker owns a copy of the world model, pulls the latest weights
+        from shared memory and sends back the gradients of its episodes,
+        which are averaged and applied by the learner (this process).
+    """
+
+    def __init__(self, model_factory, robustness_computer, \
+                attacker_nn, defender_nn, lr, logging_dir=None, rho_quantile=None, \
+                n_workers=2, seed=0, profiler=None, compiled=None):
+
+        super().__init__(model_factory(), robustness_computer, attacker_nn, defender_nn, \
+                         lr, logging_dir, rho_quantile, profiler)
+
+        # the optimizers update the parameters in place, so the workers
+        # always read the latest weights
+        self.attacker.share_memory()
+        self.defender.share_memory()
+
+        # forked workers inherit the model factory, no pickling required
+        context = mp.get_context('fork')
+        self._results = context.Queue()
+        self._tasks = []
+        self._workers = []
+
+        for rank in range(n_workers):
+            tasks = context.Queue()
+            worker = context.Process(target=_parallel_worker, daemon=True,
+                                     args=(rank, seed, model_factory, robustness_computer,
+                                           self.attacker, self.defender, rho_quantile,
+                                           compiled, tasks, self._results))
+            worker.start()
+            self._tasks.append(tasks)
+            self._workers.append(worker)
+
+    def parallel_step(self, player, new_scenario, time_horizon, dt, atk_static, batch_size):
+        """ Every worker simulates its own episodes, then the learner
+            applies the mean of their gradients
+        """
+        for tasks in self._tasks:
+            tasks.put((player, new_scenario, time_horizon, dt, atk_static, batch_size))
+
+        # the episodes are profiled as a whole, the phases run in the workers
+        with phase(self.profiler, 'workers'):
+            results = [self._results.get() for _ in self._workers]
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        if player == 'attacker':
+            nn_model, optimizer = self.attacker, self.attacker_optimizer
+        else:
+            nn_model, optimizer = self.defender, self.defender_optimizer
+
+        # no gradients are sent for a player without actuators
+        gradients = [g for _, g in results if g is not None]
+
+        if gradients:
+            with phase(self.profiler, 'optimizer'):
+                optimizer.zero_grad()
+                for param, *grads in zip(nn_model.parameters(), *gradients):
+                    param.grad = torch.stack(grads).mean(dim=0)
+                optimizer.step()
+
+        return sum(loss for loss, _ in results) / len(results)
+
+    def train(self, atk_steps, def_steps, time_horizon, dt, atk_static, batch_size=None):
+        """ Trains both the attacker and the defender, each worker keeps
+            the same initial scenario for all the steps of a player
+        """
+        for i in range(atk_steps):
+            atk_loss = self.parallel_step('attacker', i == 0, time_horizon, dt, \
+                                          atk_static, batch_size)
+
+        for i in range(def_steps):
+            def_loss = self.parallel_step('defender', i == 0, time_horizon, dt, \
+                                          atk_static, batch_size)
+
+        return (atk_loss, def_loss)
 
+    def close(self):
+        """ Stops the workers """
+        for tasks in self._tasks:
+            tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._tasks, self._workers = [], []
+
+
+def _parallel_worker(rank, seed, model_factory, robustness_computer, \
+                     attacker_nn, defender_nn, rho_quantile, compiled, tasks, results):
+    """ Main loop of the processes spawned by the ParallelTrainer """
+    torch.set_num_threads(1)
+    random.seed(seed + rank)
+    np.random.seed(seed + rank)
+    torch.manual_seed(seed + rank)
+
+    attacker = copy.deepcopy(attacker_nn)
+    defender = copy.deepcopy(defender_nn)
+    trainer = Trainer(model_factory(), robustness_computer, attacker, defender, \
+                      lr=0., rho_quantile=rho_quantile, compiled=compiled)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        player, new_scenario, time_horizon, dt, atk_static, batch_size = task
+
+        try:
+            # pulls the latest weights
+            attacker.load_state_dict(attacker_nn.state_dict())
+            defender.load_state_dict(defender_nn.state_dict())
+
+            if new_scenario:
+                trainer.initialize_random(batch_size)
+            else:
+                trainer.model.initialize_rewind()
+
+            if player == 'attacker':
+                nn_model = attacker
+                nn_model.zero_grad()
+                loss = trainer.attacker_loss(time_horizon, dt, atk_static)
+            else:
+                nn_model = defender
+                nn_model.zero_grad()
+                loss = trainer.defender_loss(time_horizon, dt, atk_static)
+
+            # the loss of a player without actuators has no gradients
+            grads = None
+            if loss.requires_grad:
+                loss.backward()
+
+                missing = [name for name, p in nn_model.named_parameters() if p.grad is None]
+                if missing:
+                    raise RuntimeError(f"no gradient of the {player} loss for {', '.join(missing)}")
+
+                grads = [p.grad.clone() for p in nn_model.parameters()]
+
+            results.put((float(loss), grads))
+
+        except Exception as e:
+            # the learner waits for a result from every worker, it raises the error
+            results.put(e)
 
 
 class Tester:
     """ The class contains the testing logic """
 
     def __init__(self, world_model, robustness_computer, \
-                attacker_nn, defender_nn, logging_dir=None):
+                attacker_nn, defender_nn, logging_dir=None, profiler=None, compiled=None):
 
         self.model = world_model
         self.robustness_computer = robustness_computer
@@ -293,47 +578,174 @@ class Tester:
         self.attacker = attacker_nn
         self.defender = defender_nn
 
+        self.profiler = profiler
+
+        # compiled timesteps of the batched tests, as in the Trainer
+        self.rollout = compiled_rollout(world_model, attacker_nn, defender_nn, compiled)
+
         self.logging = True if logging_dir else False
 
         # if self.logging:
         #     self.log = SummaryWriter(logging_dir)
 
-    def test(self, time_horizon, dt):
-        """ Tests a whole episode """
+    def monitor(self):
+        """ Online monitor of the robustness, None if the robustness
+            can only be computed at the end of the episode
+        """
+        try:
+            return self.robustness_computer.monitor()
+        except ValueError:
+            # e.g. nested temporal operators, the episode is simulated to the end
+            return None
+
+    def test(self, time_horizon, dt, early_exit=False):
+        """ Tests a whole episode.
+            With early_exit the simulation stops as soon as the sign of the
+            robustness is determined, the returned value is then a bound of
+            the robustness of the whole episode with the same sign.
+        """
         self.model.initialize_random()
+        self.model.traces.reserve(time_horizon)
+
+        monitor = self.monitor() if early_exit else None
 
         for t in range(time_horizon):
-            z = torch.rand(self.attacker.noise_size)
-            oa = torch.tensor(self.model.agent.status)
-            oe = torch.tensor(self.model.environment.status)
+            with phase(self.profiler, 'policy'):
+                z = torch.rand(self.attacker.noise_size)
+                oa = torch.tensor(self.model.agent.status)
+                oe = torch.tensor(self.model.environment.status)
 
-            with torch.no_grad():
-                atk_policy = self.attacker(torch.cat((z, oe)))
-                def_policy = self.defender(oa)
+                with torch.no_grad():
+                    atk_policy = self.attacker(torch.cat((z, oe)))
+                    def_policy = self.defender(oa)
+
+                atk_input = atk_policy(dt)
+                def_input = def_policy(dt)
 
-            atk_input = atk_policy(dt)
-            def_input = def_policy(dt)
+            with phase(self.profiler, 'physics'):
+                self.model.step(atk_input, def_input, dt)
 
-            self.model.step(atk_input, def_input, dt)
+            if monitor is not None:
+                with phase(self.profiler, 'robustness'):
+                    signals = self.robustness_computer.signals(self.model)
+                    monitor.push(**{k: v[..., -1] for k, v in signals.items()})
+                    decided = monitor.decided
+                if decided:
+                    break
 
-        rho = self.robustness_computer.compute(self.model)
+        with phase(self.profiler, 'robustness'):
+            rho = self.robustness_computer.compute(self.model)
 
         return rho
 
 
-    def run(self, times, time_horizon=1000, dt=0.05):
+    def run(self, times, time_horizon=1000, dt=0.05, early_exit=False):
         """ Test the architecture and provides logging """
         if self.logging:
             def_rho_vals = torch.zeros(times)
 
         for i in tqdm(range(times)):
-            def_rho = self.test(time_horizon, dt)
+            def_rho = self.test(time_horizon, dt, early_exit)
 
             if self.logging:
                 def_rho_vals[i] = def_rho
 
+            if self.profiler is not None:
+                self.profiler.step()
+
+        if self.profiler is not None:
+            self.profiler.close()
+
         # if self.logging:
         #     self.log.add_histogram('defender robustness', def_rho_vals, i)
         #     self.log.close()
 
         print(f"avg robustness = {def_rho_vals.mean().item():.2f}")
+
+    def test_batch(self, batch_size, time_horizon, dt, early_exit=False):
+        """ Tests batch_size episodes simulated simultaneously,
+            returns their (batch_size,) robustness
+        """
+        if not hasattr(self.model, 'initialize_random_batch'):
+            raise NotImplementedError(f"{type(self.model).__module__} does not support batched tests")
+        self.model.initialize_random_batch(batch_size)
+        self.model.traces.reserve(time_horizon)
+
+        monitor = self.monitor() if early_exit else None
+
+        with torch.no_grad():
+            for t in range(time_horizon):
+                if self.rollout is not None:
+                    with phase(self.profiler, 'rollout'):
+                        self.rollout.step(dt, dt, dt)
+                else:
+                    with phase(self.profiler, 'policy'):
+                        oa = observation(self.model.agent.status)
+                        oe = observation(self.model.environment.status)
+                        z = torch.rand(oe.shape[0], self.attacker.noise_size)
+
+                        atk_input = self.attacker(torch.cat((z, oe), dim=-1))(dt)
+                        def_input = self.defender(oa)(dt)
+
+                    with phase(self.profiler, 'physics'):
+                        self.model.step(atk_input, def_input, dt)
+
+                if monitor is not None:
+                    with phase(self.profiler, 'robustness'):
+                        signals = self.robustness_computer.signals(self.model)
+                        monitor.push(**{k: v[..., -1] for k, v in signals.items()})
+                        decided = monitor.decided
+                    if decided:
+                        break
+
+            with phase(self.profiler, 'robustness'):
+                rho = self.robustness_computer.compute(self.model)
+
+        return rho
+
+    def run_batch(self, times, time_horizon=1000, dt=0.05, batch_size=1024, early_exit=False,
+                  quantiles=(0.05, 0.5, 0.95), confidence=0.95):
+        """ Monte Carlo evaluation of the architecture on `times` episodes,
+            simulated batch_size at a time.
+            Returns the robustness of every episode together with its mean,
+            quantiles and the failure rate (negative robustness) with its
+            Wilson confidence interval.
+        """
+        rho = []
+        for start in tqdm(range(0, times, batch_size)):
+            rho.append(self.test_batch(min(batch_size, times - start), time_horizon, dt,
+                                       early_exit))
+
+            if self.profiler is not None:
+                self.profiler.step()
+
+        if self.profiler is not None:
+            self.profiler.close()
+
+        rho = torch.cat(rho)
+        failures = int((rho < 0).sum())
+
+        results = {
+            'rho': rho,
+            'mean': float(rho.mean()),
+            'std': float(rho.std()) if times > 1 else 0.,
+            'quantiles': {q: float(torch.quantile(rho, q)) for q in quantiles},
+            'failure_rate': failures / times,
+            'failure_interval': wilson_interval(failures, times, confidence),
+        }
+
+        low, high = results['failure_interval']
+        print(f"avg robustness = {results['mean']:.2f}\t"
+              f"failure rate = {results['failure_rate']:.4f} [{low:.4f}, {high:.4f}]")
+
+        return results
+
+
+def wilson_interval(successes, trials, confidence=0.95):
+    """ Wilson score confidence interval of a binomial proportion """
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    p = successes / trials
+
+    center = (p + z**2 / (2 * trials)) / (1 + z**2 / trials)
+    half_width = z / (1 + z**2 / trials) * np.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2))
+    return max(0., float(center - half_width)), min(1., float(center + half_width))
@@ -0,0 +1,95 @@
+import functools
+import torch
+
+KINDS = ('polynomial', 'chebyshev', 'piecewise', 'rbf')
+
+
+def _evaluate(kind, n_coeff, span, t):
+    """ Evaluates the basis functions in the time instants t (1D tensor)
+        and returns a (n_coeff, len(t)) matrix
+    """
+    if kind == 'polynomial':
+        powers = torch.arange(n_coeff, dtype=t.dtype)
+        return t.unsqueeze(0) ** powers.unsqueeze(1)
+
+    # the other bases are defined on the time interval [0, span]
+    s = torch.clamp(t / span, 0., 1.)
+
+    if kind == 'chebyshev':
+        x = 2 * s - 1
+        rows = [torch.ones_like(x), x]
+        for i in range(2, n_coeff):
+            rows.append(2 * x * rows[-1] - rows[-2])
+        return torch.stack(rows[:n_coeff])
+
+    elif kind == 'piecewise':
+        interval = torch.clamp((s * n_coeff).long(), max=n_coeff - 1)
+        return (interval.unsqueeze(0) == torch.arange(n_coeff).unsqueeze(1)).to(t.dtype)
+
+    elif kind == 'rbf':
+        centers = torch.linspace(0., 1., n_coeff, dtype=t.dtype)
+        width = 1. / max(n_coeff - 1, 1)
+        return torch.exp(-0.5 * ((s.unsqueeze(0) - centers.unsqueeze(1)) / width) ** 2)
+
+    raise NotImplementedError(kind)
+
+
+@functools.lru_cache(maxsize=4096)
+def _column(kind, n_coeff, span, t, dtype):
+    return _evaluate(kind, n_coeff, span, torch.tensor([t], dtype=dtype))
+
+
+@functools.lru_cache(maxsize=64)
+def _matrix(kind, n_coeff, span, dt, horizon, dtype):
+    t = torch.arange(horizon, dtype=dtype) * dt
+    return _evaluate(kind, n_coeff, span, t)
+
+
+class PolicyBasis:
+    """ Set of functions of time on which the policies are expanded.
+        The polynomial basis is evaluated on the raw time, the other ones
+        are defined on the interval [0, span], usually the horizon of the
+        episodes: they are constant after it, so the span is required.
+        Evaluations are cached, so the same basis is never rebuilt twice:
+        the returned tensors are shared and must not be modified.
+    """
+
+    def __init__(self, kind='polynomial', n_coeff=1, span=None):
+        if kind not in KINDS:
+            raise ValueError(f"unknown basis '{kind}', expected one of {KINDS}")
+        if span is None and kind != 'polynomial':
+            raise ValueError(f"the {kind} basis requires its span, e.g. the horizon of the episodes")
+
+        self.kind = kind
+        self.n_coeff = n_coeff
+        self.span = None if span is None else float(span)
+
+    def __call__(self, t):
+        """ Basis in the time instant t as a (n_coeff, 1) matrix,
+            or in every instant of a 1D tensor as a (n_coeff, len(t)) one
+        """
+        if isinstance(t, torch.Tensor) and t.dim() > 0:
+            return _evaluate(self.kind, self.n_coeff, self.span, t)
+        return _column(self.kind, self.n_coeff, self.span, float(t), torch.get_default_dtype())
+
+    def matrix(self, dt, horizon):
+        """ Basis in the instants 0, dt, ..., (horizon - 1) * dt
+            as a (n_coeff, horizon) matrix
+        """
+        return _matrix(self.kind, self.n_coeff, self.span, float(dt), int(horizon),
+                       torch.get_default_dtype())
+
+    def __repr__(self):
+        return f"PolicyBasis(kind={self.kind!r}, n_coeff={self.n_coeff}, span={self.span})"
+
+
+def make_basis(spec, n_coeff, horizon=None):
+    """ Builds the basis from the specification found in the settings,
+        either the name of the basis or a dict with its parameters.
+        The span defaults to the horizon of the episodes
+    """
+    if isinstance(spec, PolicyBasis):
+        return spec
+    if isinstance(spec, str):
+        spec = {'kind': spec}
+    return PolicyBasis(n_coeff=n_coeff, **dict({'span': horizon}, **spec))
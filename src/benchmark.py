@@ -0,0 +1,293 @@
+""" Performance benchmarks of the hot paths of the architecture:
+    simulation steps, policy inference, robustness computation,
+    recording of the traces, whole training iterations and eager
+    against compiled rollouts.
+
+    The results are saved as JSON, a previous run can be given as
+    baseline to report the relative change of each measure.
+"""
+import sys
+import json
+import time
+import platform
+import importlib
+import statistics
+from argparse import ArgumentParser
+
+import torch
+import numpy as np
+
+import architecture
+from misc import ParametersHyperparallelepiped
+from traces import TraceBuffer
+from diffquantitative import DiffQuantitativeSemantic
+
+# model_cruisecontrol cannot be built from its settings
+SETUPS = ['cartpole', 'cartpole_target', 'platooning', 'platooning_energy']
+GROUPS = ['model', 'policy', 'robustness', 'traces', 'train', 'rollout']
+# the world models that expose their state to the compiled rollouts
+ROLLOUT_SETUPS = ['cartpole', 'platooning']
+ROLLOUT_METHODS = [None, 'trace']
+
+BATCH_SIZES = [1, 128]
+TRACE_LENGTHS = [100, 1000, 10000]
+FORMULAS = ['G(x >= -1 & x <= 1)', 'G(F[0,20](x >= 0))']
+# the list of steps stacked when read is how the models recorded the signals
+TRACE_STORAGES = ['buffer', 'list']
+
+
+def build(name, architecture_name="default"):
+    """ Builds the model, the robustness computer and the networks of a setup
+        as done by the training scripts
+    """
+    model_module = importlib.import_module('model_' + name)
+    settings = importlib.import_module('settings_' + name)
+
+    *ranges, atk_arch, def_arch, train_par, test_par, formula = \
+            settings.get_settings(architecture_name, mode="train")
+
+    pg = ParametersHyperparallelepiped(*ranges)
+    model = model_module.Model(pg.sample(sigma=0.05), integrator=train_par['integrator'])
+    robustness_computer = model_module.RobustnessComputer(formula)
+
+    attacker = architecture.Attacker(model, *atk_arch.values(), horizon=train_par["horizon"])
+    defender = architecture.Defender(model, *def_arch.values(), horizon=train_par["horizon"])
+
+    return model, robustness_computer, attacker, defender, train_par
+
+
+def measure(fn, repeat):
+    """ Median time of a single operation, fn runs a number of
+        operations and returns how many
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n = fn()
+        times.append((time.perf_counter() - start) / n)
+    return statistics.median(times)
+
+
+def result(value, unit, higher_is_better=True):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def bench_model(repeat, steps=200):
+    results = {}
+    for name in SETUPS:
+        model, robustness_computer, attacker, defender, train_par = build(name)
+
+        for batch_size in BATCH_SIZES:
+            model.initialize_random_batch(batch_size)
+            trainer = architecture.Trainer(model, robustness_computer, attacker, defender, lr=0.)
+            z, oa, oe = trainer.observe()
+            with torch.no_grad():
+                atk_input = attacker(torch.cat((z, oe), dim=-1))(0.)
+                def_input = defender(oa)(0.)
+
+            def run():
+                model.initialize_rewind()
+                model.traces.reserve(steps)
+                for _ in range(steps):
+                    model.step(atk_input, def_input, train_par['dt'])
+                return steps
+
+            seconds = measure(run, repeat)
+            results[f'model_step/{name}/batch={batch_size}'] = \
+                    result(batch_size / seconds, 'scenario steps/s')
+    return results
+
+
+def bench_policy(repeat, calls=200):
+    results = {}
+    for name in SETUPS:
+        model, robustness_computer, attacker, defender, train_par = build(name)
+
+        for batch_size in BATCH_SIZES:
+            model.initialize_random_batch(batch_size)
+            trainer = architecture.Trainer(model, robustness_computer, attacker, defender, lr=0.)
+            z, oa, oe = trainer.observe()
+            atk_obs = torch.cat((z, oe), dim=-1)
+
+            for player, nn_model, obs in [('attacker', attacker, atk_obs),
+                                          ('defender', defender, oa)]:
+                def run():
+                    for i in range(calls):
+                        nn_model(obs)(i * train_par['dt'])
+                    return calls
+
+                seconds = measure(run, repeat)
+                results[f'policy/{name}/{player}/batch={batch_size}'] = \
+                        result(seconds * 1e6, 'us/call', higher_is_better=False)
+    return results
+
+
+def bench_robustness(repeat, batch_size=128):
+    results = {}
+    for formula in FORMULAS:
+        dqs = DiffQuantitativeSemantic(formula)
+
+        for length in TRACE_LENGTHS:
+            x = torch.randn(batch_size, length)
+            calls = max(1, 100000 // length)
+
+            def run():
+                for _ in range(calls):
+                    dqs.compute(x=x)
+                return calls
+
+            seconds = measure(run, repeat)
+            results[f'robustness/{formula}/length={length}'] = \
+                    result(batch_size * length / seconds, 'samples/s')
+    return results
+
+
+def bench_traces(repeat, batch_size=128):
+    results = {}
+    for grad in [False, True]:
+        for length in TRACE_LENGTHS:
+            x = torch.randn(batch_size, requires_grad=grad)
+
+            for storage in TRACE_STORAGES:
+                def run():
+                    # an episode is recorded and read once, as by the robustness
+                    # computers, gradients flow back through the whole trace
+                    with torch.set_grad_enabled(grad):
+                        if storage == 'buffer':
+                            traces = TraceBuffer('x')
+                            traces.reserve(length)
+                            for t in range(length):
+                                traces.append(x=x * t)
+                            signal = traces['x']
+                        else:
+                            steps = []
+                            for t in range(length):
+                                steps.append(x * t)
+                            signal = torch.stack(steps, dim=-1)
+
+                        if grad:
+                            signal.sum().backward()
+                    return length
+
+                seconds = measure(run, repeat)
+                mode = 'grad' if grad else 'no_grad'
+                results[f'traces/{storage}/{mode}/length={length}'] = \
+                        result(batch_size / seconds, 'scenario steps/s')
+    return results
+
+
+def bench_train(repeat):
+    results = {}
+    for name in SETUPS:
+        model, robustness_computer, attacker, defender, train_par = build(name)
+        trainer = architecture.Trainer(model, robustness_computer, attacker, defender,
+                                       train_par['lr'])
+        horizon = int(train_par['horizon'] / train_par['dt'])
+
+        def run():
+            trainer.train(train_par['atk_steps'], train_par['def_steps'], horizon,
+                          train_par['dt'], False, train_par.get('batch_size'))
+            return 1
+
+        seconds = measure(run, repeat)
+        results[f'train/{name}'] = result(1 / seconds, 'iterations/s')
+    return results
+
+
+def bench_rollout(repeat, steps=200):
+    results = {}
+    for name in ROLLOUT_SETUPS:
+        model, robustness_computer, attacker, defender, train_par = build(name)
+
+        for batch_size in BATCH_SIZES:
+            for method in ROLLOUT_METHODS:
+                tester = architecture.Tester(model, robustness_computer, attacker, defender,
+                                             compiled=method)
+
+                def run():
+                    tester.test_batch(batch_size, steps, train_par['dt'])
+                    return steps
+
+                seconds = measure(run, repeat)
+                results[f'rollout/{name}/{method or "eager"}/batch={batch_size}'] = \
+                        result(batch_size / seconds, 'scenario steps/s')
+    return results
+
+
+def run_benchmarks(groups=GROUPS, repeat=5, seed=0):
+    """ Runs the benchmarks of the given groups, returns the results keyed by name """
+    benchmarks = {'model': bench_model, 'policy': bench_policy,
+                  'robustness': bench_robustness, 'traces': bench_traces,
+                  'train': bench_train,
+                  'rollout': bench_rollout}
+
+    results = {}
+    for group in groups:
+        torch.manual_seed(seed)
+        np.random.seed(seed)
+        results.update(benchmarks[group](repeat))
+    return results
+
+
+def compare(results, baseline, tolerance=0.1):
+    """ Relative change of each measure with respect to the baseline,
+        positive when it improved, and the names of the ones that got
+        worse by more than the tolerance
+    """
+    changes, regressions = {}, []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        previous = baseline[name]
+
+        ratio = current['value'] / previous['value']
+        change = ratio - 1 if current['higher_is_better'] else 1 / ratio - 1
+        changes[name] = change
+
+        if change < -tolerance:
+            regressions.append(name)
+
+    return changes, regressions
+
+
+def metadata():
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'threads': torch.get_num_threads()}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("--groups", type=str, default=','.join(GROUPS),
+                        help="comma separated groups of benchmarks among " + ', '.join(GROUPS))
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of each measure")
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    parser.add_argument("--output", type=str, default="benchmark.json", help="where to save the results")
+    parser.add_argument("--baseline", type=str, default=None, help="results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative slowdown reported as regression")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+
+    results = run_benchmarks(args.groups.split(','), args.repeat)
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+
+    changes, regressions = {}, []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        changes, regressions = compare(results, baseline, args.tolerance)
+
+    for name, measure_ in results.items():
+        line = f"{name:<60}{measure_['value']:14.2f} {measure_['unit']}"
+        if name in changes:
+            line += f"\t{100 * changes[name]:+6.1f}%" + ("  REGRESSION" if name in regressions else "")
+        print(line)
+
+    sys.exit(1 if regressions else 0)
@@ -5,6 +5,11 @@ Created on Thu Oct  1 17:57:18 2020
 @author: Enrico Regolin
 """
 
+import os
+import mmap
+import hashlib
+import multiprocessing as mp
+
 import numpy as np
 from scipy.integrate import odeint
 import control
@@ -88,11 +93,13 @@ class InvertedPendulum_LQR():
 
         
     ############################################################
-    def reset_store(self, state):
-        
-        self.solution = np.array(state)[np.newaxis,:]
-        self.target_pos = np.zeros((1,))
-        self.ctrl_inputs = np.zeros((1,3))
+    def reset_store(self, state, steps = 1):
+        # results of the whole timeline, preallocated
+        state = np.array(state)
+        self.solution = np.zeros((steps,) + state.shape)
+        self.solution[0] = state
+        self.target_pos = np.zeros((steps,))
+        self.ctrl_inputs = np.zeros((steps,) + state.shape[:-1] + (3,))
 
         
     ############################################################
@@ -111,10 +118,10 @@ class InvertedPendulum_LQR():
         ctrl = self.u_LQR_ctrl
        
         if self.SMC_control:
-            ctrl += self.u_SMC
+            ctrl = ctrl + self.u_SMC
             
         if self.correct_x:
-            ctrl += self.u_Kp_correction
+            ctrl = ctrl + self.u_Kp_correction
         
         if self.input_dynamics:
             ctrl_out = self.force_dynamics.applyFilter(ctrl)
@@ -122,9 +129,9 @@ class InvertedPendulum_LQR():
             ctrl_out = ctrl
         
         if split_components:
-            return np.array([self.u_LQR_ctrl, self.u_Kp_correction, self.u_SMC])[np.newaxis,:]
+            return np.stack(np.broadcast_arrays(self.u_LQR_ctrl, self.u_Kp_correction, self.u_SMC), axis = -1)
         else:
-            return np.array([np.clip(ctrl_out,-self.force_max ,self.force_max)])
+            return np.clip(ctrl_out,-self.force_max ,self.force_max)
 
     ############################################################
     def computeControlSignals(self, state, Q, R, x_target):
@@ -133,27 +140,16 @@ class InvertedPendulum_LQR():
         self.Kp_x_law(state, x0 = x_target)
 
     ############################################################
-    def get_friction(self, state):
+    # friction at the given cart positions (a value or an array)
+    def get_friction(self, x):
         intervals = [[-3.5,-2],[1,2.5]]
+        x = np.asarray(x)
         if self.change_friction:
-            if len(state) == 4:
-                if intervals[0][0] < state[0] < intervals[0][1] or intervals[1][0] < state[0] < intervals[1][1]:
-                    friction = self.friction_max
-                else:
-                    friction = self.friction_min
-                
-                return friction
-            else:
-                friction_array = self.friction_min*np.ones(len(state))
-                friction_array[ np.bitwise_or(np.bitwise_and(state>intervals[0][0] ,state<intervals[0][1]),\
-                                              np.bitwise_and(state>intervals[1][0] , state<intervals[1][1]) )  ] \
-                                            = self.friction_max
-                return friction_array
+            high_friction = np.bitwise_or(np.bitwise_and(x>intervals[0][0] ,x<intervals[0][1]),\
+                                          np.bitwise_and(x>intervals[1][0] , x<intervals[1][1]) )
+            return np.where(high_friction, self.friction_max, self.friction_min)
         else:
-            if len(state) == 4:
-                return self.friction_min
-            else:
-                return self.friction_min*np.ones(len(state))
+            return self.friction_min*np.ones(x.shape)
         
     ############################################################
     def derivativesGin(self, state,  ctrl = True):
@@ -173,21 +169,28 @@ class InvertedPendulum_LQR():
         return [ state[1], ddot_x , state[3], ddot_theta ]
         
     ############################################################
+    # state is a (4,) array or a (N,4) array of N states
     def derivatives(self, state,  ctrl = True):
+        x, dot_x, theta, dot_theta = state[...,0], state[...,1], state[...,2], state[...,3]
 
-        friction = self.get_friction(state)
+        friction = self.get_friction(x)
         
         ctrl_input = self.get_ctrl_signal()
         
-        x_ddot = ctrl_input - friction*state[1]  + self.m*self.L*state[3]**2* np.sin(state[2]) - self.m*self.g*np.cos(state[2]) *  np.sin(state[2])
-        x_ddot = x_ddot / ( self.M+self.m-self.m* np.cos(state[2])**2 )
+        x_ddot = ctrl_input - friction*dot_x  + self.m*self.L*dot_theta**2* np.sin(theta) - self.m*self.g*np.cos(theta) *  np.sin(theta)
+        x_ddot = x_ddot / ( self.M+self.m-self.m* np.cos(theta)**2 )
     
-        theta_ddot = (self.g*np.sin( state[2] ) -  np.cos( state[2] )*x_ddot ) / self.L 
+        theta_ddot = (self.g*np.sin( theta ) -  np.cos( theta )*x_ddot ) / self.L 
     
-        damping_x =  - self.d1*state[1]
-        damping_theta =  - self.d2*state[3]
+        damping_x =  - self.d1*dot_x
+        damping_theta =  - self.d2*dot_theta
     
-        return [ state[1], x_ddot + damping_x, state[3], theta_ddot + damping_theta ]
+        f_state = np.empty(state.shape)
+        f_state[...,0] = dot_x
+        f_state[...,1] = x_ddot + damping_x
+        f_state[...,2] = dot_theta
+        f_state[...,3] = theta_ddot + damping_theta
+        return f_state
 
 
     ############################################################ 
@@ -204,21 +207,67 @@ class InvertedPendulum_LQR():
         return f_x, g_x
     
     ############################################################ 
-    def robustness_map(self, size = [150,100]):
+    # parameters the maps depend on, used as cache key
+    def map_key(self, size):
+        return (self.g, self.L, self.m, self.M, self.alpha_sliding, self.force_max,
+                self.theta_max, self.dot_theta_max, tuple(size))
+
+    ############################################################ 
+    # robustness, f_x and g_x on a grid of thetas and dot_thetas
+    def robustness_grid(self, theta_axis, dot_theta_axis):
+        theta, dot_theta = np.meshgrid(theta_axis, dot_theta_axis, indexing = 'ij')
+        f_x, g_x = self.f_g_SMC(theta, dot_theta)
+        robustness_map = abs(f_x  + self.alpha_sliding*dot_theta )/abs(g_x)
+        return robustness_map, f_x, g_x
+
+    ############################################################ 
+    def robustness_map(self, size = [150,100], n_workers = 0, cache_dir = None):
     # used to plot phase plan  
-        robustness_map = np.zeros(size)
-        f_x_map = np.zeros(size)
-        g_x_map = np.zeros(size)
-        
+    # n_workers > 0 splits the rows of the map among processes,
+    # the maps are cached in memory (and in cache_dir) by controller parameters
         theta_axis = np.arange(-self.theta_max, self.theta_max, 2*self.theta_max/(size[0]))
         dot_theta_axis = np.arange(-self.dot_theta_max, self.dot_theta_max, 2*self.dot_theta_max/(size[1]))
-        for i,theta in enumerate(theta_axis ):
-            for j,dot_theta in enumerate(dot_theta_axis ):
-                
-                f_x, g_x = self.f_g_SMC(theta, dot_theta)
-                robustness_map[i,j] = abs(f_x  + self.alpha_sliding*dot_theta )/abs(g_x)
-                f_x_map[i,j] = f_x  #+ alpha*dot_theta
-                g_x_map[i,j] = g_x
+
+        key = self.map_key(size)
+        cache_file = None
+        if cache_dir is not None:
+            name = hashlib.sha1(repr(key).encode()).hexdigest()
+            cache_file = os.path.join(cache_dir, 'robustness_map_' + name + '.npz')
+
+        if key in _maps_cache:
+            maps = _maps_cache[key]
+        elif cache_file is not None and os.path.exists(cache_file):
+            with np.load(cache_file) as data:
+                maps = data['robustness_map'], data['f_x_map'], data['g_x_map']
+        else:
+            if n_workers > 0:
+                # the workers write their rows in shared memory, inherited with fork
+                shape = (len(theta_axis), len(dot_theta_axis))
+                maps = tuple(np.frombuffer(mmap.mmap(-1, 8*shape[0]*shape[1])).reshape(shape) for _ in range(3))
+                bounds = np.linspace(0, shape[0], n_workers*4 + 1).astype(int)
+                tiles = [(self, start, stop, theta_axis, dot_theta_axis) \
+                         for start, stop in zip(bounds[:-1], bounds[1:])]
+                _tile_maps[:] = maps
+                try:
+                    with mp.get_context('fork').Pool(n_workers) as pool:
+                        pool.map(_robustness_tile, tiles)
+                finally:
+                    _tile_maps.clear()
+            else:
+                maps = self.robustness_grid(theta_axis, dot_theta_axis)
+
+            if cache_file is not None:
+                os.makedirs(cache_dir, exist_ok = True)
+                np.savez(cache_file, robustness_map = maps[0], f_x_map = maps[1], g_x_map = maps[2])
+
+        # the cached maps are shared by every later call, they are read-only
+        for m in maps:
+            m.setflags(write = False)
+        _maps_cache.pop(key, None)
+        _maps_cache[key] = maps
+        while len(_maps_cache) > MAPS_CACHE_SIZE:
+            _maps_cache.pop(next(iter(_maps_cache)))
+        robustness_map, f_x_map, g_x_map = maps
                 
         return theta_axis,dot_theta_axis, np.flipud(robustness_map.T), f_x_map, g_x_map
     #np.flipud(robustness_map), np.flipud(f_x_map), np.flipud(g_x_map) 
@@ -233,7 +282,7 @@ class InvertedPendulum_LQR():
   
     ############################################################
     def is_unstable(self):
-        return self.unstable_system
+        return np.all(self.unstable_system)
 
     ############################################################
     # used to saturate any signal
@@ -248,14 +297,11 @@ class InvertedPendulum_LQR():
             zero_action_bound = 0.1
             saturation_init = 1.5
             
-            sigma = state[2]*self.alpha_sliding + state[3]
+            sigma = state[...,2]*self.alpha_sliding + state[...,3]
             
-            control_action = 0
-            if abs(sigma) > zero_action_bound:
-                if abs(sigma)> saturation_init:
-                    control_action = np.sign(sigma);
-                else:
-                    control_action = np.sign(sigma)*(abs(sigma)-zero_action_bound)/(saturation_init-zero_action_bound);
+            control_action = np.where(abs(sigma)> saturation_init, np.sign(sigma), \
+                                      np.sign(sigma)*(abs(sigma)-zero_action_bound)/(saturation_init-zero_action_bound))
+            control_action = np.where(abs(sigma) > zero_action_bound, control_action, 0)
 
             
             self.u_SMC  = control_action *self.K_smc
@@ -267,15 +313,14 @@ class InvertedPendulum_LQR():
     def Kp_x_law(self, state, x0 = 0):  
     
         if self.correct_x:
-            err_x = x0 - state[0]
+            err_x = x0 - state[...,0]
                     #self.max_err = 2.5
             Kp = 10
             #err_x = np.clip(x0 - state[0], -self.max_err, self.max_err)  
             x_thd = .2
             Kp_min = 5
             
-            if abs(err_x) <x_thd:
-                Kp = Kp_min + (Kp-Kp_min)*abs(err_x)/x_thd
+            Kp = np.where(abs(err_x) <x_thd, Kp_min + (Kp-Kp_min)*abs(err_x)/x_thd, Kp)
             Kp *= self.Kp_multiplier
                         
             self.u_Kp_correction =  self.saturate(-Kp * err_x , self.ctrl_Kp_max)
@@ -294,52 +339,71 @@ class InvertedPendulum_LQR():
             self.compute_K(desired_eigs = E ) # Arbitarily set desired eigen values
         
         theta_max = 0.1
-        state[2] = np.clip(state[2],-theta_max, theta_max)
+        state[...,2] = np.clip(state[...,2],-theta_max, theta_max)
         
-        LQR_ctrl = -np.matmul( self.K , state - np.array([x0,0,0,0]) )[0,0]   
+        LQR_ctrl = -np.matmul( state - np.array([x0,0,0,0]), np.asarray(self.K)[0] )
         self.u_LQR_ctrl =  self.saturate(LQR_ctrl, self.ctrl_LQR_max)
         
-        if  abs(state[2])>np.pi/2  :
-            self.unstable_system = True
+        if  np.any(abs(state[...,2])>np.pi/2)  :
+            self.unstable_system = np.logical_or(self.unstable_system, abs(state[...,2])>np.pi/2)
             
         return self.u_LQR_ctrl
 
     ############################################################ 
     # run simulation
-    def run_simulation(self,state, timeline, model_Gin = False):
+    # state is a (4,) array or a (N,4) array of N initial states simulated at once,
+    # integrator is 'odeint' (adaptive) or 'rk4' (one fixed step per interval)
+    def run_simulation(self,state, timeline, model_Gin = False, integrator = 'odeint'):
     
-        self.reset_store(state)
-        
-        for i,t in enumerate(tqdm(time_line[:-1])):
+        state = np.array(state, dtype = np.float64)
+        self.time_line = timeline
+        self.reset_store(state, len(timeline))
+        self.unstable_system = np.zeros(state.shape[:-1], dtype = bool)
+
+        # the LQR law clips the angle of the state it is given, which is the
+        # state of the integrator, as it has always been with odeint
+        def ode_fun(state, x_target):
+            self.computeControlSignals(state, self.Q, self.R, x_target = x_target)
+            return self.derivatives(state)
+
+        for i,t in enumerate(tqdm(timeline[:-1])):
             
             x_target = target_generator(t)
-            
-            if model_Gin:
-                def ode_fun( state, dt, x_target):
-                    self.computeControlSignals(state, self.Q, self.R, x_target = x_target)
-                    f_state = np.array(self.derivatives(state), dtype = np.float32)
-                    return f_state
-            else:
-                def ode_fun( state, dt, x_target):
-                    self.computeControlSignals(state, self.Q, self.R, x_target = x_target)
-                    f_state = np.array(self.derivatives(state), dtype = np.float32)
-                    return f_state
-           
-            delta_t = [t, time_line[i+1]]
+            dt = timeline[i+1] - t
+
+            # the rows of a batch that diverged are frozen, only the others
+            # are integrated and flagged by the control laws
+            rows = np.flatnonzero(~self.unstable_system) if state.ndim > 1 else Ellipsis
+            unstable_system, self.unstable_system = self.unstable_system, self.unstable_system[rows]
+            active = state[rows]
             
             #integrate
-            new_state = odeint(ode_fun, state, delta_t, args = (x_target,) )
+            if integrator == 'rk4':
+                k1 = ode_fun(active, x_target)
+                k2 = ode_fun(active + dt/2*k1, x_target)
+                k3 = ode_fun(active + dt/2*k2, x_target)
+                k4 = ode_fun(active + dt*k3, x_target)
+                active = active + dt/6*(k1 + 2*k2 + 2*k3 + k4)
+            else:
+                # odeint works on flat vectors, the states are integrated together
+                flat_fun = lambda y, t, x_target: ode_fun(y.reshape(active.shape), x_target).ravel()
+                active = odeint(flat_fun, active.ravel(), [t, timeline[i+1]], args = (x_target,) )[-1].reshape(active.shape)
+
+            state[rows] = active
+            unstable_system[rows] = self.unstable_system
+            self.unstable_system = unstable_system
            
-            # store data for graphs    
-            self.solution = np.append(self.solution, new_state[-1:,:], axis=0)
-            self.target_pos = np.append(self.target_pos,np.array([x_target]) , axis=0)
-            self.ctrl_inputs = np.append(self.ctrl_inputs, self.get_ctrl_signal(True) ,axis = 0)
-            
-            #update state
-            state = np.array(new_state)[-1,:]
+            # store data for graphs, the frozen rows keep their last inputs
+            self.solution[i+1] = state
+            self.target_pos[i+1] = x_target
+            self.ctrl_inputs[i+1] = self.ctrl_inputs[i]
+            self.ctrl_inputs[i+1][rows] = self.get_ctrl_signal(True)
                 
             if self.is_unstable():
                 print('unstable system')
+                self.solution = self.solution[:i+2]
+                self.target_pos = self.target_pos[:i+2]
+                self.ctrl_inputs = self.ctrl_inputs[:i+2]
                 break
 
     ############################################################ 
@@ -367,29 +431,29 @@ class InvertedPendulum_LQR():
         sim_end = len(self.target_pos)
         
         # fig 1
-        ax1.plot(time_line[:sim_end], self.target_pos)
-        ax1.plot(time_line[:sim_end], self.solution[:,0])
+        ax1.plot(self.time_line[:sim_end], self.target_pos)
+        ax1.plot(self.time_line[:sim_end], self.solution[:,0])
         ax1.legend(('target','actual'))
         
         thd_err_1 = .9
         thd_err_2 = 1.4
-        ax1_a.plot(time_line[:sim_end], thd_err_1*np.ones(time_line[:sim_end].shape) ,'r--')
-        ax1_a.plot(time_line[:sim_end], -thd_err_1*np.ones(time_line[:sim_end].shape),'r--' )
-        ax1_a.plot(time_line[:sim_end], thd_err_2*np.ones(time_line[:sim_end].shape) ,'r')
-        ax1_a.plot(time_line[:sim_end], -thd_err_2*np.ones(time_line[:sim_end].shape),'r' )
-        ax1_a.plot(time_line[:sim_end], (self.solution[:,0]- self.target_pos) )
+        ax1_a.plot(self.time_line[:sim_end], thd_err_1*np.ones(self.time_line[:sim_end].shape) ,'r--')
+        ax1_a.plot(self.time_line[:sim_end], -thd_err_1*np.ones(self.time_line[:sim_end].shape),'r--' )
+        ax1_a.plot(self.time_line[:sim_end], thd_err_2*np.ones(self.time_line[:sim_end].shape) ,'r')
+        ax1_a.plot(self.time_line[:sim_end], -thd_err_2*np.ones(self.time_line[:sim_end].shape),'r' )
+        ax1_a.plot(self.time_line[:sim_end], (self.solution[:,0]- self.target_pos) )
         ax1_a.legend(['tracking error'])
         
-        ax2.plot(time_line[:sim_end], self.solution[:,2])
+        ax2.plot(self.time_line[:sim_end], self.solution[:,2])
         ax2.legend(['angle'])
         
         # fig 2
-        ax3.plot(time_line[:sim_end], self.ctrl_inputs[:,0])
-        ax3.plot(time_line[:sim_end], self.ctrl_inputs[:,1])
-        ax3.plot(time_line[:sim_end], self.ctrl_inputs[:,2])
+        ax3.plot(self.time_line[:sim_end], self.ctrl_inputs[:,0])
+        ax3.plot(self.time_line[:sim_end], self.ctrl_inputs[:,1])
+        ax3.plot(self.time_line[:sim_end], self.ctrl_inputs[:,2])
         ax3.legend(('LQR', 'Kp correction', 'SMC'))
         
-        ax4.plot(time_line[:sim_end], np.sum(self.ctrl_inputs,axis = 1))
+        ax4.plot(self.time_line[:sim_end], np.sum(self.ctrl_inputs,axis = 1))
         ax4.legend(['tot ctrl'])
         
         # fig 3
@@ -411,10 +475,10 @@ class InvertedPendulum_LQR():
         ax5.plot(theta_axis[idx_plot],-self.alpha_sliding*theta_axis[idx_plot],'k')
         
         #fig 4
-        ax6.plot(time_line[:sim_end], self.solution[:,1])
+        ax6.plot(self.time_line[:sim_end], self.solution[:,1])
         ax6.legend(['x dot'])
         
-        ax7.plot(time_line[:sim_end], self.solution[:,3])
+        ax7.plot(self.time_line[:sim_end], self.solution[:,3])
         ax7.legend(['theta dot'])
         
         
@@ -499,6 +563,22 @@ class InvertedPendulum_LQR():
 
 #%%
 
+# robustness maps already computed, keyed by InvertedPendulum_LQR.map_key,
+# only the most recently used ones are kept
+MAPS_CACHE_SIZE = 4
+_maps_cache = {}
+
+# shared output of the workers computing a map
+_tile_maps = []
+
+def _robustness_tile(args):
+    controller, start, stop, theta_axis, dot_theta_axis = args
+    for map_, tile in zip(_tile_maps, controller.robustness_grid(theta_axis[start:stop], dot_theta_axis)):
+        map_[start:stop] = tile
+
+
+#%%
+
 ############################################################ 
 class DiscreteLowPassFilter():
     def __init__(self, a = 0.9):
@@ -537,50 +617,52 @@ def target_generator(time):
     return x_target
 
 
-#%%
-# initialize system
+# the script runs only when executed, the controller can be imported
+if __name__ == '__main__':
+    #%%
+    # initialize system
     
-# Eigen Values set by LQR
-Q = np.diag( [1,.01,1,1] )
-R = np.diag( [1] )
-sys = InvertedPendulum_LQR(Q,R) # Q,R not used, default values instead
-sys.change_friction = False
-#sys.correct_x = False
-#sys.Kp_multiplier = 1.5 # to be used for LQR+Kp without SMC and change of friction
-sys.SMC_control = True
-sys.alpha_sliding = 3.5
-#sys.K_smc = 75
-
-# initial conditions
-# state = [x, dot_x, theta, dot_theta]
-state = np.array([ 0, 0, np.pi/10, 0], dtype = np.float32)
-
-# simulation time
-dt = 0.05
-Tmax = 100
-time_line = np.arange(0.0, Tmax, dt)
-
-#%%
-"""
-fig = plt.figure()
-ax = fig.add_subplot(111)
-theta_axis,dot_theta_axis,robustness_map, f_x_map, g_x_map = sys.robustness_map()
-mappable = ax.imshow(robustness_map, aspect = 'auto',extent=extents(theta_axis) + extents(dot_theta_axis), cmap=mpl.cm.jet, norm=mpl.colors.PowerNorm(.8,1,200))
-plt.colorbar(mappable=mappable, ax = ax)
-fontsize = 15
-idx_plot = np.where(np.abs(sys.alpha_sliding*theta_axis)<dot_theta_axis[-1])
-ax.plot(theta_axis[idx_plot],-sys.alpha_sliding*theta_axis[idx_plot],'r', linewidth=3)
-plt.title('Minimum required SMC gain')
-plt.xlabel(r'$\theta$', fontsize=fontsize)
-plt.ylabel(r'$\dot\theta$', fontsize=fontsize, rotation=0)
-"""
-#%%
-
-sys.run_simulation(state, time_line, model_Gin = True)
-sys.plot_graphs(save = True, no_norm = False)
-
-# generate animation
-if False:
-    mpl.use('TKAgg')
-    sys.generate_gif(dt, sample_step=5)
-    mpl.use(default_backend)
+    # Eigen Values set by LQR
+    Q = np.diag( [1,.01,1,1] )
+    R = np.diag( [1] )
+    sys = InvertedPendulum_LQR(Q,R) # Q,R not used, default values instead
+    sys.change_friction = False
+    #sys.correct_x = False
+    #sys.Kp_multiplier = 1.5 # to be used for LQR+Kp without SMC and change of friction
+    sys.SMC_control = True
+    sys.alpha_sliding = 3.5
+    #sys.K_smc = 75
+
+    # initial conditions
+    # state = [x, dot_x, theta, dot_theta]
+    state = np.array([ 0, 0, np.pi/10, 0], dtype = np.float32)
+
+    # simulation time
+    dt = 0.05
+    Tmax = 100
+    time_line = np.arange(0.0, Tmax, dt)
+
+    #%%
+    """
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    theta_axis,dot_theta_axis,robustness_map, f_x_map, g_x_map = sys.robustness_map()
+    mappable = ax.imshow(robustness_map, aspect = 'auto',extent=extents(theta_axis) + extents(dot_theta_axis), cmap=mpl.cm.jet, norm=mpl.colors.PowerNorm(.8,1,200))
+    plt.colorbar(mappable=mappable, ax = ax)
+    fontsize = 15
+    idx_plot = np.where(np.abs(sys.alpha_sliding*theta_axis)<dot_theta_axis[-1])
+    ax.plot(theta_axis[idx_plot],-sys.alpha_sliding*theta_axis[idx_plot],'r', linewidth=3)
+    plt.title('Minimum required SMC gain')
+    plt.xlabel(r'$\theta$', fontsize=fontsize)
+    plt.ylabel(r'$\dot\theta$', fontsize=fontsize, rotation=0)
+    """
+    #%%
+
+    sys.run_simulation(state, time_line, model_Gin = True)
+    sys.plot_graphs(save = True, no_norm = False)
+
+    # generate animation
+    if False:
+        mpl.use('TKAgg')
+        sys.generate_gif(dt, sample_step=5)
+        mpl.use(default_backend)
@@ -0,0 +1,115 @@
+import os
+import copy
+import time
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+
+_CLOSE = object()
+
+
+class Checkpointer:
+    """ Periodically saves the state of a Trainer: both networks, both
+        optimizers, the random number generators and the step counter.
+        The state is copied in the training thread and written to disk by
+        a background thread, through a temporary file that atomically
+        replaces the previous checkpoint.
+    """
+
+    def __init__(self, path, every_steps=None, every_seconds=None, filename='checkpoint.pt'):
+        self.path = os.path.join(path, filename)
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+
+        self._last_time = time.monotonic()
+        # a single pending snapshot, a new one waits for the previous write
+        self._queue = queue.Queue(maxsize=1)
+        self._error = None
+
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def due(self, step):
+        """ True if a checkpoint should be saved after the given step """
+        if self.every_steps and (step + 1) % self.every_steps == 0:
+            return True
+        if self.every_seconds and time.monotonic() - self._last_time >= self.every_seconds:
+            return True
+        return False
+
+    def maybe_save(self, trainer, step):
+        if self.due(step):
+            self.save(trainer, step)
+
+    def save(self, trainer, step):
+        """ Snapshots the trainer after the given step and queues the write """
+        if self._error is not None:
+            raise self._error
+
+        state = {
+            'step': step,
+            'attacker': _clone(trainer.attacker.state_dict()),
+            'defender': _clone(trainer.defender.state_dict()),
+            'attacker_optimizer': copy.deepcopy(trainer.attacker_optimizer.state_dict()),
+            'defender_optimizer': copy.deepcopy(trainer.defender_optimizer.state_dict()),
+            'rng': {
+                'torch': torch.get_rng_state(),
+                'numpy': np.random.get_state(),
+                'random': random.getstate(),
+            },
+        }
+
+        self._last_time = time.monotonic()
+        self._queue.put(state)
+
+    def load(self, trainer):
+        """ Restores the last checkpoint into the trainer and returns the
+            step to resume from, 0 if there is no checkpoint
+        """
+        if not os.path.exists(self.path):
+            return 0
+
+        state = torch.load(self.path, weights_only=False)
+
+        trainer.attacker.load_state_dict(state['attacker'])
+        trainer.defender.load_state_dict(state['defender'])
+        trainer.attacker_optimizer.load_state_dict(state['attacker_optimizer'])
+        trainer.defender_optimizer.load_state_dict(state['defender_optimizer'])
+
+        torch.set_rng_state(state['rng']['torch'])
+        np.random.set_state(state['rng']['numpy'])
+        random.setstate(state['rng']['random'])
+
+        return state['step'] + 1
+
+    def close(self):
+        """ Waits for the pending write and stops the background thread """
+        if self._thread is None:
+            return
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        self._thread = None
+
+        if self._error is not None:
+            raise self._error
+
+    def _write(self):
+        while True:
+            state = self._queue.get()
+            if state is _CLOSE:
+                break
+
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                torch.save(state, tmp_path)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                self._error = e
+
+
+def _clone(state_dict):
+    return {name: tensor.detach().clone() for name, tensor in state_dict.items()}
@@ -2,6 +2,8 @@ import lark
 import copy
 import torch
 
+INF = float('inf')
+
 class LogicParser:
     """ This class defines the grammar of the STL according to
         the EBNF syntax and builds the AST accordingly.
@@ -16,8 +18,9 @@ class LogicParser:
         | (prop _AND)+ prop     -> op_and
         | ltl_op "(" prop ")"   -> operator
 
-    ltl_op: letter
+    ltl_op: letter interval?
     letter: LTL_OPERATOR
+    interval: "[" INT "," INT "]"
 
     _NOT: "!"
     _AND: "&"
@@ -47,9 +50,50 @@ class LogicParser:
     def __str__(self):
         return self._tree.pretty()
 
+def _temporal_params(letter, interval=None):
+    """ Letter of a temporal operator and its (a, b) interval in samples,
+        None when the operator is unbounded
+    """
+    letter = str(letter.children[0])
+    if interval is None:
+        return letter, None
+
+    a, b = map(int, interval.children)
+    if a > b:
+        raise ValueError(f'empty interval [{a},{b}] in {letter} operator')
+    return letter, (a, b)
+
+
+def _sliding_window(f, a, b, cumulative, reduce, fill):
+    """ Reduction of f over the windows [t+a, t+b] of each instant t along
+        the last axis, samples beyond the end of the trace are ignored.
+        Van Herk/Gil-Werman algorithm: the trace is split in blocks as long
+        as the window, each window spans at most two blocks and is covered
+        by a suffix of the first one and a prefix of the second one.
+    """
+    length = f.shape[-1]
+    width = b - a + 1
+    shifted = f[..., a:]
+
+    n_blocks = -(-(length + width - 1) // width)
+    padding = torch.full(f.shape[:-1] + (n_blocks * width - shifted.shape[-1],),
+                         fill, dtype=f.dtype)
+    padded = torch.cat((shifted, padding), dim=-1)
+
+    blocks = padded.reshape(f.shape[:-1] + (n_blocks, width))
+    prefix = cumulative(blocks, dim=-1)[0].reshape(padded.shape)
+    suffix = cumulative(blocks.flip(-1), dim=-1)[0].flip(-1).reshape(padded.shape)
+
+    return reduce(suffix[..., :length], prefix[..., width - 1:width - 1 + length])
+
+
 class Functions:
     """ Encapsulate the set of functions allowed to be called
-        from the formula built starting from the AST
+        from the formula built starting from the AST.
+        Signals are indexed by time along the last axis, the temporal
+        operators return the robustness of the subformula in each instant
+        over the interval [t+a, t+b], or over the rest of the trace
+        when unbounded.
     """
 
     @staticmethod
@@ -65,12 +109,16 @@ class Functions:
         return torch.max(a, b)
 
     @staticmethod
-    def finally_(f):
-        return torch.max(f)
+    def finally_(f, interval=None):
+        if interval is None:
+            return torch.cummax(f.flip(-1), dim=-1)[0].flip(-1)
+        return _sliding_window(f, *interval, torch.cummax, torch.max, -INF)
 
     @staticmethod
-    def globally_(f):
-        return torch.min(f)
+    def globally_(f, interval=None):
+        if interval is None:
+            return torch.cummin(f.flip(-1), dim=-1)[0].flip(-1)
+        return _sliding_window(f, *interval, torch.cummin, torch.min, INF)
 
 
 @lark.v_args(inline=True)
@@ -79,6 +127,7 @@ class _CodeBuilder(lark.Transformer):
         Basically it rewrites a formula starting from the AST to have
         fine control on the operations that will be carried out the the
         specific semantic.
+        The code is only used as textual representation of the formula.
     """
 
     def atom(self, *args):
@@ -108,15 +157,14 @@ class _CodeBuilder(lark.Transformer):
         args = [preposition_a, preposition_b]
         return 'fn.or_(' + ', '.join(args) + ')'
 
-    def ltl_op(self, *parameters):
-        return list(map(lambda x: str(x.children[0]), parameters))
+    def ltl_op(self, letter, interval=None):
+        return _temporal_params(letter, interval)
 
     def operator(self, params, preposition):
-        if len(params) > 1:
-            raise NotImplementedError
-        else:
-            letter = params[0]
-            operator_args = [preposition]
+        letter, interval = params
+        operator_args = [preposition]
+        if interval is not None:
+            operator_args.append(str(interval))
 
         if letter == 'F':
             function = 'fn.finally_'
@@ -129,9 +177,63 @@ class _CodeBuilder(lark.Transformer):
         return str(preposition)
 
 
+@lark.v_args(inline=True)
+class _Compiler(lark.Transformer):
+    """ Traverses the AST and builds the formula as a tree of closures.
+        Every node is a function of the dict of signals, the names of
+        the signals read by the atoms are collected in `variables`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.variables = []
+
+    def _operand(self, token):
+        if token.type == 'VAR':
+            name = str(token)
+            if name not in self.variables:
+                self.variables.append(name)
+            return lambda signals: signals[name]
+        value = float(token)
+        return lambda signals: value
+
+    def atom(self, *args):
+        operand_a, operator, operand_b = args
+        a, b = self._operand(operand_a), self._operand(operand_b)
+
+        if operator == '>=':
+            return lambda signals: a(signals) - b(signals)
+        elif operator == '<=':
+            return lambda signals: b(signals) - a(signals)
+
+        raise NotImplementedError
+
+    def op_not(self, preposition):
+        return lambda signals: Functions.not_(preposition(signals))
+
+    def op_and(self, preposition_a, preposition_b):
+        return lambda signals: Functions.and_(preposition_a(signals), preposition_b(signals))
+
+    def op_or(self, preposition_a, preposition_b):
+        return lambda signals: Functions.or_(preposition_a(signals), preposition_b(signals))
+
+    def ltl_op(self, letter, interval=None):
+        return _temporal_params(letter, interval)
+
+    def operator(self, params, preposition):
+        letter, interval = params
+        function = Functions.finally_ if letter == 'F' else Functions.globally_
+        return lambda signals: function(preposition(signals), interval)
+
+    def start(self, preposition):
+        return preposition
+
+
 class DiffQuantitativeSemantic:
     """ This class is used as API to build an STL formula and apply
         it to arbitrary signals according to the quantitative semantics.
+        The formula is compiled once into a callable, `signals` lists
+        the names of the signals it expects.
     """
 
     def __init__(self, logic_formula):
@@ -141,21 +243,196 @@ class DiffQuantitativeSemantic:
         else:
             self.logic_parser = logic_formula
 
-        self._code = self._build()
+        self._function, self.signals = self._build()
+        self._code = _CodeBuilder().transform(self.logic_parser.parse_tree)
 
     def _build(self):
         """Compute the internal representation for the semantic"""
-        tree = self.logic_parser.parse_tree
-        code = _CodeBuilder().transform(tree)
-        return code
+        compiler = _Compiler()
+        function = compiler.transform(self.logic_parser.parse_tree)
+        return function, tuple(compiler.variables)
 
     def compute(self, **signals):
-        environment = {
-            'fn': Functions,
-        }
-        environment.update(signals)
+        """ Robustness of the formula in the first instant of the signals,
+            given as (..., time) tensors
+        """
+        return self._function(signals)[..., 0]
 
-        return eval(self._code, environment)
+    def compute_trace(self, **signals):
+        """ Robustness of the formula in every instant of the signals """
+        return self._function(signals)
 
     def __str__(self):
         return self._code
+
+
+class _Pointwise:
+    """ Subformula without temporal operators, its robustness at each
+        instant only depends on the current samples
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self._first = None
+
+    def push(self, samples):
+        value = self.fn(samples)
+        if self._first is None:
+            self._first = value
+        return value
+
+    def bounds(self):
+        # the robustness of the formula is the one in the first instant
+        if self._first is None:
+            return -INF, INF
+        return self._first, self._first
+
+
+class _Temporal:
+    """ Globally/finally operator over a pointwise subformula, keeps the
+        running minimum/maximum of the samples in its interval
+    """
+
+    def __init__(self, letter, child, interval=None):
+        self.letter = letter
+        self.child = child
+        self.interval = interval
+        self._extremum = None
+        self._time = 0
+
+    @property
+    def _closed(self):
+        return self.interval is not None and self._time > self.interval[1]
+
+    def push(self, samples):
+        time = self._time
+        self._time += 1
+        if self.interval is not None and not self.interval[0] <= time <= self.interval[1]:
+            return
+
+        value = self.child.fn(samples)
+        if self._extremum is None:
+            self._extremum = value
+        elif self.letter == 'G':
+            self._extremum = torch.min(self._extremum, value)
+        else:
+            self._extremum = torch.max(self._extremum, value)
+
+    def bounds(self):
+        if self._extremum is None:
+            return -INF, INF
+        if self._closed:
+            # all the samples of the interval have been seen
+            return self._extremum, self._extremum
+        if self.letter == 'G':
+            # later samples can only lower the minimum
+            return torch.full_like(self._extremum, -INF), self._extremum
+        return self._extremum, torch.full_like(self._extremum, INF)
+
+
+class _Boolean:
+    """ Boolean combination of subformulas, combines their bounds """
+
+    def __init__(self, operator, children):
+        self.operator = operator
+        self.children = children
+
+    def push(self, samples):
+        for child in self.children:
+            child.push(samples)
+
+    def bounds(self):
+        bounds = [child.bounds() for child in self.children]
+
+        if self.operator == 'not':
+            lower, upper = bounds[0]
+            return Functions.not_(upper), Functions.not_(lower)
+
+        fn = Functions.and_ if self.operator == 'and' else Functions.or_
+        (lower, upper), *others = bounds
+        for other_lower, other_upper in others:
+            lower = fn(torch.as_tensor(lower), torch.as_tensor(other_lower))
+            upper = fn(torch.as_tensor(upper), torch.as_tensor(other_upper))
+        return lower, upper
+
+
+@lark.v_args(inline=True)
+class _MonitorBuilder(lark.Transformer):
+    """ Traverses the AST and builds the tree of the online monitor """
+
+    def atom(self, *args):
+        return _Pointwise(_Compiler().atom(*args))
+
+    def op_not(self, preposition):
+        if isinstance(preposition, _Pointwise):
+            return _Pointwise(lambda samples: Functions.not_(preposition.fn(samples)))
+        return _Boolean('not', [preposition])
+
+    def _combine(self, operator, fn, preposition_a, preposition_b):
+        if isinstance(preposition_a, _Pointwise) and isinstance(preposition_b, _Pointwise):
+            return _Pointwise(lambda samples: fn(preposition_a.fn(samples),
+                                                 preposition_b.fn(samples)))
+        return _Boolean(operator, [preposition_a, preposition_b])
+
+    def op_and(self, preposition_a, preposition_b):
+        return self._combine('and', Functions.and_, preposition_a, preposition_b)
+
+    def op_or(self, preposition_a, preposition_b):
+        return self._combine('or', Functions.or_, preposition_a, preposition_b)
+
+    def ltl_op(self, letter, interval=None):
+        return _temporal_params(letter, interval)
+
+    def operator(self, params, preposition):
+        if not isinstance(preposition, _Pointwise):
+            raise ValueError("nested temporal operators are not supported by the online monitor")
+
+        letter, interval = params
+        return _Temporal(letter, preposition, interval)
+
+    def start(self, preposition):
+        return preposition
+
+
+class OnlineMonitor:
+    """ Incremental evaluation of an STL formula: the samples of the signals
+        are pushed one instant at a time and the robustness of the whole trace
+        is bounded by the samples seen so far.
+        Signals can be batched, in that case the bounds are computed per row.
+    """
+
+    def __init__(self, logic_formula):
+        if isinstance(logic_formula, str):
+            self.logic_parser = LogicParser(logic_formula)
+        else:
+            self.logic_parser = logic_formula
+
+        self.reset()
+
+    def reset(self):
+        """ Forgets the pushed samples """
+        try:
+            self._root = _MonitorBuilder().transform(self.logic_parser.parse_tree)
+        except lark.exceptions.VisitError as e:
+            # the errors of the builder are wrapped by lark
+            raise e.orig_exc from None
+        self.length = 0
+
+    def push(self, **samples):
+        """ Adds the samples of the signals for the next instant """
+        self._root.push(samples)
+        self.length += 1
+
+    @property
+    def bounds(self):
+        """ Lower and upper bound of the robustness of the complete trace """
+        return self._root.bounds()
+
+    @property
+    def decided(self):
+        """ True when the sign of the robustness can no longer change,
+            i.e. the formula is already satisfied or violated
+        """
+        lower, upper = self.bounds
+        decided = (torch.as_tensor(lower) > 0) | (torch.as_tensor(upper) < 0)
+        return bool(decided.all())
@@ -0,0 +1,60 @@
+""" Numerical integrators of the world models.
+
+    Each integrator advances a state tensor by dt given the vector field
+    f(state) -> derivative. The optional constrain(state) -> state, e.g. a
+    saturation of the velocities, is applied to the new state.
+    The states of second order systems are laid out as (positions, velocities)
+    along the last dimension, which semi_implicit relies on.
+"""
+import torch
+
+
+def _identity(state):
+    return state
+
+
+def euler(f, state, dt, constrain=_identity):
+    """ Explicit Euler step """
+    return constrain(state + dt * f(state))
+
+
+def semi_implicit(f, state, dt, constrain=_identity):
+    """ Semi-implicit (symplectic) Euler step: the velocities are updated
+        first, then the positions move with the new, constrained velocities
+    """
+    n = state.shape[-1] // 2
+    positions, velocities = state[..., :n], state[..., n:]
+
+    velocities = velocities + dt * f(state)[..., n:]
+    state = constrain(torch.cat((positions, velocities), dim=-1))
+
+    return constrain(torch.cat((positions + dt * state[..., n:], state[..., n:]), dim=-1))
+
+
+def rk4(f, state, dt, constrain=_identity):
+    """ Classic fourth order Runge-Kutta step """
+    k1 = f(state)
+    k2 = f(state + dt / 2 * k1)
+    k3 = f(state + dt / 2 * k2)
+    k4 = f(state + dt * k3)
+    return constrain(state + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4))
+
+
+def adaptive(f, state, dt, constrain=_identity, rtol=1e-6, atol=1e-8):
+    """ Adaptive Dormand-Prince step, through torchdiffeq """
+    # imported here, so that the other integrators do not need torchdiffeq
+    from torchdiffeq import odeint
+
+    t = torch.tensor([0., dt], dtype=state.dtype, device=state.device)
+    solution = odeint(lambda t, y: f(y), state, t, rtol=rtol, atol=atol, method='dopri5')
+    return constrain(solution[-1])
+
+
+INTEGRATORS = {'euler': euler, 'semi_implicit': semi_implicit, 'rk4': rk4, 'adaptive': adaptive}
+
+
+def get_integrator(name):
+    """ Integrator called name, as given in the settings """
+    if name not in INTEGRATORS:
+        raise ValueError(f"unknown integrator '{name}', choose among {', '.join(INTEGRATORS)}")
+    return INTEGRATORS[name]
@@ -0,0 +1,152 @@
+import os
+import csv
+import time
+import queue
+import threading
+
+import numpy as np
+from tqdm import tqdm
+
+_CLOSE = object()
+
+
+class Downsampler:
+    """ Keeps at most `max_points` samples of a series in constant memory:
+        when the buffer is full every other sample is discarded and only
+        one sample out of twice as many is kept from then on
+    """
+
+    def __init__(self, max_points=1000):
+        self.max_points = max_points
+        self.stride = 1
+        self._seen = 0
+        self.steps = []
+        self.values = []
+
+    def add(self, step, value):
+        if self._seen % self.stride == 0:
+            self.steps.append(step)
+            self.values.append(value)
+
+            if len(self.steps) == self.max_points:
+                self.steps = self.steps[::2]
+                self.values = self.values[::2]
+                self.stride *= 2
+
+        self._seen += 1
+
+
+class MetricsSink:
+    """ Collects the metrics of the training loop without blocking it.
+        The values are pushed to a bounded queue and a background thread
+        writes them to TensorBoard and to a CSV file in `logging_dir`,
+        prints the scalars of the last complete step at most every
+        `print_every` seconds and keeps a downsampled copy of each scalar
+        series for the final plots.
+        With append the CSV file of a previous run is extended.
+    """
+
+    def __init__(self, logging_dir=None, print_every=1., max_points=1000, queue_size=10000,
+                 append=False):
+        self.logging_dir = logging_dir
+        self.append = append
+        self.print_every = print_every
+        self.max_points = max_points
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._series = {}
+        # the scalars of a step are complete once the next step begins
+        self._step, self._values = None, {}
+        self._latest = None, {}
+        self._lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def scalar(self, tag, value, step):
+        """ Records a scalar, waits only if the queue is full """
+        self._queue.put(('scalar', tag, float(value), step))
+
+    def histogram(self, tag, values, step):
+        """ Records a set of values as a TensorBoard histogram """
+        self._queue.put(('histogram', tag, np.array(values), step))
+
+    def history(self, tag):
+        """ Downsampled steps and values of a scalar series """
+        with self._lock:
+            series = self._series.get(tag)
+            if series is None:
+                return [], []
+            return list(series.steps), list(series.values)
+
+    def close(self):
+        """ Writes the pending metrics and stops the background thread """
+        if self._thread is None:
+            return
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        self._thread = None
+
+    def _drain(self):
+        writer, csv_file, csv_writer = None, None, None
+
+        if self.logging_dir is not None:
+            # imported here, so that the sink can be used without tensorboard
+            from torch.utils.tensorboard import SummaryWriter
+
+            os.makedirs(self.logging_dir, exist_ok=True)
+            writer = SummaryWriter(self.logging_dir)
+
+            csv_path = os.path.join(self.logging_dir, 'metrics.csv')
+            new_file = not (self.append and os.path.exists(csv_path))
+            csv_file = open(csv_path, 'w' if new_file else 'a', newline='')
+            csv_writer = csv.writer(csv_file)
+            if new_file:
+                csv_writer.writerow(['step', 'tag', 'value'])
+
+        last_print = time.monotonic()
+
+        while True:
+            item = self._queue.get()
+            if item is _CLOSE:
+                break
+
+            kind, tag, value, step = item
+
+            if kind == 'scalar':
+                with self._lock:
+                    self._series.setdefault(tag, Downsampler(self.max_points)).add(step, value)
+                if step != self._step:
+                    if self._values:
+                        self._latest = self._step, self._values
+                    self._step, self._values = step, {}
+                self._values[tag] = value
+
+                if csv_writer is not None:
+                    csv_writer.writerow([step, tag, value])
+                if writer is not None:
+                    writer.add_scalar(tag, value, step)
+
+            elif writer is not None:
+                writer.add_histogram(tag, value, step)
+
+            now = time.monotonic()
+            if self.print_every is not None and now - last_print >= self.print_every:
+                self._print()
+                last_print = now
+
+        if self._values:
+            self._latest = self._step, self._values
+        if self.print_every is not None:
+            self._print()
+
+        if writer is not None:
+            writer.close()
+            csv_file.close()
+
+    def _print(self):
+        step, latest = self._latest
+        if not latest:
+            return
+        values = '\t'.join(f'{tag} = {value:.4f}' for tag, value in latest.items())
+        tqdm.write(f'step {step}\t{values}')
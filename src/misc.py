@@ -12,7 +12,7 @@ def get_relpath(main_dir, train_params):
 
 def get_sims_filename(repetitions, test_params):
     return 'sims_reps='+str(repetitions)+'_dt='+str(test_params["dt"])+\
-           '_test_steps='+str(test_params["test_steps"])+'.pkl'
+           '_test_steps='+str(test_params["test_steps"])
 
 def save_models(attacker_model, defender_model, path):
     os.makedirs(path, exist_ok=True)
@@ -50,16 +50,125 @@ def load_models(attacker_model, defender_model, path):
     defender_model.load_state_dict(torch.load(def_path))
 
 
+METHODS = ('random', 'sobol', 'halton', 'lhs')
+
+_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53)
+
+
+def _halton(start, n, d):
+    """ Points start, ..., start + n - 1 of the Halton sequence in [0, 1)^d """
+    points = np.zeros((n, d))
+    for j, base in enumerate(_PRIMES[:d]):
+        indices = np.arange(start + 1, start + n + 1)
+        fraction = 1.
+        while np.any(indices > 0):
+            fraction /= base
+            points[:, j] += fraction * (indices % base)
+            indices //= base
+    return points
+
+
+def _latin_hypercube(n, d):
+    """ n points in [0, 1)^d, exactly one in each of the n slices of every axis """
+    slices = np.argsort(np.random.random_sample((d, n)), axis=1).T
+    return (slices + np.random.random_sample((n, d))) / n
+
+
 class ParametersHyperparallelepiped:
     """ Class used to sample from the hyper-grid of parameters.
         It also adds some gaussian noise to the sampled point in
         order to encourage the exploration of the space.
+        The grid points can be chosen at random or following a
+        low-discrepancy design (Sobol, Halton, Latin hypercube).
     """
 
     def __init__(self, *ranges):
         self._ranges = ranges
+        self._grids = [i for i, r in enumerate(ranges) if isinstance(r, np.ndarray)]
+        self._sobol = None
+        self._halton_index = 0
+
+    def _unit_points(self, n, method):
+        """ (n, number of grids) points in the unit hypercube """
+        d = len(self._grids)
+
+        if method == 'random':
+            return np.random.random_sample((n, d))
+
+        elif method == 'sobol':
+            try:
+                from scipy.stats import qmc
+            except ImportError:
+                raise ImportError("sobol sampling requires scipy") from None
+
+            # the engine is kept so that successive batches continue the sequence
+            if self._sobol is None:
+                self._sobol = qmc.Sobol(d, scramble=True, seed=np.random.randint(2**31))
+            return self._sobol.random(n)
+
+        elif method == 'halton':
+            if d > len(_PRIMES):
+                raise ValueError(f"halton sampling supports up to {len(_PRIMES)} grids")
+            points = _halton(self._halton_index, n, d)
+            self._halton_index += n
+            return points
+
+        elif method == 'lhs':
+            return _latin_hypercube(n, d)
+
+        raise ValueError(f"unknown sampling method '{method}', expected one of {METHODS}")
+
+    def sample_batch(self, n, mu=0, sigma=1., method='random'):
+        """ Samples n points of the grid as a (n, parameters) array,
+            with gaussian noise on the parameters given as grids
+        """
+        samples = np.empty((n, len(self._ranges)))
+
+        for i, r in enumerate(self._ranges):
+            if i not in self._grids:
+                samples[:, i] = float(r)
+
+        if self._grids:
+            u = self._unit_points(n, method)
+            for j, i in enumerate(self._grids):
+                r = self._ranges[i]
+                indices = np.minimum((u[:, j] * len(r)).astype(int), len(r) - 1)
+                samples[:, i] = r[indices] + np.random.normal(mu, sigma, n)
+
+        return samples
+
+    def sample(self, mu=0, sigma=1., method='random', chunk=1):
+        """ Infinite iterator of single points, see Sampler """
+        return Sampler(self, mu, sigma, method, chunk)
+
+
+class Sampler:
+    """ Iterator over the points of a ParametersHyperparallelepiped,
+        next() gives a single point as a list, batch(n) an (n, parameters)
+        array drawn in a single call.
+        With chunk > 1 the single points are drawn ahead chunk at a time,
+        which moves the global random state saved by the checkpoints:
+        a resumed training is then no longer identical to the original.
+    """
 
-    def sample(self, mu=0, sigma=1.):
-        while True:
-            yield [np.random.choice(r) + np.random.normal(mu, sigma)
-                    if isinstance(r, np.ndarray) else float(r) for r in self._ranges]
+    def __init__(self, space, mu=0, sigma=1., method='random', chunk=1):
+        self.space = space
+        self.mu = mu
+        self.sigma = sigma
+        self.method = method
+        self.chunk = chunk
+        self._points = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        point = next(self._points, None)
+        if point is None:
+            self._points = iter(self.space.sample_batch(self.chunk, self.mu, self.sigma, self.method))
+            point = next(self._points)
+        return point.tolist()
+
+    def batch(self, n):
+        """ (n, parameters) array of points """
+        return self.space.sample_batch(n, self.mu, self.sigma, self.method)
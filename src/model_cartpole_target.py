@@ -2,13 +2,17 @@ import json
 import torch
 import numpy as np
 import random
-from diffquantitative import DiffQuantitativeSemantic
-from torchdiffeq import odeint
+from diffquantitative import DiffQuantitativeSemantic, OnlineMonitor
+from traces import TraceBuffer
+from integrators import get_integrator
 
 DEBUG=False
 DIFF_EQ="gym" #gym, enrico
 
 class CartPole():
+    """ Vectorized cart-pole: the state of every cart in the batch is stored
+        as one row of a (batch, 4) tensor with columns x, theta, dot_x, dot_theta
+    """
 
     def __init__(self):
 
@@ -20,8 +24,7 @@ class CartPole():
         self.mpole = .1 # pole mass in kg
         self.lpole = 1. # pole length in meters
 
-        self.x, self.theta = (torch.tensor(0.0), torch.tensor(0.0))
-        self.dot_theta, self.dot_x = (torch.tensor(0.0), torch.tensor(0.0))
+        self.state = torch.zeros(1, 4)
         self.ddot_x, self.ddot_theta = (torch.tensor(0.0), torch.tensor(0.))
         self.x_target = torch.tensor(0.0)
 
@@ -40,6 +43,90 @@ class CartPole():
         self._max_ddot_theta = 100.
         self._max_f = 100.
 
+        self._max_state = torch.tensor([self._max_x, self._max_theta,
+                                        self._max_dot_x, self._max_dot_theta])
+
+        self.integrator = get_integrator('euler')
+
+    # the state variables are views into the state tensor, which is never
+    # modified in place: updates always replace it with a new tensor
+
+    @property
+    def x(self):
+        return self.state[:, 0]
+
+    @x.setter
+    def x(self, value):
+        self._set_column(0, value)
+
+    @property
+    def theta(self):
+        return self.state[:, 1]
+
+    @theta.setter
+    def theta(self, value):
+        self._set_column(1, value)
+
+    @property
+    def dot_x(self):
+        return self.state[:, 2]
+
+    @dot_x.setter
+    def dot_x(self, value):
+        self._set_column(2, value)
+
+    @property
+    def dot_theta(self):
+        return self.state[:, 3]
+
+    @dot_theta.setter
+    def dot_theta(self, value):
+        self._set_column(3, value)
+
+    def _set_column(self, index, value):
+        value = torch.as_tensor(value, dtype=self.state.dtype).reshape(-1)
+        state = self.state
+        if state.shape[0] == 1:
+            state = state.expand(value.shape[0], -1)
+        state = state.clone()
+        state[:, index] = value
+        self.state = state
+
+    def reset(self, x, theta, dot_x, dot_theta):
+        """ Sets the state of all the carts, one row per initial condition """
+        columns = [torch.as_tensor(c, dtype=torch.get_default_dtype()).reshape(-1)
+                   for c in (x, theta, dot_x, dot_theta)]
+        self.state = torch.stack(torch.broadcast_tensors(*columns), dim=-1)
+
+    def derivative(self, state):
+        """ Vector field of the carts, with the force of the current step """
+        g = self.gravity
+        mp = self.mpole
+        mc = self.mcart
+        l = self.lpole/2 
+
+        x, theta, dot_x, dot_theta = state.unbind(-1)
+        sin_theta = torch.sin(theta)
+        cos_theta = torch.cos(theta)
+
+        if DIFF_EQ=="gym":
+
+            temp = (self.f+mp*l*dot_theta**2*sin_theta)/(mp+mc)
+            denom = l*(4/3-(mp*cos_theta**2)/(mp+mc))
+            ddot_theta = (g*sin_theta-cos_theta*temp)/denom
+            ddot_x = temp - (mp*l*ddot_theta*cos_theta)/(mp+mc)
+
+        elif DIFF_EQ=="enrico":
+
+            ddot_x = self.f - self.mu*dot_x  \
+                       + mp*l*dot_theta**2*sin_theta \
+                       - mp*g*cos_theta*sin_theta
+            ddot_x = ddot_x / ( mc+mp-mp*cos_theta**2 )
+        
+            ddot_theta = (g*sin_theta - cos_theta*ddot_x ) / l
+
+        return torch.stack((dot_x, dot_theta, ddot_x, ddot_theta), dim=-1)
+
     def update(self, dt, inp_acc=None, dot_eps=None, mu=None, nu=None):
         """
         Update the system state.
@@ -59,46 +146,30 @@ class CartPole():
             eps = self.eps + dot_eps * dt
             self.x_target = (self.x+eps)
 
-        g = self.gravity
-        mp = self.mpole
-        mc = self.mcart
-        l = self.lpole/2 
-        
         # f = (mp + mc) * self.inp_acc
-        f = (mp + mc) * torch.abs(self.inp_acc) * torch.sign(self.theta) 
+        f = (self.mpole + self.mcart) * torch.abs(self.inp_acc) * torch.sign(self.theta) 
         self.f = torch.clamp(f, -self._max_f, self._max_f)
 
-        if DIFF_EQ=="gym":
+        # the accelerations at the beginning of the step are given by
+        # the first evaluation of the vector field, for every integrator
+        accelerations = []
 
-            temp = (self.f+mp*l*self.dot_theta**2*torch.sin(self.theta))/(mp+mc)
-            denom = l*(4/3-(mp*torch.cos(self.theta)**2)/(mp+mc))
-            ddot_theta = (g*torch.sin(self.theta)-torch.cos(self.theta)*temp)/denom
-            ddot_x = temp - (mp*l*ddot_theta*torch.cos(self.theta))/(mp+mc)
+        def field(state):
+            derivative = self.derivative(state)
+            if not accelerations:
+                accelerations.append(derivative)
+            return derivative
 
-        elif DIFF_EQ=="enrico":
+        state = self.integrator(field, self.state, dt)
+        self.ddot_x, self.ddot_theta = accelerations[0][:, 2], accelerations[0][:, 3]
 
-            ddot_x = self.f - self.mu*self.dot_x  \
-                       + mp*l*self.dot_theta**2* torch.sin(self.theta) \
-                       - mp*g*torch.cos(self.theta) * torch.sin(self.theta)
-            ddot_x = ddot_x / ( mc+mp-mp* torch.cos(self.theta)**2 )
-        
-            ddot_theta = (g*torch.sin(self.theta) - torch.cos(self.theta)*ddot_x ) / l
-
-        x = self.x + dt * self.dot_x
-        theta = self.theta + dt * self.dot_theta
-        dot_x = self.dot_x + dt * ddot_x
-        dot_theta = self.dot_theta + dt * ddot_theta
-
-        self.dist = torch.abs(x-self.x_target)
-        self.x = torch.clamp(x, -self._max_x, self._max_x).reshape(1)
-        self.theta = torch.clamp(theta, -self._max_theta, self._max_theta).reshape(1)
-        self.dot_x = torch.clamp(dot_x, -self._max_dot_x, self._max_dot_x).reshape(1)
-        self.dot_theta = torch.clamp(dot_theta, -self._max_dot_theta, self._max_dot_theta).reshape(1)
+        self.dist = torch.abs(state[:, 0]-self.x_target)
+        self.state = torch.max(torch.min(state, self._max_state), -self._max_state)
 
         if DEBUG:
-            print(f"x-x_target={(x-self.x_target).item():.4f}\
-                    theta={self.theta.item():.4f}\
-                    f={self.f.item()}")
+            print(f"x-x_target={(self.x-self.x_target)[0].item():.4f}\
+                    theta={self.theta[0].item():.4f}\
+                    f={self.f.reshape(-1)[0].item()}")
 
 class Environment:
     def __init__(self, cartpole):
@@ -148,7 +219,7 @@ class Agent:
 
     @property
     def x(self):
-        return self._cartpole.x.clone()
+        return self._cartpole.x
 
     @x.setter
     def x(self, value):
@@ -156,7 +227,7 @@ class Agent:
 
     @property
     def dot_x(self):
-        return self._cartpole.dot_x.clone()
+        return self._cartpole.dot_x
 
     @dot_x.setter
     def dot_x(self, value):
@@ -172,7 +243,7 @@ class Agent:
 
     @property
     def theta(self):
-        return self._cartpole.theta.clone()
+        return self._cartpole.theta
 
     @theta.setter
     def theta(self, value):
@@ -180,7 +251,7 @@ class Agent:
 
     @property
     def dot_theta(self):
-        return self._cartpole.dot_theta.clone()
+        return self._cartpole.dot_theta
 
     @dot_theta.setter
     def dot_theta(self, value):
@@ -218,10 +289,11 @@ class Agent:
 
 class Model:
     
-    def __init__(self, param_generator):
+    def __init__(self, param_generator, integrator=None):
         # setting of the initial conditions
         cartpole = CartPole()
 
+        self._cartpole = cartpole
         self.agent = Agent(cartpole)
         self.environment = Environment(cartpole)
 
@@ -229,15 +301,18 @@ class Model:
         self.environment.set_agent(self.agent)
 
         self._param_generator = param_generator
-        self.traces = None
+
+        # the default integrator of each model is kept unless one is given
+        if integrator is not None:
+            self._cartpole.integrator = get_integrator(integrator)
+        self.traces = TraceBuffer('dist', 'theta')
 
     def step(self, env_input, agent_input, dt):
 
         self.environment.update(env_input, dt)
         self.agent.update(agent_input, dt)
 
-        self.traces['dist'].append(self.agent.dist)
-        self.traces['theta'].append(self.agent.theta)
+        self.traces.append(dist=self.agent.dist, theta=self.agent.theta)
 
     def initialize_random(self):
         cart_position, cart_velocity, pole_angle, pole_ang_velocity, x_target = next(self._param_generator)
@@ -246,27 +321,38 @@ class Model:
 
         self.reinitialize(cart_position, cart_velocity, pole_angle, pole_ang_velocity, x_target)
 
+    def initialize_random_batch(self, batch_size):
+        samples = self._param_generator.batch(batch_size)
+
+        self._last_init = tuple(samples.T)
+
+        self.reinitialize(*self._last_init)
+
     def initialize_rewind(self):
         self.reinitialize(*self._last_init)
 
     def reinitialize(self, cart_position, cart_velocity, pole_angle, pole_ang_velocity, x_target):
         # print("\n")
 
-        self.agent.x = torch.tensor(cart_position).reshape(1)
-        self.agent.dot_x = torch.tensor(cart_velocity).reshape(1)
-        self.agent.theta = torch.tensor(pole_angle).reshape(1)
-        self.agent.dot_theta = torch.tensor(pole_ang_velocity).reshape(1)
-        self.agent.x_target = torch.tensor(x_target).reshape(1)
+        self._cartpole.reset(cart_position, pole_angle, cart_velocity, pole_ang_velocity)
+        self.agent.x_target = torch.tensor(x_target).reshape(-1)
+        # the last input must not leak into the next (possibly batched) episode
+        self._cartpole.inp_acc = torch.tensor(0.0)
 
-        self.traces = {'dist':[], 'theta': []}
+        self.traces.reset()
 
 class RobustnessComputer:
     def __init__(self, formula):
         self.dqs = DiffQuantitativeSemantic(formula)
 
+    def signals(self, model):
+        return {'dist': model.traces['dist'], 'theta': model.traces['theta']}
+
     def compute(self, model):
-        dist = model.traces['dist']
-        theta = model.traces['theta']
-        return self.dqs.compute(dist=torch.cat(dist), theta=torch.cat(theta))
+        return self.dqs.compute(**self.signals(model))
+
+    def monitor(self):
+        """ Online monitor of the formula, fed with the last samples of the signals """
+        return OnlineMonitor(self.dqs.logic_parser)
         # return self.dqs.compute(dist=torch.stack(dist, dim=0), theta=torch.stack(theta, dim=0))
         
@@ -5,7 +5,9 @@ import numpy as np
 ROAD_LENGTH = 50
 BUMPS = 3
 
-from diffquantitative import DiffQuantitativeSemantic
+from diffquantitative import DiffQuantitativeSemantic, OnlineMonitor
+from traces import TraceBuffer
+from integrators import get_integrator
 
 class Car:
     """ Describes the physical behaviour of the vehicle """
@@ -23,25 +25,44 @@ class Car:
         self.velocity = torch.tensor(0.0).to(device=self.device, dtype=torch.float32)
         self.acceleration = torch.tensor(0.0).to(device=self.device, dtype=torch.float32)
         self.friction_coefficient = 0.01
+        self.integrator = get_integrator('semi_implicit')
+
+    def derivative(self, state, in_acceleration, angle):
+        """ Vector field of the (position, velocity) state, on a slope of the given angle """
+        velocity = state[..., 1]
+        acceleration = in_acceleration - self.gravity * torch.sin(angle)
+        friction = self.friction_coefficient * self.gravity * torch.cos(angle)
+        acceleration = torch.where(velocity != 0, acceleration - friction, acceleration)
+        return torch.stack(torch.broadcast_tensors(velocity, acceleration), dim=-1)
+
+    def _constrain(self, state):
+        velocity = torch.clamp(state[..., 1], self._min_velocity, self._max_velocity)
+        return torch.stack((state[..., 0], velocity), dim=-1)
+
+    def update(self, in_acceleration, steepness, dt):
+        """ Differential equation for updating the state of the car,
+            steepness(position) gives the angle of the road
+        """
+        in_acceleration = torch.clamp(in_acceleration.reshape(1), self._min_acceleration, self._max_acceleration)
+        state = torch.stack(torch.broadcast_tensors(self.position, self.velocity), dim=-1)
+        # every stage of the integrator is on the slope of its own position
+        field = lambda state: self.derivative(state, in_acceleration, steepness(state[..., 0]))
 
-
-    def update(self, in_acceleration, angle, dt):
-        """ Differential equation for updating the state of the car """
-        self.acceleration = torch.clamp(in_acceleration.reshape(1), self._min_acceleration, self._max_acceleration)
-        self.acceleration -= self.gravity * torch.sin(angle)
-        if self.velocity != 0:
-            self.acceleration -= self.friction_coefficient * self.gravity * torch.cos(angle)
-        self.velocity = torch.clamp(self.velocity + self.acceleration * dt, self._min_velocity, self._max_velocity)
-        self.position += self.velocity * dt
+        self.acceleration = field(state)[..., 1]
+        self.position, self.velocity = self.integrator(field, state, dt, self._constrain).unbind(-1)
 
 
 class Environment:
     def __init__(self):
-        self._fn = lambda x: torch.tensor(0.)
         self._max_angle = 25 #deg
         self._max_angular_coeff = np.tan(np.deg2rad(self._max_angle))
         self._dx = 0.1
 
+        # the road profile is tabulated every _dx meters over [0, 2 * ROAD_LENGTH]
+        self._grid = (torch.arange(0, round(2 * ROAD_LENGTH / self._dx) + 1) * self._dx).float()
+        self._parameters = None
+        self.set_profile(lambda x: torch.zeros_like(x))
+
     def set_agent(self, agent):
         self._agent = agent
         self.initialized()
@@ -55,36 +76,73 @@ class Environment:
         """ Representation of the state """
         return ()
 
+    def set_profile(self, fn, slope=None):
+        """ Tabulates the road's height fn and its derivative slope on the grid,
+            the derivative is approximated by finite differences if not given
+        """
+        heights = torch.as_tensor(fn(self._grid)).reshape(-1).float()
+        if slope is None:
+            slopes = torch.gradient(heights, spacing=self._dx)[0]
+        else:
+            slopes = torch.as_tensor(slope(self._grid)).reshape(-1).float()
+
+        self._fn = fn
+        self._slopes = torch.clamp(slopes, -self._max_angular_coeff, self._max_angular_coeff)
+
+        # the height of the road actually driven, with the clamped slope
+        steps = (self._slopes[1:] + self._slopes[:-1]) / 2 * self._dx
+        self._heights = torch.cat((torch.zeros_like(steps[:1]), torch.cumsum(steps, dim=0)))
+
+    def _lookup(self, table, x):
+        """ Linear interpolation of the table in the (batched) positions x,
+            constant outside the grid
+        """
+        x = torch.as_tensor(x, dtype=table.dtype)
+        s = torch.clamp(x / self._dx, 0, len(table) - 1)
+        i = torch.clamp(s.detach().long(), max=len(table) - 2)
+        w = s - i
+        return table[i] * (1 - w) + table[i + 1] * w
+
     def get_steepness(self, x):
         """ Computes the value of the road's steepness in a given point """
-        x = torch.tensor(x) if not isinstance(x, torch.Tensor) else x
-        dy = self._fn(x + self._dx) - self._fn(x)
-        deriv = torch.tensor(dy) / torch.tensor(self._dx)
-        return torch.clamp(deriv, -self._max_angular_coeff, self._max_angular_coeff)
+        return self._lookup(self._slopes, x)
 
     def get_fn(self, x):
         """ Computes the value of the road's height in a given point """
-        derivative = np.array([self.get_steepness(i) for i in x])
-        return np.cumsum(derivative) * self._dx
+        return self._lookup(self._heights, x)
+
+    def reset(self):
+        """ Starts a new episode, the next update generates its road """
+        self._parameters = None
 
     def update(self, parameters, dt):
-        """ Generates the altimetric profile of the road
+        """ Generates the altimetric profile of the road.
+            The road of an episode is tabulated once, from the parameters
+            of its first step, the following ones are ignored until reset
         """
 
         if parameters is not None:
+            if self._parameters is not None:
+                return
+
             parameters = parameters.reshape(2, BUMPS).float()
+            self._parameters = parameters.detach()
+
+            w = parameters[0]
+            sigma = parameters[1]
+            mu = torch.tensor([20., 30., 40.]).float()
 
             def gaussian_rbf(x):
                 x = x.reshape(1) if x.dim() == 0 else x
-                w = parameters[0]
-                sigma = parameters[1]
-                mu = torch.tensor([20, 30, 40])
+                d = x[:, np.newaxis] - mu
+                return w.matmul(torch.exp(-(d * sigma)**2).t())
 
-                phi = lambda x: torch.exp(-(x * sigma)**2).float()
-                r = torch.abs(x[:, np.newaxis] - mu).float()
-                return w.matmul(phi(r).t())
+            def gaussian_rbf_slope(x):
+                x = x.reshape(1) if x.dim() == 0 else x
+                d = x[:, np.newaxis] - mu
+                return w.matmul((-2 * sigma**2 * d * torch.exp(-(d * sigma)**2)).t())
 
-            self._fn = gaussian_rbf
+            self.set_profile(gaussian_rbf, gaussian_rbf_slope)
 
 
 class Agent:
@@ -130,7 +188,7 @@ class Agent:
             generated by the NN.
         """
         acceleration = parameters
-        self._car.update(acceleration, self.angle, dt)
+        self._car.update(acceleration, self._environment.get_steepness, dt)
 
 
 class Model:
@@ -138,7 +196,7 @@ class Model:
     It includes both the attacker and the defender.
     """
 
-    def __init__(self, param_generator, device="cuda"):
+    def __init__(self, param_generator, device="cuda", integrator=None):
         self.agent = Agent(device)
         self.environment = Environment()
 
@@ -147,6 +205,11 @@ class Model:
 
         self._param_generator = param_generator
 
+        # the default integrator of each model is kept unless one is given
+        if integrator is not None:
+            self.agent._car.integrator = get_integrator(integrator)
+        self.traces = TraceBuffer('velo')
+
     def step(self, env_input, agent_input, dt):
         """ Updates the physical world with the evolution of
         a single instant of time.
@@ -154,7 +217,7 @@ class Model:
         self.environment.update(env_input, dt)
         self.agent.update(agent_input, dt)
 
-        self.traces['velo'].append(self.agent.velocity)
+        self.traces.append(velo=self.agent.velocity)
 
     def initialize_random(self):
         """ Sample a random initial state """
@@ -172,18 +235,23 @@ class Model:
         """ Sets the world's state as specified """
         self.agent.position = torch.tensor(agent_position).reshape(1).float()
         self.agent.velocity = torch.tensor(agent_velocity).reshape(1).float()
-        
-        self.traces = {
-            'velo': []
-        }
+        self.environment.reset()
+
+        self.traces.reset()
 
 class RobustnessComputer:
     """ Used to compute the robustness value (rho) """
     def __init__(self, formula):
         self.dqs = DiffQuantitativeSemantic(formula)
 
+    def signals(self, model):
+        """ Signals of the formula recorded in the traces """
+        return {'v': model.traces['velo']}
+
     def compute(self, model):
-        """ Computes rho for the given trace """
-        v = model.traces['velo']
+        """ Computes rho for each trace of the batch, returns a (batch,) tensor """
+        return self.dqs.compute(**self.signals(model))
 
-        return self.dqs.compute(v=torch.cat(v))
+    def monitor(self):
+        """ Online monitor of the formula, fed with the last samples of the signals """
+        return OnlineMonitor(self.dqs.logic_parser)
@@ -2,7 +2,9 @@ import json
 import torch
 import numpy as np
 
-from diffquantitative import DiffQuantitativeSemantic
+from diffquantitative import DiffQuantitativeSemantic, OnlineMonitor
+from traces import TraceBuffer
+from integrators import get_integrator
 
 class Car:
     """ Describes the physical behaviour of the vehicle """
@@ -16,15 +18,28 @@ class Car:
         self.velocity = torch.tensor(0.0)
         self.acceleration = torch.tensor(0.0)
         self.friction_coefficient = 0.01
+        self.integrator = get_integrator('semi_implicit')
+
+    def derivative(self, state, in_acceleration):
+        """ Vector field of the (position, velocity) state """
+        velocity = state[..., 1]
+        friction = self.friction_coefficient * self.gravity
+        acceleration = torch.where(velocity > 0, in_acceleration - friction, in_acceleration)
+        return torch.stack(torch.broadcast_tensors(velocity, acceleration), dim=-1)
+
+    def _constrain(self, state):
+        velocity = torch.clamp(state[..., 1], self._min_velocity, self._max_velocity)
+        return torch.stack((state[..., 0], velocity), dim=-1)
 
     def update(self, in_acceleration, dt):
         """ Differential equation for updating the state of the car """
 
-        self.acceleration = torch.clamp(in_acceleration, self._min_acceleration, self._max_acceleration)
-        if self.velocity > 0:
-            self.acceleration -= self.friction_coefficient * self.gravity
-        self.velocity = torch.clamp(self.velocity + self.acceleration * dt, self._min_velocity, self._max_velocity)
-        self.position += self.velocity * dt
+        in_acceleration = torch.clamp(in_acceleration, self._min_acceleration, self._max_acceleration)
+        state = torch.stack(torch.broadcast_tensors(self.position, self.velocity), dim=-1)
+        field = lambda state: self.derivative(state, in_acceleration)
+
+        self.acceleration = field(state)[..., 1]
+        self.position, self.velocity = self.integrator(field, state, dt, self._constrain).unbind(-1)
 
 
 class Environment:
@@ -117,12 +132,79 @@ class Agent:
         self._car.update(acceleration, dt)
 
 
+class Platoon:
+    """ A leader followed by a line of cars, simulated for many platoons
+        at once. A single Car holds the (platoons, cars) positions and
+        velocities, the leader being the first column.
+    """
+
+    def __init__(self, n_followers, n_platoons=1):
+        self.n_followers = n_followers
+        self.n_platoons = n_platoons
+        self._cars = Car()
+
+    def initialize(self, distance, velocity):
+        """ Evenly spaced vehicles with the same velocity,
+            a value or a (platoons,) tensor for each platoon
+        """
+        distance = torch.as_tensor(distance).reshape(-1, 1).expand(self.n_platoons, 1)
+        velocity = torch.as_tensor(velocity).reshape(-1, 1).expand(self.n_platoons, 1)
+        slots = torch.arange(self.n_followers, -1, -1)
+
+        self._cars.position = distance * slots
+        self._cars.velocity = velocity.expand(-1, self.n_followers + 1).clone()
+
+    @property
+    def positions(self):
+        return self._cars.position.clone()
+
+    @property
+    def velocities(self):
+        return self._cars.velocity.clone()
+
+    @property
+    def distances(self):
+        """ Distance of each follower from the vehicle ahead """
+        return self._cars.position[:, :-1] - self._cars.position[:, 1:]
+
+    @property
+    def leader_status(self):
+        """ Observations of the leader, as those of the environment """
+        return torch.stack((self._cars.velocity[:, 0],
+                            self._cars.velocity[:, 1],
+                            self.distances[:, 0]), dim=-1)
+
+    @property
+    def followers_status(self):
+        """ (platoons, followers, sensors) observations of the followers,
+            as those of the agent with the vehicle ahead as leader
+        """
+        return torch.stack((self._cars.velocity[:, :-1],
+                            self._cars.velocity[:, 1:],
+                            self.distances), dim=-1)
+
+    def step(self, leader_acceleration, defender, dt):
+        """ Moves every vehicle, the followers being driven by the defender
+            evaluated in a single batch. Returns their accelerations.
+        """
+        oa = self.followers_status.reshape(-1, 3)
+        with torch.no_grad():
+            followers_acceleration = defender(oa)(dt).reshape(self.n_platoons, self.n_followers)
+
+        leader_acceleration = torch.as_tensor(leader_acceleration).reshape(-1, 1)
+        acceleration = torch.cat((leader_acceleration.expand(self.n_platoons, 1),
+                                  followers_acceleration), dim=1)
+        self._cars.update(acceleration, dt)
+
+        return followers_acceleration
+
+
 class Model:
     """ The model of the whole world.
         It includes both the attacker and the defender.
     """
 
-    def __init__(self, param_generator):
+    def __init__(self, param_generator, integrator=None):
         self.agent = Agent()
         self.environment = Environment()
 
@@ -131,7 +213,12 @@ class Model:
 
         self._param_generator = param_generator
 
-        self.traces = None
+        # the default integrator of each model is kept unless one is given
+        if integrator is not None:
+            self.agent._car.integrator = get_integrator(integrator)
+            self.environment._leader_car.integrator = get_integrator(integrator)
+
+        self.traces = TraceBuffer('dist')
 
     def step(self, env_input, agent_input, dt):
         """ Updates the physical world with the evolution of
@@ -140,7 +227,25 @@ class Model:
         self.environment.update(env_input, dt)
         self.agent.update(agent_input, dt)
 
-        self.traces['dist'].append(self.agent.distance)
+        self.record()
+
+    def record(self):
+        """ Appends the signals of the current state to the traces """
+        self.traces.append(dist=self.agent.distance)
+
+    @property
+    def state(self):
+        """ The physical state of the world as a (batch, size) tensor with
+            columns agent position, agent velocity, leader position, leader velocity
+        """
+        return torch.stack(torch.broadcast_tensors(self.agent._car.position, self.agent._car.velocity,
+                                                   self.environment._leader_car.position,
+                                                   self.environment._leader_car.velocity), dim=-1)
+
+    @state.setter
+    def state(self, value):
+        self.agent.position, self.agent.velocity, \
+                self.environment.l_position, self.environment.l_velocity = value.unbind(-1)
 
     def initialize_random(self):
         """ Sample a random initial state """
@@ -150,28 +255,40 @@ class Model:
 
         self.reinitialize(agent_position, agent_velocity, leader_position, leader_velocity)
 
+    def initialize_random_batch(self, batch_size):
+        """ Sample a batch of random initial states, one per scenario """
+        samples = self._param_generator.batch(batch_size)
+
+        self._last_init = tuple(samples.T)
+
+        self.reinitialize(*self._last_init)
+
     def initialize_rewind(self):
         """ Restore the world's state to the last initialization """
         self.reinitialize(*self._last_init)
 
     def reinitialize(self, agent_position, agent_velocity, leader_position, leader_velocity):
         """ Sets the world's state as specified """
-        self.agent.position = torch.tensor(agent_position).reshape(1)
-        self.agent.velocity = torch.tensor(agent_velocity).reshape(1)
-        self.environment.l_position = torch.tensor(leader_position).reshape(1)
-        self.environment.l_velocity = torch.tensor(leader_velocity).reshape(1)
+        self.agent.position = torch.tensor(agent_position).reshape(-1)
+        self.agent.velocity = torch.tensor(agent_velocity).reshape(-1)
+        self.environment.l_position = torch.tensor(leader_position).reshape(-1)
+        self.environment.l_velocity = torch.tensor(leader_velocity).reshape(-1)
 
-        self.traces = {
-            'dist': []
-        }
+        self.traces.reset()
 
 class RobustnessComputer:
     """ Used to compute the robustness value (rho) """
     def __init__(self, formula):
         self.dqs = DiffQuantitativeSemantic(formula)
 
+    def signals(self, model):
+        """ Signals of the formula recorded in the traces """
+        return {'dist': model.traces['dist']}
+
     def compute(self, model):
-        """ Computes rho for the given trace """
-        d = model.traces['dist']
+        """ Computes rho for each trace of the batch, returns a (batch,) tensor """
+        return self.dqs.compute(**self.signals(model))
 
-        return self.dqs.compute(dist=torch.cat(d))
+    def monitor(self):
+        """ Online monitor of the formula, fed with the last samples of the signals """
+        return OnlineMonitor(self.dqs.logic_parser)
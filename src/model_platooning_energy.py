@@ -2,10 +2,18 @@ import json
 import torch
 import numpy as np
 from diffquantitative import DiffQuantitativeSemantic
-from scipy.interpolate import griddata
+from traces import TraceBuffer
+from integrators import get_integrator
 import matplotlib.pyplot as plt
-import numpy
 
+DEBUG = False
+
+# maps the values and the derivatives in the corners of a cell
+# to the coefficients of the bicubic polynomial
+_BICUBIC = np.array([[1., 0., 0., 0.],
+                     [0., 0., 1., 0.],
+                     [-3., 3., -2., -1.],
+                     [2., -2., 1., 1.]])
 
 class ElMotor:
     def __init__(self):
@@ -40,18 +48,70 @@ class ElMotor:
         self.efficiency[self.EM_T_list[:,np.newaxis] > self.EM_T_max_list] = np.nan
        
         self.efficiency_flat = self.efficiency.flatten()
-       
-    def getEfficiency(self, speed, torque): 
-        points = (self.x_speed_flat, self.y_torque_flat)
-        pair = (speed.item(), torque.item())
-        grid = griddata(points, self.efficiency_flat, pair, method = "cubic")
-        # todo: debug
-        # print(grid)
-        return grid
+
+        self._w_step = self.EM_w_list[1] - self.EM_w_list[0]
+        self._T_step = self.EM_T_list[1] - self.EM_T_list[0]
+        self._coefficients = self._bicubic_coefficients()
+
+        # the maximum torque is linear between the breakpoints of the speed grid
+        self._T_max = torch.tensor(self.EM_T_max_list)
+        self._T_max_slope = torch.tensor(np.diff(self.EM_T_max_list))
+
+    def _bicubic_coefficients(self):
+        """ Coefficients of the bicubic polynomial of each cell of the
+            (speed, torque) grid, computed once as a (speeds-1, torques-1, 4, 4) tensor.
+            The cells above the maximum torque take the efficiency of the
+            highest admissible torque at the same speed.
+        """
+        eff = self.efficiency.T.copy()
+        for j in range(1, eff.shape[1]):
+            missing = np.isnan(eff[:, j])
+            eff[missing, j] = eff[missing, j - 1]
+
+        # derivatives in grid units, central differences in the interior
+        d_w = np.gradient(eff, axis=0)
+        d_T = np.gradient(eff, axis=1)
+        d_wT = np.gradient(d_w, axis=1)
+
+        def corners(f):
+            return np.stack([np.stack([f[:-1, :-1], f[:-1, 1:]], axis=-1),
+                             np.stack([f[1:, :-1], f[1:, 1:]], axis=-1)], axis=-2)
+
+        F = np.concatenate([np.concatenate([corners(eff), corners(d_T)], axis=-1),
+                            np.concatenate([corners(d_w), corners(d_wT)], axis=-1)], axis=-2)
+
+        coefficients = _BICUBIC @ F @ _BICUBIC.T
+        return torch.tensor(coefficients)
+
+    def getEfficiency(self, speed, torque):
+        """ Bicubic interpolation of the efficiency map, speed and torque
+            can be batched, the efficiency in braking is the one of the
+            corresponding absolute torque
+        """
+        n_w, n_T = self._coefficients.shape[:2]
+        x = torch.clamp(speed / self._w_step, 0, n_w)
+        y = torch.clamp(torch.abs(torque) / self._T_step, 0, n_T)
+
+        i = torch.clamp(x.detach().long(), max=n_w - 1)
+        j = torch.clamp(y.detach().long(), max=n_T - 1)
+        u, v = x - i, y - j
+
+        powers_u = torch.stack([torch.ones_like(u), u, u**2, u**3], dim=-1)
+        powers_v = torch.stack([torch.ones_like(v), v, v**2, v**3], dim=-1)
+        coefficients = self._coefficients[i, j].to(u.dtype)
+
+        return torch.einsum('...p,...pq,...q->...', powers_u, coefficients, powers_v)
    
     def getMinMaxTorque(self, speed):
-        max_tq = numpy.interp(speed.cpu().detach().numpy(), self.EM_w_list, self.EM_T_max_list)
-        return -max_tq[0], max_tq[0]
+        """ Torque limits at the given (batched) speed, the curve is
+            constant beyond the first and the last breakpoint
+        """
+        n_segments = len(self._T_max_slope)
+        x = torch.clamp(speed / self._w_step, 0, n_segments)
+        i = torch.clamp(x.detach().long(), max=n_segments - 1)
+
+        max_tq = self._T_max.to(x.dtype)[i] + self._T_max_slope.to(x.dtype)[i] * (x - i)
+        return -max_tq, max_tq
 
     def plotEffMap(self):
 
@@ -87,48 +147,67 @@ class Car:
         
         self.e_motor = ElMotor()
         
-        self.max_e_tq = np.max(self.e_motor.EM_T_max_list)
+        self.max_e_tq = torch.tensor(np.max(self.e_motor.EM_T_max_list))
         self.min_e_tq = - self.max_e_tq
         self.e_motor_speed = torch.tensor(0.0)
         self.e_torque= torch.tensor(0.0)
         self.br_torque= torch.tensor(0.0)
         self.e_power = torch.tensor(0.0)
 
+        self.integrator = get_integrator('semi_implicit')
+
     def motor_efficiency(self):
         eff = self.e_motor.getEfficiency(self.e_motor_speed,self.e_torque)
         return eff**(-torch.sign(self.e_torque))
     
     def calculate_wheels_torque(self, e_torque, br_torque):
         self.br_torque = torch.clamp(br_torque, 0, self._max_whl_brk_torque)
-        self.e_torque = torch.clamp(e_torque, self.min_e_tq, self.max_e_tq)
+        self.e_torque = torch.max(torch.min(e_torque, self.max_e_tq), self.min_e_tq)
         return self.e_torque*self.gear_ratio - self.br_torque
 
-    def resistance_force(self):
-        F_loss = 0.5*self.rho*self.veh_surface*self.aer_coeff*(self.velocity**2) + \
-            self.rr_coeff*self.mass*self.gravity*self.velocity
+    def reset_motor(self):
+        """ Motor at rest, with the torque limits of the current velocity """
+        self.e_motor_speed = self.velocity*self.gear_ratio/self.wheel_radius
+        self.min_e_tq, self.max_e_tq = self.e_motor.getMinMaxTorque(self.e_motor_speed)
+        self.e_torque = torch.zeros_like(self.velocity)
+        self.br_torque = torch.zeros_like(self.velocity)
+        self.e_power = torch.zeros_like(self.velocity)
+
+    def resistance_force(self, velocity=None):
+        velocity = self.velocity if velocity is None else velocity
+        F_loss = 0.5*self.rho*self.veh_surface*self.aer_coeff*(velocity**2) + \
+            self.rr_coeff*self.mass*self.gravity*velocity
         return F_loss
 
+    def derivative(self, state, in_wheels_torque, dist_force=0):
+        """ Vector field of the (position, velocity) state """
+        velocity = state[..., 1]
+        acceleration = (in_wheels_torque/self.wheel_radius - self.resistance_force(velocity) + dist_force) / self.mass
+        acceleration = torch.clamp(acceleration, self._min_acceleration, self._max_acceleration)
+        return torch.stack(torch.broadcast_tensors(velocity, acceleration), dim=-1)
+
 
     def update(self, dt, e_torque, br_torque, dist_force=0):
         #Differential equation for updating the state of the car
 
         in_wheels_torque = self.calculate_wheels_torque(e_torque, br_torque)
 
-        acceleration = (in_wheels_torque/self.wheel_radius - self.resistance_force() + dist_force) / self.mass
-           
-        self.acceleration = torch.clamp(acceleration, self._min_acceleration, self._max_acceleration)
+        state = torch.stack(torch.broadcast_tensors(self.position, self.velocity), dim=-1)
+        field = lambda state: self.derivative(state, in_wheels_torque, dist_force)
+
+        self.acceleration = field(state)[..., 1]
         
         # self.velocity = torch.clamp(self.velocity + self.acceleration * dt, self._min_velocity, self._max_velocity)
-        self.velocity = self.velocity + self.acceleration * dt
+        self.position, self.velocity = self.integrator(field, state, dt).unbind(-1)
         self.e_motor_speed = self.velocity*self.gear_ratio/self.wheel_radius
         
         #update min/max e-torque based on new motor speed
         self.min_e_tq, self.max_e_tq = self.e_motor.getMinMaxTorque(self.e_motor_speed)
         # update power consumed
-        self.e_power = self.e_motor_speed*self.e_torque*self.motor_efficiency().item()        
-        self.position += self.velocity * dt
+        self.e_power = self.e_motor_speed*self.e_torque*self.motor_efficiency()
 
-        print(f"pos={self.position.item()}\tpower={self.e_power.item()}")
+        if DEBUG:
+            print(f"pos={self.position}\tpower={self.e_power}")
 
 class Environment:
     def __init__(self, device):
@@ -172,6 +251,9 @@ class Environment:
         e_torque, br_torque = parameters
         self._leader_car.update(e_torque=e_torque, br_torque=br_torque, dt=dt)
 
+    def reset_motor(self):
+        self._leader_car.reset_motor()
+
 
 class Agent:
     def __init__(self, device):
@@ -228,12 +310,15 @@ class Agent:
         e_torque, br_torque = parameters
         self._car.update(e_torque=e_torque, br_torque=br_torque, dt=dt)
 
+    def reset_motor(self):
+        self._car.reset_motor()
+
 class Model:
     """ The model of the whole world.
         It includes both the attacker and the defender.
     """
 
-    def __init__(self, param_generator, device="cuda"):
+    def __init__(self, param_generator, device="cuda", integrator=None):
         self.agent = Agent(device)
         self.environment = Environment(device)
 
@@ -242,7 +327,12 @@ class Model:
 
         self._param_generator = param_generator
 
-        self.traces = None
+        # the default integrator of each model is kept unless one is given
+        if integrator is not None:
+            self.agent._car.integrator = get_integrator(integrator)
+            self.environment._leader_car.integrator = get_integrator(integrator)
+
+        self.traces = TraceBuffer('dist', 'e_power')
 
     def step(self, env_input, agent_input, dt):
         """ Updates the physical world with the evolution of
@@ -251,8 +341,7 @@ class Model:
         self.environment.update(env_input, dt)
         self.agent.update(agent_input, dt)
 
-        self.traces['dist'].append(self.agent.distance)
-        self.traces['e_power'].append(self.agent.e_power)
+        self.traces.append(dist=self.agent.distance, e_power=self.agent.e_power)
 
     def initialize_random(self):
         """ Sample a random initial state """
@@ -262,30 +351,47 @@ class Model:
 
         self.reinitialize(agent_position, agent_velocity, leader_position, leader_velocity)
 
+    def initialize_random_batch(self, batch_size):
+        """ Sample a batch of random initial states, one per scenario """
+        samples = self._param_generator.batch(batch_size)
+
+        self._last_init = tuple(samples.T)
+
+        self.reinitialize(*self._last_init)
+
     def initialize_rewind(self):
         """ Restore the world's state to the last initialization """
         self.reinitialize(*self._last_init)
 
     def reinitialize(self, agent_position, agent_velocity, leader_position, leader_velocity):
         """ Sets the world's state as specified """
-        self.agent.position = torch.tensor(agent_position).reshape(1)
-        self.agent.velocity = torch.tensor(agent_velocity).reshape(1)
-        self.environment.l_position = torch.tensor(leader_position).reshape(1)
-        self.environment.l_velocity = torch.tensor(leader_velocity).reshape(1)
+        self.agent.position = torch.tensor(agent_position).reshape(-1)
+        self.agent.velocity = torch.tensor(agent_velocity).reshape(-1)
+        self.environment.l_position = torch.tensor(leader_position).reshape(-1)
+        self.environment.l_velocity = torch.tensor(leader_velocity).reshape(-1)
+
+        self.agent.reset_motor()
+        self.environment.reset_motor()
 
-        self.traces = {
-            'dist': [],
-            'e_power': []
-        }
+        self.traces.reset()
 
 class RobustnessComputer:
     """ Used to compute the robustness value (rho) """
     def __init__(self, formula):
         self.dqs = DiffQuantitativeSemantic(formula)
 
+    def signals(self, model):
+        """ Signals of the formula recorded in the traces """
+        return {'dist': model.traces['dist']}
+
     def compute(self, model):
-        """ Computes rho for the given trace """
-        d = model.traces['dist']
-        e_power = model.traces['e_power'][-1].item()
+        """ Computes rho for each trace of the batch, returns a (batch,) tensor """
+        e_power = model.traces['e_power'][..., -1].detach()
+
+        return self.dqs.compute(**self.signals(model))-e_power
 
-        return self.dqs.compute(dist=torch.cat(d))-e_power 
+    def monitor(self):
+        """ None, rho depends on the power consumed in the last instant,
+            which is not known before the end of the episode
+        """
+        return None
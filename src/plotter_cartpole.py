@@ -1,6 +1,5 @@
 import os
 import random
-import pickle
 import model_cartpole
 import torch
 import matplotlib.pyplot as plt
@@ -8,6 +7,7 @@ import matplotlib.colors as mcolors
 import numpy as np
 from argparse import ArgumentParser
 from misc import *
+from simstore import SimulationStore
 from settings_cartpole import get_settings
 
 parser = ArgumentParser()
@@ -34,8 +34,7 @@ sims_filename = get_sims_filename(repetitions=args.repetitions, test_params=test
 if args.dark:
     plt.style.use('./qb-common_dark.mplstyle')
     
-with open(os.path.join(EXP+relpath, sims_filename), 'rb') as f:
-    records = pickle.load(f)
+records = SimulationStore(os.path.join(EXP+relpath, sims_filename))
 
 def hist(time, const, filename):
     fig, ax = plt.subplots(1, 1, figsize=(12, 3), sharex=True)
@@ -97,27 +96,16 @@ if args.scatter is True:
     # robustness_formula = f'G(theta >= -{safe_theta} & theta <= {safe_theta})'
     robustness_computer = model_cartpole.RobustnessComputer(robustness_formula)
 
-    robustness_array = np.zeros(size)
-    cart_pos_array = np.zeros(size)
-    pole_ang_array = np.zeros(size)
-    cart_vel_array = np.zeros(size)
-    pole_ang_vel_array = np.zeros(size)
-
     for mode in ["const"]:
-        for i in range(size):
-
-            trace_theta = torch.tensor(records[i][mode]['sim_theta'])
-            robustness = float(robustness_computer.dqs.compute(theta=trace_theta))
-            cart_pos = records[i][mode]['init']['x'] 
-            pole_ang = records[i][mode]['init']['theta'] 
-            cart_vel = records[i][mode]['init']['dot_x'] 
-            pole_ang_vel = records[i][mode]['init']['dot_theta'] 
+        # all the traces are scored at once as a (size, time) batch
+        trace_theta = torch.tensor(np.array(records.channel(mode, 'sim_theta')))
+        robustness_array = robustness_computer.dqs.compute(theta=trace_theta).numpy()
 
-            robustness_array[i] = robustness
-            cart_pos_array[i] = cart_pos
-            pole_ang_array[i] = pole_ang
-            cart_vel_array[i] = cart_vel
-            pole_ang_vel_array[i] = pole_ang_vel
+        # the initial configurations are read as columns, like the traces
+        cart_pos_array = np.array(records.channel(mode, 'init.x')).reshape(size)
+        pole_ang_array = np.array(records.channel(mode, 'init.theta')).reshape(size)
+        cart_vel_array = np.array(records.channel(mode, 'init.dot_x')).reshape(size)
+        pole_ang_vel_array = np.array(records.channel(mode, 'init.dot_theta')).reshape(size)
 
         scatter(robustness_array, cart_pos_array, pole_ang_array, cart_vel_array, pole_ang_vel_array, 'atk_scatterplot.png')
 
@@ -135,17 +123,11 @@ if args.plot_evolution is True:
 
 if args.hist is True:
 
-    size = len(records)
-    const_pct = np.zeros_like(records[0]['const']['sim_theta'])
-
-    for i in range(size):
+    # fraction of the episodes within the safe angle at each instant
+    t = records.channel('const', 'sim_theta')
+    const_pct = np.logical_and(t > -safe_theta, t < safe_theta).mean(axis=0)
+    # const_pct = np.logical_and(np.logical_and(t > -safe_theta, t < safe_theta), dist < safe_dist).mean(axis=0)
 
-        x = records[i]['const']['sim_x']
-        t = records[i]['const']['sim_theta']
-        const_pct = const_pct +  np.logical_and(t > -safe_theta, t < safe_theta)
-        # const_pct = const_pct +  np.logical_and(np.logical_and(t > -safe_theta, t < safe_theta), dist < safe_dist)
-        
-    time = records[0]['const']['sim_t']
-    const_pct = const_pct / size
+    time = records.channel('const', 'sim_t')[0]
 
     hist(time, const_pct, 'pct_histogram.png')
@@ -1,6 +1,5 @@
 import os
 import random
-import pickle
 import model_cartpole_target
 import torch
 import matplotlib.pyplot as plt
@@ -8,6 +7,7 @@ import matplotlib.colors as mcolors
 import numpy as np
 from argparse import ArgumentParser
 from misc import *
+from simstore import SimulationStore
 from settings_cartpole_target import get_settings
 
 parser = ArgumentParser()
@@ -34,8 +34,7 @@ sims_filename = get_sims_filename(repetitions=args.repetitions, test_params=test
 if args.dark:
     plt.style.use('./qb-common_dark.mplstyle')
     
-with open(os.path.join(EXP+relpath, sims_filename), 'rb') as f:
-    records = pickle.load(f)
+records = SimulationStore(os.path.join(EXP+relpath, sims_filename))
 
 def hist(time, const, pulse, atk, filename):
     fig, ax = plt.subplots(1, 3, figsize=(12, 3), sharex=True)
@@ -128,28 +127,17 @@ if args.scatter is True:
     robustness_formula = f'G(theta >= -{safe_theta} & theta <= {safe_theta} & dist <= {safe_dist})'
     robustness_computer = model_cartpole_target.RobustnessComputer(robustness_formula)
 
-    robustness_array = np.zeros(size)
-    cart_pos_array = np.zeros(size)
-    pole_ang_array = np.zeros(size)
-    cart_vel_array = np.zeros(size)
-    pole_ang_vel_array = np.zeros(size)
-
     for mode in ["const","pulse","atk"]:
-        for i in range(size):
-
-            trace_theta = torch.tensor(records[i][mode]['sim_theta'])
-            trace_dist = torch.tensor(records[i][mode]['sim_dist'])
-            robustness = float(robustness_computer.dqs.compute(dist=trace_dist, theta=trace_theta))
-            cart_pos = records[i][mode]['init']['x'] 
-            pole_ang = records[i][mode]['init']['theta'] 
-            cart_vel = records[i][mode]['init']['dot_x'] 
-            pole_ang_vel = records[i][mode]['init']['dot_theta'] 
-
-            robustness_array[i] = robustness
-            cart_pos_array[i] = cart_pos
-            pole_ang_array[i] = pole_ang
-            cart_vel_array[i] = cart_vel
-            pole_ang_vel_array[i] = pole_ang_vel
+        # all the traces are scored at once as a (size, time) batch
+        trace_theta = torch.tensor(np.array(records.channel(mode, 'sim_theta')))
+        trace_dist = torch.tensor(np.array(records.channel(mode, 'sim_dist')))
+        robustness_array = robustness_computer.dqs.compute(dist=trace_dist, theta=trace_theta).numpy()
+
+        # the initial configurations are read as columns, like the traces
+        cart_pos_array = np.array(records.channel(mode, 'init.x')).reshape(size)
+        pole_ang_array = np.array(records.channel(mode, 'init.theta')).reshape(size)
+        cart_vel_array = np.array(records.channel(mode, 'init.dot_x')).reshape(size)
+        pole_ang_vel_array = np.array(records.channel(mode, 'init.dot_theta')).reshape(size)
 
         scatter(robustness_array, cart_pos_array, pole_ang_array, cart_vel_array, pole_ang_vel_array, 'atk_scatterplot.png')
 
@@ -168,34 +156,15 @@ if args.plot_evolution is True:
 
 if args.hist is True:
 
-    size = len(records)
-    const_pct = np.zeros_like(records[0]['const']['sim_theta'])
-    pulse_pct = np.zeros_like(records[0]['pulse']['sim_theta'])
-    atk_pct = np.zeros_like(records[0]['atk']['sim_theta'])
-
-    for i in range(size):
-
-        x = records[i]['const']['sim_x']
-        t = records[i]['const']['sim_theta']
-        dist = records[i]['const']['sim_dist']
-        const_pct = const_pct +  np.logical_and(t > -safe_theta, t < safe_theta)
-        # const_pct = const_pct +  np.logical_and(np.logical_and(t > -safe_theta, t < safe_theta), dist < safe_dist)
-        
-        x = records[i]['pulse']['sim_x']
-        t = records[i]['pulse']['sim_theta']
-        dist = records[i]['pulse']['sim_dist']
-        pulse_pct = pulse_pct +  np.logical_and(t > -safe_theta, t < safe_theta)
-        # pulse_pct = pulse_pct +  np.logical_and(np.logical_and(t > -safe_theta, t < safe_theta), dist < safe_dist)
-
-        x = records[i]['atk']['sim_x']
-        t = records[i]['atk']['sim_theta']
-        dist = records[i]['atk']['sim_dist']
-        atk_pct = atk_pct +  np.logical_and(t > -safe_theta, t < safe_theta)
-        # atk_pct = atk_pct + np.logical_and(np.logical_and(t > -safe_theta, t < safe_theta), dist < safe_dist)
-
-    time = records[0]['const']['sim_t']
-    const_pct = const_pct / size
-    pulse_pct = pulse_pct / size
-    atk_pct = atk_pct / size
+    # fraction of the episodes within the safe angle at each instant
+    pct = {}
+    for mode in ["const", "pulse", "atk"]:
+        t = records.channel(mode, 'sim_theta')
+        dist = records.channel(mode, 'sim_dist')
+        pct[mode] = np.logical_and(t > -safe_theta, t < safe_theta).mean(axis=0)
+        # pct[mode] = np.logical_and(np.logical_and(t > -safe_theta, t < safe_theta), dist < safe_dist).mean(axis=0)
+    const_pct, pulse_pct, atk_pct = pct["const"], pct["pulse"], pct["atk"]
+
+    time = records.channel('const', 'sim_t')[0]
 
     hist(time, const_pct, pulse_pct, atk_pct, 'pct_histogram.png')
@@ -1,12 +1,13 @@
 import os
 import random
-import pickle
 
 import matplotlib.pyplot as plt
 import numpy as np
 
 from argparse import ArgumentParser
 
+from simstore import SimulationStore
+
 parser = ArgumentParser()
 parser.add_argument("-d", "--dir", default="../experiments/cruisecontrol", type=str,
                     help="model's directory")
@@ -18,8 +19,7 @@ args = parser.parse_args()
 if args.dark:
     plt.style.use('./qb-common_dark.mplstyle')
 
-with open(os.path.join(args.dir, 'sims.pkl'), 'rb') as f:
-    records = pickle.load(f)
+records = SimulationStore(os.path.join(args.dir, 'sims'))
 
 def hist(time, up, down, atk, filename):
     fig, ax = plt.subplots(1, 3, figsize=(10, 3), sharex=True)
@@ -77,22 +77,13 @@ if args.triplots:
     plot(records[n]['atk']['space'], records[n]['atk']['sim_t'], records[n]['atk']['sim_ag_pos'], records[n]['atk']['sim_ag_vel'], records[n]['atk']['sim_ag_acc'], 'triplot_atk.png')
 
 if args.hist:
-    size = len(records)
-    up_pct = np.zeros_like(records[0]['up']['sim_ag_vel'])
-    down_pct = np.zeros_like(records[0]['down']['sim_ag_vel'])
-    atk_pct = np.zeros_like(records[0]['atk']['sim_ag_vel'])
-
-    for i in range(size):
-        t = records[i]['up']['sim_ag_vel']
-        up_pct = up_pct + np.logical_and(t > 4.75, t < 5.25)
-        t = records[i]['down']['sim_ag_vel']
-        down_pct = down_pct + np.logical_and(t > 4.75, t < 5.25)
-        t = records[i]['atk']['sim_ag_vel']
-        atk_pct = atk_pct + np.logical_and(t > 4.75, t < 5.25)
-
-    time = records[0]['up']['sim_t']
-    up_pct = up_pct / size
-    down_pct = down_pct / size
-    atk_pct = atk_pct / size
+    # fraction of the episodes near the target velocity at each instant
+    pct = {}
+    for mode in ['up', 'down', 'atk']:
+        t = records.channel(mode, 'sim_ag_vel')
+        pct[mode] = np.logical_and(t > 4.75, t < 5.25).mean(axis=0)
+    up_pct, down_pct, atk_pct = pct['up'], pct['down'], pct['atk']
+
+    time = records.channel('up', 'sim_t')[0]
 
     hist(time, up_pct, down_pct, atk_pct, 'pct_histogram.png')
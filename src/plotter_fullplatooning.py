@@ -14,42 +14,6 @@ import numpy as np
 
 from argparse import ArgumentParser
 
-class Leader:
-    def __init__(self, position=.0, velocity=1.):
-        self.car = model_platooning.Car()
-        self.car.position = torch.tensor(position)
-        self.car.velocity = torch.tensor(velocity)
-        
-    def set_follower(self, follower):
-        self._f = follower
-        
-    @property
-    def status(self):
-        return (self.car.velocity,
-               self._f.car.velocity,
-               self.car.position - self._f.car.position)
-    
-    def update(self, acc):
-        self.car.update(acc, dt)
-        
-class Follower:
-    def __init__(self, position=.0, velocity=1.):
-        self.car = model_platooning.Car()
-        self.car.position = torch.tensor(position)
-        self.car.velocity = torch.tensor(velocity)
-
-    def set_followed(self, followed):
-        self._f = followed
-        
-    @property
-    def status(self):
-        return (self._f.car.velocity,
-               self.car.velocity,
-               self._f.car.position - self.car.position)
-    
-    def update(self, acc):
-        self.car.update(acc, dt)
-
 parser = ArgumentParser()
 parser.add_argument("-d", "--dir", dest="dirname", help="model's directory")
 parser.add_argument("-n", "--nfollowers", dest="nfollowers", type=int, default=1, help="number of followers")
@@ -73,26 +37,18 @@ def run(n_followers=1, mode=None):
     init_vel = random.uniform(1,5)
     print(mode, 'd:', init_dist, 'v:', init_vel)
 
-    leader = Leader(float(n_followers * init_dist), init_vel)
-    followers = [Follower(init_dist * (float(n_followers) - i - 1), init_vel) for i in range(n_followers)]
-
-    leader.set_follower(followers[0])
-    followers[0].set_followed(leader)
-    for i in range(n_followers -1):
-        followers[i + 1].set_followed(followers[i])
+    platoon = model_platooning.Platoon(n_followers)
+    platoon.initialize(init_dist, init_vel)
 
-    sim_time = []
-    sim_leader_pos = []
-    sim_followers_pos = []
-    sim_leader_acc = []
-    sim_followers_acc = []
+    sim_time = np.arange(steps) * dt
+    sim_positions = torch.zeros(steps, n_followers + 1)
+    sim_leader_acc = torch.zeros(steps)
+    sim_followers_acc = torch.zeros(steps, n_followers)
 
-    t = 0
     for i in range(steps):
         with torch.no_grad():
-            oas = [torch.tensor(f.status) for f in followers]
-            oe = torch.tensor(leader.status)
-            z = torch.rand(attacker.noise_size)
+            oe = platoon.leader_status
+            z = torch.rand(1, attacker.noise_size)
             if mode == 0:
                 atk_policy = lambda x: torch.tensor(2.) if i > 200 and i < 250 else torch.tensor(-2.)
             elif mode == 1:
@@ -100,26 +56,19 @@ def run(n_followers=1, mode=None):
             elif mode == 2:
                 atk_policy = lambda x: torch.tensor(2.) if i < 150 else torch.tensor(-2.)
             else:
-                atk_policy = attacker(torch.cat((z, oe)))
-            def_policies = [defender(oa) for oa in oas]
-
-        atk_input = atk_policy(dt)
-        def_inputs = [def_policy(dt) for def_policy in def_policies]
-            
-        leader.update(atk_input)
-        _ = [followers[j].update(def_inputs[j]) for j in range(n_followers)]
-        
-        sim_followers_acc.append(def_inputs)
-        sim_leader_acc.append(atk_input)
-        sim_time.append(t)
-        sim_followers_pos.append([f.car.position.clone() for f in followers])
-        sim_leader_pos.append(leader.car.position.clone())
-        t += dt
-
-    sim_followers_pos = np.array(sim_followers_pos).T
-    sim_followers_acc = np.array(sim_followers_acc).T
-    
-    return(sim_time, sim_leader_pos, sim_leader_acc, sim_followers_pos, sim_followers_acc)
+                atk_policy = attacker(torch.cat((z, oe), dim=-1))
+
+            atk_input = atk_policy(dt)
+
+        sim_followers_acc[i] = platoon.step(atk_input, defender, dt)[0]
+        sim_leader_acc[i] = atk_input
+        sim_positions[i] = platoon.positions[0]
+
+    sim_leader_pos = sim_positions[:, 0].numpy()
+    sim_followers_pos = sim_positions[:, 1:].T.numpy()
+    sim_followers_acc = sim_followers_acc.T.numpy()
+
+    return(sim_time, sim_leader_pos, sim_leader_acc.numpy(), sim_followers_pos, sim_followers_acc)
 
 
 def plot(n_followers, sim_time, sim_leader_pos, sim_leader_acc, sim_followers_pos, sim_followers_acc, filename):
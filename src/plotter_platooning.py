@@ -1,6 +1,5 @@
 import os
 import random
-import pickle
 import model_cartpole
 import torch
 import matplotlib.pyplot as plt
@@ -8,6 +7,7 @@ import matplotlib.colors as mcolors
 import numpy as np
 from argparse import ArgumentParser
 from misc import *
+from simstore import SimulationStore
 from settings_platooning import get_settings
 
 parser = ArgumentParser()
@@ -29,8 +29,7 @@ sims_filename = get_sims_filename(repetitions=args.repetitions, test_params=test
 if args.dark:
     plt.style.use('./qb-common_dark.mplstyle')
     
-with open(os.path.join(EXP+relpath, sims_filename), 'rb') as f:
-    records = pickle.load(f)
+records = SimulationStore(os.path.join(EXP+relpath, sims_filename))
 
 def hist(time, pulse, step_up, step_down, atk, filename):
     fig, ax = plt.subplots(1, 4, figsize=(12, 3), sharex=True)
@@ -100,19 +99,14 @@ if args.scatter:
     robustness_formula = 'G(dist <= 10 & dist >= 2)'
     robustness_computer = model_platooning.RobustnessComputer(robustness_formula)
 
-    robustness_array = np.zeros(size)
-    delta_pos_array = np.zeros(size)
-    delta_vel_array = np.zeros(size)
+    # all the traces are scored at once as a (size, time) batch
+    sample_traces = torch.tensor(np.array(records.channel('atk', 'sim_ag_dist')[:, -150:]))
+    robustness_array = robustness_computer.dqs.compute(dist=sample_traces).numpy()
 
-    for i in range(size):
-        sample_trace = torch.tensor(records[i]['atk']['sim_ag_dist'][-150:])
-        robustness = float(robustness_computer.dqs.compute(dist=sample_trace))
-        delta_pos = records[i]['atk']['init']['env_pos'] - records[i]['atk']['init']['ag_pos']
-        delta_vel = records[i]['atk']['init']['env_vel'] - records[i]['atk']['init']['ag_vel']
-
-        robustness_array[i] = robustness
-        delta_pos_array[i] = delta_pos
-        delta_vel_array[i] = delta_vel
+    # the initial configurations are read as columns, like the traces
+    init = lambda name: np.array(records.channel('atk', 'init.' + name)).reshape(size)
+    delta_pos_array = init('env_pos') - init('ag_pos')
+    delta_vel_array = init('env_vel') - init('ag_vel')
 
     scatter(robustness_array, delta_pos_array, delta_vel_array, 'atk_scatterplot.png')
 
@@ -131,26 +125,14 @@ if args.triplots:
     plot(records[n]['atk']['sim_t'], records[n]['atk']['sim_ag_pos'], records[n]['atk']['sim_ag_dist'], records[n]['atk']['sim_ag_acc'], records[n]['atk']['sim_env_pos'], records[n]['atk']['sim_env_acc'], 'triplot_attacker.png')
 
 if args.hist:
-    size = len(records)
-    pulse_pct = np.zeros_like(records[0]['pulse']['sim_ag_dist'])
-    step_up_pct = np.zeros_like(records[0]['step_up']['sim_ag_dist'])
-    step_down_pct = np.zeros_like(records[0]['step_down']['sim_ag_dist'])
-    atk_pct = np.zeros_like(records[0]['atk']['sim_ag_dist'])
-
-    for i in range(size):
-        t = records[i]['pulse']['sim_ag_dist']
-        pulse_pct = pulse_pct + np.logical_and(t > 2, t < 10)
-        t = records[i]['step_up']['sim_ag_dist']
-        step_up_pct = step_up_pct + np.logical_and(t > 2, t < 10)
-        t = records[i]['step_down']['sim_ag_dist']
-        step_down_pct = step_down_pct + np.logical_and(t > 2, t < 10)
-        t = records[i]['atk']['sim_ag_dist']
-        atk_pct = atk_pct + np.logical_and(t > 2, t < 10)
-
-    time = records[0]['pulse']['sim_t']
-    pulse_pct = pulse_pct / size
-    step_up_pct = step_up_pct / size
-    step_down_pct = step_down_pct / size
-    atk_pct = atk_pct / size
+    # fraction of the episodes within the safe distance at each instant
+    pct = {}
+    for mode in ['pulse', 'step_up', 'step_down', 'atk']:
+        t = records.channel(mode, 'sim_ag_dist')
+        pct[mode] = np.logical_and(t > 2, t < 10).mean(axis=0)
+    pulse_pct, step_up_pct, step_down_pct, atk_pct = \
+            pct['pulse'], pct['step_up'], pct['step_down'], pct['atk']
+
+    time = records.channel('pulse', 'sim_t')[0]
 
     hist(time, pulse_pct, step_up_pct, step_down_pct, atk_pct, 'pct_histogram.png')
\ No newline at end of file
@@ -0,0 +1,156 @@
+import os
+import time
+import contextlib
+from collections import defaultdict
+
+import torch
+import torch.profiler
+
+try:
+    from torch.overrides import TorchFunctionMode
+except ImportError:
+    TorchFunctionMode = None
+
+PHASES = ('physics', 'policy', 'robustness', 'backward', 'optimizer')
+
+
+def _count_tensors(value):
+    if isinstance(value, torch.Tensor):
+        return 1
+    if isinstance(value, (tuple, list)):
+        return sum(_count_tensors(v) for v in value)
+    return 0
+
+
+if TorchFunctionMode is not None:
+    class _TensorCounter(TorchFunctionMode):
+        """ Counts the tensors returned by the torch functions called
+            while the mode is active, attributing them to the current phase
+        """
+
+        def __init__(self, profiler):
+            super().__init__()
+            self.profiler = profiler
+
+        def __torch_function__(self, func, types, args=(), kwargs=None):
+            result = func(*args, **(kwargs or {}))
+            self.profiler._tensors[self.profiler._stack[-1]] += _count_tensors(result)
+            return result
+
+
+class PhaseProfiler:
+    """ Records wall time, number of calls and number of tensors created
+        by each phase of the training loop.
+        The statistics are aggregated every `every` steps and stored in
+        `history`, a torch.profiler Chrome trace of the steps in the
+        range `trace_steps` is written to `trace_dir`.
+    """
+
+    def __init__(self, every=10, trace_dir=None, trace_steps=None,
+                 count_tensors=True, verbose=True):
+        self.every = every
+        self.trace_dir = trace_dir
+        self.trace_steps = trace_steps
+        self.verbose = verbose
+
+        self.history = []
+        self._steps = 0
+        self._stack = []
+        self._trace = None
+        self._counter = _TensorCounter(self) \
+            if count_tensors and TorchFunctionMode is not None else None
+
+        self._clear()
+
+    def _clear(self):
+        self._time = defaultdict(float)
+        self._calls = defaultdict(int)
+        self._tensors = defaultdict(int)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Context manager that attributes the enclosed code to a phase """
+        outermost = not self._stack
+        self._stack.append(name)
+
+        if outermost and self._counter is not None:
+            self._counter.__enter__()
+
+        label = torch.profiler.record_function(name) \
+            if self._trace is not None else contextlib.nullcontext()
+
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        try:
+            with label:
+                yield
+        finally:
+            if torch.cuda.is_available() and torch.cuda.is_initialized():
+                torch.cuda.synchronize()
+            self._time[name] += time.perf_counter() - start
+            self._calls[name] += 1
+
+            self._stack.pop()
+            if outermost and self._counter is not None:
+                self._counter.__exit__(None, None, None)
+
+    def step(self):
+        """ Marks the end of a step of the loop """
+        self._steps += 1
+
+        if self.trace_steps is not None:
+            start, stop = self.trace_steps
+            if self._steps == start:
+                self._start_trace()
+            elif self._steps == stop:
+                self._stop_trace()
+
+        if self._steps % self.every == 0:
+            self.history.append(self.summary())
+            if self.verbose:
+                print(self.report())
+            self._clear()
+
+    def summary(self):
+        """ Statistics of each phase since the last aggregation """
+        phases = [p for p in PHASES if p in self._calls] + \
+                 [p for p in self._calls if p not in PHASES]
+        return {'step': self._steps,
+                'phases': {p: {'time': self._time[p],
+                               'calls': self._calls[p],
+                               'tensors': self._tensors[p]} for p in phases}}
+
+    def report(self):
+        """ Human readable table of the current statistics """
+        summary = self.summary()
+        total = sum(s['time'] for s in summary['phases'].values()) or 1.
+
+        lines = [f"profile up to step {summary['step']}"]
+        for name, stats in summary['phases'].items():
+            lines.append(f"  {name:<12}{stats['time']:10.4f}s {100 * stats['time'] / total:6.1f}%"
+                         f"{stats['calls']:10d} calls{stats['tensors']:12d} tensors")
+        return '\n'.join(lines)
+
+    def _start_trace(self):
+        self._trace = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+        self._trace.__enter__()
+
+    def _stop_trace(self):
+        trace, self._trace = self._trace, None
+        if trace is None:
+            return
+
+        trace.__exit__(None, None, None)
+
+        os.makedirs(self.trace_dir or '.', exist_ok=True)
+        start, stop = self.trace_steps
+        path = os.path.join(self.trace_dir or '.', f'trace_steps={start}-{stop}.json')
+        trace.export_chrome_trace(path)
+        if self.verbose:
+            print(f"chrome trace saved in {path}")
+
+    def close(self):
+        """ Writes the pending trace, if its window is still open """
+        if self._trace is not None:
+            self._stop_trace()
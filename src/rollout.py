@@ -0,0 +1,123 @@
+from contextlib import contextmanager
+
+import torch
+import torch.nn as nn
+
+from architecture import observation
+
+METHODS = ('trace', 'compile')
+PLAYERS = ('attacker', 'defender')
+
+
+@contextmanager
+def frozen(module):
+    """ Disables the gradients of the parameters of module, so that the
+        compiled graphs do not record its operations
+    """
+    flags = [p.requires_grad for p in module.parameters()]
+    module.requires_grad_(False)
+    try:
+        yield module
+    finally:
+        for p, flag in zip(module.parameters(), flags):
+            p.requires_grad_(flag)
+
+
+class RolloutStep(nn.Module):
+    """ A single timestep of a batched rollout: the observations,
+        both policies and the physical update of the world model.
+        The attacker and the defender are submodules, so the compiled step
+        shares their parameters and sees every update of the optimizers.
+        The world model must expose its physical state as the `state`
+        (batch, size) tensor, from which its status is derived.
+        The observations of the passive player, if any, are detached,
+        so that as under no_grad its policy is not part of the graph.
+    """
+
+    def __init__(self, world_model, attacker_nn, defender_nn):
+        super().__init__()
+
+        self.attacker = attacker_nn
+        self.defender = defender_nn
+        self.passive = None
+
+        # not a module, it is only used to build the graph
+        self.model = world_model
+
+    def forward(self, state, z, atk_t, def_t, dt):
+        """ Returns the state after dt, the times are (1,) tensors so that
+            the basis of the policies is evaluated inside the graph.
+            The noise z of the attacker is sampled outside, compiled graphs
+            would draw it from a different random stream.
+        """
+        self.model.state = state
+
+        oa = observation(self.model.agent.status)
+        oe = observation(self.model.environment.status)
+
+        if self.passive == 'attacker':
+            oe = oe.detach()
+        elif self.passive == 'defender':
+            oa = oa.detach()
+
+        atk_input = self.attacker(torch.cat((z, oe), dim=-1))(atk_t)
+        def_input = self.defender(oa)(def_t)
+
+        self.model.environment.update(atk_input, dt)
+        self.model.agent.update(def_input, dt)
+
+        return self.model.state
+
+
+class CompiledRollout:
+    """ Advances a world model with a compiled RolloutStep, which fuses
+        the many small operations of a timestep into a single graph.
+        The step is traced with TorchScript or, with method='compile',
+        handed to torch.compile where it is available. Traced graphs
+        are specialized to the batch size and to the passive player,
+        so one is kept for each pair.
+        Only the state and the traces of the model are kept up to date.
+    """
+
+    def __init__(self, world_model, attacker_nn, defender_nn, method='trace'):
+        if not isinstance(getattr(type(world_model), 'state', None), property):
+            raise NotImplementedError(f"{type(world_model).__module__} does not expose its state")
+        if method not in METHODS:
+            raise ValueError(f"unknown method '{method}', expected one of {METHODS}")
+        if method == 'compile' and not hasattr(torch, 'compile'):
+            method = 'trace'
+
+        self.model = world_model
+        self.method = method
+        self.step_nn = RolloutStep(world_model, attacker_nn, defender_nn)
+        self._steps = {}
+
+    def _compiled(self, state, *inputs):
+        key = state.shape[0], self.step_nn.passive
+        if key not in self._steps:
+            if self.method == 'compile':
+                self._steps[key] = torch.compile(self.step_nn)
+            else:
+                self._steps[key] = torch.jit.trace(self.step_nn, (state,) + inputs)
+        return self._steps[key]
+
+    def step(self, atk_t, def_t, dt, passive=None):
+        """ Same as Model.step with the inputs given by the policies
+            evaluated at the times atk_t and def_t.
+            The passive player, 'attacker' or 'defender', is evaluated
+            without gradients as under no_grad in the Trainer.
+        """
+        if passive is not None and passive not in PLAYERS:
+            raise ValueError(f"unknown player '{passive}', expected one of {PLAYERS}")
+
+        state = self.model.state
+        z = torch.rand(state.shape[0], self.step_nn.attacker.noise_size)
+        inputs = (z,) + tuple(torch.tensor([float(x)]) for x in (atk_t, def_t, dt))
+
+        self.step_nn.passive = passive
+        if passive is None:
+            self.model.state = self._compiled(state, *inputs)(state, *inputs)
+        else:
+            with frozen(getattr(self.step_nn, passive)):
+                self.model.state = self._compiled(state, *inputs)(state, *inputs)
+        self.model.record()
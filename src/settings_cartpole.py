@@ -24,17 +24,21 @@ def get_settings(name, mode):
 
     if name=="default":
 
-        atk_arch = {'hidden':2, 'size':10, 'coef':1, 'noise':2}
-        def_arch = {'hidden':2, 'size':10, 'coef':1}
-        train_par = {'train_steps':10000, 'atk_steps':5, 'def_steps':8, 'horizon':10., 'dt': 0.05, 'lr':.001}
-        test_par = {'test_steps':100, 'dt':0.05}
+        atk_arch = {'hidden':2, 'size':10, 'coef':1, 'noise':2, 'basis':'polynomial'}
+        def_arch = {'hidden':2, 'size':10, 'coef':1, 'basis':'polynomial'}
+        train_par = {'train_steps':10000, 'atk_steps':5, 'def_steps':8, 'horizon':10., 'dt': 0.05, \
+                     'lr':.001, 'integrator':'euler', \
+                     'batch_size':None, 'rho_quantile':None}
+        test_par = {'test_steps':100, 'dt':0.05, 'integrator':'euler'}
     
     elif name=="testing":
 
-        atk_arch = {'hidden':2, 'size':10, 'coef':1, 'noise':2}
-        def_arch = {'hidden':2, 'size':10, 'coef':1}
-        train_par = {'train_steps':100, 'atk_steps':5, 'def_steps':8, 'horizon':2., 'dt': 0.05, 'lr':.001}
-        test_par = {'test_steps':300, 'dt':0.05}
+        atk_arch = {'hidden':2, 'size':10, 'coef':1, 'noise':2, 'basis':'polynomial'}
+        def_arch = {'hidden':2, 'size':10, 'coef':1, 'basis':'polynomial'}
+        train_par = {'train_steps':100, 'atk_steps':5, 'def_steps':8, 'horizon':2., 'dt': 0.05, \
+                     'lr':.001, 'integrator':'euler', \
+                     'batch_size':None, 'rho_quantile':None}
+        test_par = {'test_steps':300, 'dt':0.05, 'integrator':'euler'}
         
     return cart_position, cart_velocity, pole_angle, pole_ang_velocity, \
             atk_arch, def_arch, train_par, test_par, \
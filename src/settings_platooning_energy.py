@@ -22,11 +22,12 @@ def get_settings(name, mode):
 
     if name=="default":
 
-        atk_arch = {'hidden':2, 'size':10, 'coef':1, 'noise':2}
-        def_arch = {'hidden':2, 'size':10, 'coef':5}
+        atk_arch = {'hidden':2, 'size':10, 'coef':1, 'noise':2, 'basis':'polynomial'}
+        def_arch = {'hidden':2, 'size':10, 'coef':5, 'basis':'polynomial'}
         train_par = {'train_steps':10, 'atk_steps':3, 'def_steps':5, 'horizon':5., \
-                     'dt': 0.05, 'lr':0.001}
-        test_par = {'test_steps':300, 'dt':0.05}
+                     'dt': 0.05, 'lr':0.001, 'integrator':'semi_implicit', \
+                     'batch_size':None, 'rho_quantile':None}
+        test_par = {'test_steps':300, 'dt':0.05, 'integrator':'semi_implicit'}
 
     return agent_position, agent_velocity, leader_position, leader_velocity, \
             atk_arch, def_arch, train_par, test_par, \
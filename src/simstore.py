@@ -0,0 +1,171 @@
+import os
+import json
+
+import numpy as np
+import torch
+
+META = 'meta.json'
+
+
+def _flatten(record, prefix=''):
+    """ Channels of a record keyed by their dotted path,
+        e.g. {'init': {'x': 1}} gives {'init.x': 1}
+    """
+    channels = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            channels.update(_flatten(value, prefix + key + '.'))
+        else:
+            channels[prefix + key] = value
+    return channels
+
+
+def _to_numpy(value):
+    if isinstance(value, torch.Tensor):
+        value = value.detach().cpu().numpy()
+    return np.asarray(value)
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, torch.Tensor):
+        value = value.tolist()
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class SimulationWriter:
+    """ Stores the simulations of a tester in a directory, one
+        (episodes, T) .npy file for each channel of each mode, written
+        in place through memory maps as the episodes are appended.
+        Nested dictionaries, such as the initial configuration, are
+        stored as channels named after their path ('init.x'), values
+        of a nested dictionary with a single element as (episodes,).
+        The settings, the seeds and the modes are saved in meta.json.
+        The arrays are flushed and meta.json, which tells the readers how
+        many episodes are complete, is updated every flush_every episodes
+        and when the writer is closed.
+    """
+
+    def __init__(self, path, episodes, meta=None, flush_every=100):
+        self.path = path
+        self.episodes = episodes
+        self.meta = _jsonable(meta or {})
+        self.flush_every = flush_every
+        self.written = 0
+
+        self._arrays = {}
+        self._channels = {}
+
+        os.makedirs(path, exist_ok=True)
+        self._write_meta()
+
+    def append(self, sim):
+        """ Writes the next episode, a dictionary mode -> record """
+        if self.written == self.episodes:
+            raise IndexError(f"the store holds {self.episodes} episodes")
+
+        for mode, record in sim.items():
+            channels = self._channels.setdefault(mode, [])
+
+            for name, value in _flatten(record).items():
+                value = _to_numpy(value)
+                if '.' in name and value.size == 1:
+                    value = value.reshape(())
+
+                key = (mode, name)
+                if key not in self._arrays:
+                    os.makedirs(os.path.join(self.path, mode), exist_ok=True)
+                    self._arrays[key] = np.lib.format.open_memmap(
+                            os.path.join(self.path, mode, name + '.npy'), mode='w+',
+                            dtype=value.dtype, shape=(self.episodes,) + value.shape)
+                    channels.append(name)
+
+                self._arrays[key][self.written] = value
+
+        self.written += 1
+        if self.written % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        """ Makes the episodes written so far visible to the readers """
+        self._write_meta()
+
+    def close(self):
+        """ Flushes the arrays, the store can then be opened for reading """
+        self._write_meta()
+        self._arrays = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_meta(self):
+        for array in self._arrays.values():
+            array.flush()
+
+        meta = dict(self.meta, episodes=self.written, channels=self._channels)
+        tmp_path = os.path.join(self.path, META + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, META))
+
+
+class SimulationStore:
+    """ Reads a directory written by SimulationWriter, the arrays are
+        memory mapped so that only the accessed episodes are loaded.
+        It is indexed as the list of records of the testers,
+        store[i][mode]['sim_x'] and store[i][mode]['init']['x'],
+        whole channels are given by store.channel(mode, 'sim_x').
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META)) as f:
+            self.meta = json.load(f)
+
+        self.modes = list(self.meta['channels'])
+        self._arrays = {}
+
+    def __len__(self):
+        return self.meta['episodes']
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {mode: self._record(mode, i) for mode in self.modes}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def channel(self, mode, name):
+        """ (episodes, ...) array of a channel of a mode """
+        key = (mode, name)
+        if key not in self._arrays:
+            array = np.load(os.path.join(self.path, mode, name + '.npy'), mmap_mode='r')
+            # episodes still being written by an incomplete run are hidden
+            self._arrays[key] = array[:len(self)]
+        return self._arrays[key]
+
+    def _record(self, mode, i):
+        record = {}
+        for name in self.meta['channels'][mode]:
+            *groups, leaf = name.split('.')
+            node = record
+            for group in groups:
+                node = node.setdefault(group, {})
+            node[leaf] = self.channel(mode, name)[i]
+        return record
@@ -0,0 +1,224 @@
+import pytest
+import torch
+import numpy as np
+
+import misc
+import basis
+import architecture
+import model_cartpole
+import model_platooning
+import settings_platooning
+from settings_cartpole import get_settings
+
+
+def build(name="testing"):
+    cart_position, cart_velocity, pole_angle, pole_ang_velocity, \
+            atk_arch, def_arch, train_par, test_par, \
+            robustness_formula = get_settings(name, mode="train")
+
+    pg = misc.ParametersHyperparallelepiped(cart_position, cart_velocity,
+                                            pole_angle, pole_ang_velocity)
+    physical_model = model_cartpole.Model(pg.sample(sigma=0.05))
+    robustness_computer = model_cartpole.RobustnessComputer(robustness_formula)
+
+    attacker = architecture.Attacker(physical_model, *atk_arch.values(), horizon=train_par["horizon"])
+    defender = architecture.Defender(physical_model, *def_arch.values(), horizon=train_par["horizon"])
+    trainer = architecture.Trainer(physical_model, robustness_computer,
+                                   attacker, defender, train_par["lr"])
+    return trainer
+
+
+def test_policy_shape_batched():
+    trainer = build()
+    trainer.initialize_random_batch(8)
+
+    z, oa, oe = trainer.observe()
+    assert oa.shape == (8, trainer.model.agent.sensors)
+    assert oe.shape == (8, trainer.model.environment.sensors)
+
+    def_policy = trainer.defender(oa)
+    assert def_policy(0.).shape == (8,)
+
+
+def test_policy_shape_single():
+    trainer = build()
+    trainer.model.initialize_random()
+
+    z, oa, oe = trainer.observe()
+    assert trainer.defender(oa)(0.).dim() == 0
+
+
+def test_batched_robustness_per_scenario():
+    torch.manual_seed(0)
+    np.random.seed(0)
+    trainer = build()
+    trainer.initialize_random_batch(5)
+
+    for i in range(10):
+        z, oa, oe = trainer.observe()
+        atk_input = trainer.attacker(torch.cat((z, oe), dim=-1))(0.)
+        def_input = trainer.defender(oa)(0.)
+        trainer.model.step(atk_input, def_input, 0.05)
+
+    rho = trainer.robustness_computer.compute(trainer.model)
+    assert rho.shape == (5,)
+
+    theta = trainer.model.traces['theta']
+    expected = torch.min(torch.min(theta + 0.2, 0.2 - theta), dim=-1)[0]
+    assert torch.allclose(rho, expected)
+
+
+def test_batched_train_quantile():
+    trainer = build()
+    trainer.rho_quantile = 0.1
+
+    atk_loss, def_loss = trainer.train(1, 1, 5, 0.05, False, batch_size=4)
+    assert np.isfinite(atk_loss) and np.isfinite(def_loss)
+
+
+def test_train_steps_update_parameters():
+    torch.manual_seed(0)
+    np.random.seed(0)
+    trainer = build()
+    trainer.initialize_random_batch(8)
+
+    before = [p.clone() for p in trainer.defender.parameters()]
+    loss = trainer.train_defender_step(20, 0.05, False)
+
+    assert np.isfinite(loss)
+    assert all(p.grad is not None for p in trainer.defender.parameters())
+    assert all(not torch.equal(p, q) for p, q in zip(trainer.defender.parameters(), before))
+
+    # the attacker of the cartpole has no actuators, it has nothing to learn
+    before = [p.clone() for p in trainer.attacker.parameters()]
+    trainer.model.initialize_rewind()
+    assert np.isfinite(trainer.train_attacker_step(20, 0.05, False))
+    assert all(torch.equal(p, q) for p, q in zip(trainer.attacker.parameters(), before))
+
+
+def test_policy_trajectory_matches_pointwise():
+    trainer = build()
+    trainer.initialize_random_batch(3)
+    z, oa, oe = trainer.observe()
+
+    for kind in ['polynomial', 'chebyshev', 'piecewise', 'rbf']:
+        defender = architecture.Defender(trainer.model, 2, 10, 4, {'kind': kind, 'span': 2.})
+        policy = defender(oa)
+        trajectory = policy.trajectory(0.05, 40)
+
+        assert trajectory.shape == (40, 3)
+        for i in range(40):
+            assert torch.allclose(trajectory[i], policy(i * 0.05))
+
+
+def test_basis_span():
+    with pytest.raises(ValueError):
+        basis.PolicyBasis('rbf', 4)
+
+    # the span defaults to the horizon, the bases vary over the whole episode
+    chebyshev = basis.make_basis('chebyshev', 4, horizon=10.)
+    assert chebyshev.span == 10.
+    assert not torch.allclose(chebyshev(5.), chebyshev(9.))
+
+    assert basis.make_basis({'kind': 'rbf', 'span': 2.}, 4, horizon=10.).span == 2.
+    assert basis.make_basis('polynomial', 4).span is None
+
+
+def test_polynomial_basis():
+    trainer = build()
+    defender = architecture.Defender(trainer.model, 2, 10, 3)
+    x = torch.rand(trainer.model.agent.sensors)
+    coefficients = defender.nn(x)
+
+    t = 0.7
+    expected = sum(coefficients[i] * t**i for i in range(3))
+    assert torch.allclose(defender(x)(t), expected)
+
+
+def test_parallel_trainer():
+    torch.manual_seed(0)
+    np.random.seed(0)
+    *ranges, atk_arch, def_arch, train_par, test_par, formula = \
+            settings_platooning.get_settings("default", mode="train")
+    pg = misc.ParametersHyperparallelepiped(*ranges)
+
+    model = model_platooning.Model(pg.sample(sigma=0.05))
+    attacker = architecture.Attacker(model, *atk_arch.values(), horizon=train_par["horizon"])
+    defender = architecture.Defender(model, *def_arch.values(), horizon=train_par["horizon"])
+    before = [p.clone() for p in list(attacker.parameters()) + list(defender.parameters())]
+
+    parallel = architecture.ParallelTrainer(lambda: model_platooning.Model(pg.sample(sigma=0.05)),
+                                            model_platooning.RobustnessComputer(formula),
+                                            attacker, defender, lr=0.001, n_workers=2)
+    try:
+        atk_loss, def_loss = parallel.train(2, 2, 20, 0.1, False, batch_size=3)
+        assert np.isfinite(atk_loss) and np.isfinite(def_loss)
+    finally:
+        parallel.close()
+
+    after = list(attacker.parameters()) + list(defender.parameters())
+    assert all(not torch.equal(p, q) for p, q in zip(after, before))
+
+
+def test_parallel_trainer_without_actuators():
+    # the attacker of the cartpole cannot be trained, the workers send no gradients
+    trainer = build()
+    model = trainer.model
+    parallel = architecture.ParallelTrainer(lambda: model_cartpole.Model(model._param_generator),
+                                            trainer.robustness_computer, trainer.attacker,
+                                            trainer.defender, lr=0.001, n_workers=2)
+    try:
+        atk_loss, def_loss = parallel.train(2, 2, 5, 0.05, False, batch_size=3)
+        assert np.isfinite(atk_loss) and np.isfinite(def_loss)
+    finally:
+        parallel.close()
+
+
+def test_parallel_trainer_missing_gradient():
+    trainer = build()
+    model = trainer.model
+    # a parameter that the loss does not reach
+    trainer.defender.unused = torch.nn.Parameter(torch.zeros(1))
+    parallel = architecture.ParallelTrainer(lambda: model_cartpole.Model(model._param_generator),
+                                            trainer.robustness_computer, trainer.attacker,
+                                            trainer.defender, lr=0.001, n_workers=1)
+    try:
+        with pytest.raises(RuntimeError, match="unused"):
+            parallel.train(0, 1, 5, 0.05, False, batch_size=3)
+    finally:
+        parallel.close()
+
+
+def test_tester_run_batch():
+    trainer = build()
+    tester = architecture.Tester(trainer.model, trainer.robustness_computer,
+                                 trainer.attacker, trainer.defender)
+
+    results = tester.run_batch(10, time_horizon=20, dt=0.05, batch_size=4)
+
+    assert results['rho'].shape == (10,)
+    assert results['mean'] == float(results['rho'].mean())
+    assert results['failure_rate'] == float((results['rho'] < 0).double().mean())
+    low, high = results['failure_interval']
+    assert 0. <= low <= results['failure_rate'] <= high <= 1.
+
+
+def test_wilson_interval():
+    low, high = architecture.wilson_interval(0, 100)
+    assert low == 0. and abs(high - 0.037) < 1e-3
+
+    low, high = architecture.wilson_interval(50, 100)
+    assert abs(low - 0.4038) < 1e-4 and abs(high - 0.5962) < 1e-4
+
+
+def test_early_exit_nested_formula():
+    trainer = build()
+    robustness_computer = model_cartpole.RobustnessComputer('G(F[0,3](theta >= 0))')
+    tester = architecture.Tester(trainer.model, robustness_computer,
+                                 trainer.attacker, trainer.defender)
+
+    # the formula cannot be monitored online, the episode runs to the end
+    assert tester.monitor() is None
+    rho = tester.test(20, 0.05, early_exit=True)
+    assert trainer.model.traces['theta'].shape[-1] == 20
+    assert torch.equal(rho, robustness_computer.compute(trainer.model))
@@ -0,0 +1,31 @@
+import benchmark
+
+
+def test_compare_with_baseline():
+    baseline = {'fast': benchmark.result(100., 'steps/s'),
+                'latency': benchmark.result(10., 'us/call', higher_is_better=False),
+                'slow': benchmark.result(100., 'steps/s')}
+    results = {'fast': benchmark.result(150., 'steps/s'),
+               'latency': benchmark.result(20., 'us/call', higher_is_better=False),
+               'slow': benchmark.result(95., 'steps/s'),
+               'new': benchmark.result(1., 'steps/s')}
+
+    changes, regressions = benchmark.compare(results, baseline, tolerance=0.1)
+
+    assert changes == {'fast': 0.5, 'latency': -0.5, 'slow': -0.050000000000000044}
+    assert regressions == ['latency']
+
+
+def test_robustness_benchmark():
+    results = benchmark.run_benchmarks(['robustness'], repeat=1)
+
+    assert len(results) == len(benchmark.FORMULAS) * len(benchmark.TRACE_LENGTHS)
+    assert all(r['value'] > 0 and r['unit'] == 'samples/s' for r in results.values())
+
+
+def test_traces_benchmark():
+    results = benchmark.run_benchmarks(['traces'], repeat=1)
+
+    assert len(results) == 2 * len(benchmark.TRACE_STORAGES) * len(benchmark.TRACE_LENGTHS)
+    assert 'traces/buffer/grad/length=100' in results
+    assert all(r['value'] > 0 and r['unit'] == 'scenario steps/s' for r in results.values())
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("control")
+pytest.importorskip("scipy")
+
+import cartpole_classic_ctrl
+
+
+def controller():
+    return cartpole_classic_ctrl.InvertedPendulum_LQR(np.diag([1, .01, 1, 1]), np.diag([1]))
+
+
+def test_rk4_close_to_odeint():
+    timeline = np.arange(0., 5., 0.05)
+    state = np.array([0, 0, np.pi/10, 0])
+
+    adaptive = controller()
+    adaptive.run_simulation(state, timeline)
+    fixed = controller()
+    fixed.run_simulation(state, timeline, integrator='rk4')
+
+    assert adaptive.solution.shape == fixed.solution.shape == (100, 4)
+    assert fixed.ctrl_inputs.shape == (100, 3)
+    assert np.abs(adaptive.solution - fixed.solution).max() < 1e-2
+
+
+def test_batch_rows_match_single_runs():
+    timeline = np.arange(0., 5., 0.05)
+    states = np.zeros((6, 4))
+    states[:, 0] = np.linspace(-3, 2, 6)
+    states[:, 2] = np.linspace(-0.3, 0.3, 6)
+
+    batch = controller()
+    batch.run_simulation(states, timeline, integrator='rk4')
+    assert batch.solution.shape == (100, 6, 4)
+    assert batch.ctrl_inputs.shape == (100, 6, 3)
+
+    for i in [0, 3, 5]:
+        single = controller()
+        single.run_simulation(states[i], timeline, integrator='rk4')
+        assert np.allclose(single.solution, batch.solution[:, i])
+        assert np.allclose(single.ctrl_inputs, batch.ctrl_inputs[:, i])
+
+
+def test_robustness_map(tmp_path):
+    sys = controller()
+    theta_axis, dot_theta_axis, robustness_map, f_x_map, g_x_map = sys.robustness_map([15, 10])
+
+    expected = np.zeros((15, 10))
+    for i, theta in enumerate(theta_axis):
+        for j, dot_theta in enumerate(dot_theta_axis):
+            f_x, g_x = sys.f_g_SMC(theta, dot_theta)
+            expected[i, j] = abs(f_x + sys.alpha_sliding*dot_theta)/abs(g_x)
+            assert f_x_map[i, j] == f_x and g_x_map[i, j] == g_x
+    assert np.allclose(robustness_map, np.flipud(expected.T))
+
+    cartpole_classic_ctrl._maps_cache.clear()
+    tiled = sys.robustness_map([15, 10], n_workers=2, cache_dir=str(tmp_path))
+    assert all(np.array_equal(a, b) for a, b in zip(tiled[2:], (robustness_map, f_x_map, g_x_map)))
+
+    # maps are reused until a parameter changes, also from the disk cache
+    assert sys.robustness_map([15, 10])[3] is tiled[3]
+    with pytest.raises(ValueError):
+        tiled[2][0, 0] = 0.
+    with pytest.raises(ValueError):
+        tiled[3][0, 0] = 0.
+    assert np.array_equal(sys.robustness_map([15, 10])[2], robustness_map)
+    cartpole_classic_ctrl._maps_cache.clear()
+    assert np.array_equal(sys.robustness_map([15, 10], cache_dir=str(tmp_path))[2], robustness_map)
+
+    sys.alpha_sliding = 2.
+    assert not np.array_equal(sys.robustness_map([15, 10])[2], robustness_map)
+
+
+def test_diverged_rows_are_frozen():
+    timeline = np.arange(0., 2., 0.05)
+    states = np.zeros((3, 4))
+    states[:, 0] = [-1., 0., 1.]
+    states[:, 1] = [0., 0., 2.]
+
+    reference = controller()
+    reference.run_simulation(states, timeline, integrator='rk4')
+
+    sys = controller()
+    lqr_law = sys.LQR_law
+
+    def flagging_law(state, Q, R, x0=0):
+        # the cart pushed to the right is flagged as diverged past x = 1.5
+        sys.unstable_system = np.logical_or(sys.unstable_system, state[..., 0] > 1.5)
+        return lqr_law(state, Q, R, x0)
+
+    sys.LQR_law = flagging_law
+    sys.run_simulation(states, timeline, integrator='rk4')
+
+    assert sys.solution.shape == reference.solution.shape
+    assert list(sys.unstable_system) == [False, False, True]
+    assert np.array_equal(sys.solution[:, :2], reference.solution[:, :2])
+
+    # once flagged the row does not change anymore
+    moving = np.any(np.diff(sys.solution[:, 2], axis=0) != 0, axis=-1)
+    frozen = np.argmin(moving)
+    assert 0 < frozen and not np.any(moving[frozen:])
+    assert np.all(sys.ctrl_inputs[frozen + 1:, 2] == sys.ctrl_inputs[frozen, 2])
+    assert not np.array_equal(sys.solution[frozen + 1:, 2], reference.solution[frozen + 1:, 2])
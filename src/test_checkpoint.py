@@ -0,0 +1,42 @@
+import os
+import torch
+import numpy as np
+
+from checkpoint import Checkpointer
+from test_architecture import build
+
+
+def test_resume_reproduces_training(tmp_path):
+    torch.manual_seed(0)
+    np.random.seed(0)
+    trainer = build()
+    checkpointer = Checkpointer(str(tmp_path))
+
+    for step in range(2):
+        trainer.train(1, 1, 5, 0.05, False)
+    checkpointer.save(trainer, 1)
+    checkpointer.close()
+
+    expected = [trainer.train(1, 1, 5, 0.05, False) for _ in range(2)]
+
+    torch.manual_seed(1)
+    resumed = build()
+    resumed.model._param_generator = trainer.model._param_generator
+    assert Checkpointer(str(tmp_path)).load(resumed) == 2
+
+    assert [resumed.train(1, 1, 5, 0.05, False) for _ in range(2)] == expected
+    for a, b in zip(trainer.defender.parameters(), resumed.defender.parameters()):
+        assert torch.equal(a, b)
+    assert resumed.defender_optimizer.state_dict()['param_groups'] == \
+           trainer.defender_optimizer.state_dict()['param_groups']
+
+
+def test_periodic_checkpoints(tmp_path):
+    trainer = build()
+    checkpointer = Checkpointer(str(tmp_path), every_steps=2)
+
+    trainer.run(3, 5, 0.05, checkpointer=checkpointer)
+
+    assert os.listdir(tmp_path) == ['checkpoint.pt']
+    assert torch.load(tmp_path / 'checkpoint.pt', weights_only=False)['step'] == 2
+    assert Checkpointer(str(tmp_path / 'missing')).load(trainer) == 0
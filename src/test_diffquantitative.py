@@ -0,0 +1,127 @@
+import pytest
+import torch
+
+from diffquantitative import DiffQuantitativeSemantic, OnlineMonitor
+
+
+def push_all(monitor, **signals):
+    length = next(iter(signals.values())).shape[-1]
+    for t in range(length):
+        monitor.push(**{k: v[..., t] for k, v in signals.items()})
+
+
+def test_monitor_matches_offline():
+    x = torch.tensor([[.1, .5, 1.5, 2.5, -.1],
+                      [0., .1, .15, .1, .05]])
+
+    for formula in ['G(x >= -0.2 & x <= 0.2)', 'F(x >= 1)', 'G(x >= 0) | F(x >= 2)']:
+        monitor = OnlineMonitor(formula)
+        push_all(monitor, x=x)
+
+        lower, upper = monitor.bounds
+        rho = DiffQuantitativeSemantic(formula).compute(x=x)
+        assert torch.all(lower <= rho) and torch.all(rho <= upper)
+
+
+def test_monitor_early_verdict():
+    monitor = OnlineMonitor('G(x >= 0)')
+    assert not monitor.decided
+
+    monitor.push(x=torch.tensor([1., 2.]))
+    assert not monitor.decided
+
+    monitor.push(x=torch.tensor([-1., -.5]))
+    assert monitor.decided
+    assert torch.equal(monitor.bounds[1], torch.tensor([-1., -.5]))
+
+
+def test_monitor_finally_satisfied():
+    monitor = OnlineMonitor('F(x >= 1) & !(G(x <= 0))')
+    monitor.push(x=torch.tensor(0.))
+    assert not monitor.decided
+
+    monitor.push(x=torch.tensor(3.))
+    assert monitor.decided
+    assert monitor.bounds[0] == 2.
+
+
+def test_compiled_formula():
+    dqs = DiffQuantitativeSemantic('G(!(x <= 0.5) | y >= x)')
+    assert dqs.signals == ('x', 'y')
+    assert str(dqs) == 'fn.globally_(fn.or_(fn.not_(0.5 - x), y - x))'
+
+    x = torch.tensor([[1., 0.], [.2, .3]])
+    y = torch.tensor([[2., 3.], [0., 0.]])
+    rho = dqs.compute(x=x, y=y)
+
+    expected = torch.min(torch.max(x - 0.5, y - x), dim=-1)[0]
+    assert torch.allclose(rho, expected)
+
+
+def naive_window(f, a, b, reduce):
+    length = f.shape[-1]
+    return torch.stack([reduce(f[..., min(t + a, length - 1):t + b + 1], dim=-1)[0]
+                        for t in range(length)], dim=-1)
+
+
+def test_bounded_operators():
+    torch.manual_seed(0)
+    x = torch.randn(3, 50)
+
+    for a, b in [(0, 0), (0, 2), (1, 5), (3, 3), (10, 49)]:
+        dqs = DiffQuantitativeSemantic(f'G[{a},{b}](x >= 0)')
+        rho = dqs.compute_trace(x=x)
+        valid = torch.arange(50) + a < 50
+        assert torch.equal(rho[..., valid], naive_window(x, a, b, torch.min)[..., valid])
+        assert torch.all(rho[..., ~valid] == float('inf'))
+
+        rho = DiffQuantitativeSemantic(f'F[{a},{b}](x >= 0)').compute(x=x)
+        assert torch.equal(rho, x[..., a:b + 1].max(dim=-1)[0])
+
+
+def test_nested_operators():
+    x = torch.tensor([[0., 1., 0., 0., 0., 1., 0.]])
+    dqs = DiffQuantitativeSemantic('G(F[0,3](x >= 1))')
+
+    always_eventually = torch.stack([x[..., t:t + 4].max(dim=-1)[0] for t in range(7)], dim=-1) - 1
+    assert torch.equal(dqs.compute(x=x), always_eventually.min(dim=-1)[0])
+    assert dqs.compute(x=x) == -1.
+    assert DiffQuantitativeSemantic('G(F[0,4](x >= 1))').compute(x=x[..., :6]) == 0.
+
+
+def test_bounded_gradient():
+    x = torch.tensor([3., 1., 2., 5.], requires_grad=True)
+    DiffQuantitativeSemantic('G[1,2](x >= 0)').compute(x=x).backward()
+    assert torch.equal(x.grad, torch.tensor([0., 1., 0., 0.]))
+
+
+def test_monitor_bounded():
+    x = torch.tensor([[5., -1., 2., 3., -4.],
+                      [5., 1., 2., 3., -4.]])
+    monitor = OnlineMonitor('G[1,3](x >= 0)')
+    push_all(monitor, x=x[..., :4])
+
+    assert monitor.decided
+    lower, upper = monitor.bounds
+    rho = DiffQuantitativeSemantic('G[1,3](x >= 0)').compute(x=x)
+    assert torch.equal(lower, rho) and torch.equal(upper, rho)
+
+
+def test_batched_rows_gradients():
+    x = torch.randn(4, 30, requires_grad=True)
+    dqs = DiffQuantitativeSemantic('G(x >= -1 & x <= 1) | F[2,10](x >= 2)')
+
+    rho = dqs.compute(x=x)
+    assert rho.shape == (4,)
+
+    for row in range(4):
+        assert torch.equal(rho[row], dqs.compute(x=x[row:row + 1])[0])
+
+        grad, = torch.autograd.grad(rho[row], x, retain_graph=True)
+        others = torch.arange(4) != row
+        assert torch.all(grad[others] == 0) and grad[row].abs().sum() == 1
+
+
+def test_monitor_nested_unsupported():
+    with pytest.raises(ValueError, match="nested temporal operators"):
+        OnlineMonitor('G(F[0,3](x >= 1))')
@@ -0,0 +1,91 @@
+import math
+
+import pytest
+import torch
+
+import integrators
+import model_cartpole
+import model_platooning
+from integrators import get_integrator
+
+
+def oscillator(state):
+    """ Harmonic oscillator, the state being (position, velocity) """
+    return torch.stack((state[..., 1], -state[..., 0]), dim=-1)
+
+
+def integrate(integrator, dt, steps):
+    state = torch.tensor([1., 0.], dtype=torch.float64)
+    for i in range(steps):
+        state = integrator(oscillator, state, dt)
+    return state
+
+
+def error(integrator, dt):
+    t = 1.
+    state = integrate(integrator, dt, round(t / dt))
+    exact = torch.tensor([math.cos(t), -math.sin(t)], dtype=torch.float64)
+    return float(torch.norm(state - exact))
+
+
+def test_order_of_accuracy():
+    # halving dt divides the error by 2**order
+    assert 1.8 < error(integrators.euler, 0.01) / error(integrators.euler, 0.005) < 2.2
+    assert 1.8 < error(integrators.semi_implicit, 0.01) / error(integrators.semi_implicit, 0.005) < 2.2
+    assert 14 < error(integrators.rk4, 0.01) / error(integrators.rk4, 0.005) < 18
+    assert error(integrators.rk4, 0.01) < 1e-9
+
+
+def test_adaptive():
+    pytest.importorskip("torchdiffeq")
+    assert error(integrators.adaptive, 0.1) < 1e-5
+
+
+def test_semi_implicit_car():
+    car = model_platooning.Car()
+    car.position = torch.tensor([0., 5.], dtype=torch.float64)
+    car.velocity = torch.tensor([19.9, 0.], dtype=torch.float64)
+    acceleration = torch.tensor([5., -3.], dtype=torch.float64)
+    dt = 0.1
+
+    # the previous update of the car
+    friction = torch.where(car.velocity > 0, car.friction_coefficient * car.gravity, torch.tensor(0.))
+    velocity = torch.clamp(car.velocity + (acceleration - friction) * dt, 0., 20.)
+    position = car.position + velocity * dt
+
+    car.update(acceleration, dt)
+    assert torch.allclose(car.velocity, velocity)
+    assert torch.allclose(car.position, position)
+
+
+def test_model_integrator():
+    model = model_cartpole.Model(None, integrator='rk4')
+    assert model._cartpole.integrator is integrators.rk4
+
+    model.reinitialize(0., 0., 0.1, 0.)
+    for i in range(10):
+        model.step(torch.tensor(0.), torch.tensor(0.), 0.05)
+    assert torch.isfinite(model._cartpole.state).all()
+
+
+def test_unknown_integrator():
+    with pytest.raises(ValueError):
+        get_integrator('leapfrog')
+
+
+def test_rk4_cruise_control_slope():
+    import model_cruisecontrol
+
+    def simulate(dt):
+        car = model_cruisecontrol.Car('cpu')
+        car.integrator = integrators.rk4
+        car.position = torch.tensor([0.], dtype=torch.float64)
+        car.velocity = torch.tensor([2.], dtype=torch.float64)
+        for i in range(round(1. / dt)):
+            car.update(torch.tensor(1., dtype=torch.float64), lambda x: 0.3 * torch.sin(x), dt)
+        return float(car.position)
+
+    # the slope is read at the position of every stage, the step keeps its order
+    exact = simulate(0.001)
+    ratio = abs(simulate(0.1) - exact) / abs(simulate(0.05) - exact)
+    assert 12 < ratio < 20
@@ -0,0 +1,59 @@
+import os
+import csv
+
+from metrics import Downsampler, MetricsSink
+from test_architecture import build
+
+
+def test_downsampler_constant_memory():
+    series = Downsampler(max_points=10)
+    for i in range(1000):
+        series.add(i, float(i))
+
+    assert len(series.steps) < 10
+    assert series.steps[0] == 0
+    assert all(b - a == series.stride for a, b in zip(series.steps, series.steps[1:]))
+    assert series.values == [float(s) for s in series.steps]
+
+
+def test_sink_writes_logs(tmp_path):
+    sink = MetricsSink(str(tmp_path), print_every=None, max_points=8)
+    for i in range(100):
+        sink.scalar('loss', 100 - i, i)
+    sink.histogram('rho', [1., 2., 3.], 0)
+    sink.close()
+
+    steps, values = sink.history('loss')
+    assert len(steps) < 8 and steps[0] == 0
+
+    with open(tmp_path / 'metrics.csv') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 100 and rows[-1] == {'step': '99', 'tag': 'loss', 'value': '1.0'}
+
+    assert any(name.startswith('events.out.tfevents') for name in os.listdir(tmp_path))
+
+
+def test_sink_prints_complete_steps(capsys):
+    sink = MetricsSink(print_every=0.)
+    for i in range(50):
+        sink.scalar('a', i, i)
+        sink.scalar('b', i + .5, i)
+    sink.close()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[-1] == 'step 49\ta = 49.0000\tb = 49.5000'
+    for line in lines:
+        step, a, b = line.split('\t')
+        step = int(step.split()[1])
+        assert a == f'a = {step:.4f}' and b == f'b = {step + .5:.4f}'
+
+
+def test_trainer_run_logging(tmp_path):
+    trainer = build()
+    trainer.logging, trainer.logging_dir = True, str(tmp_path)
+
+    trainer.run(3, 5, 0.05)
+
+    assert os.path.exists(tmp_path / 'loss.png')
+    with open(tmp_path / 'metrics.csv') as f:
+        assert len(list(csv.DictReader(f))) == 2 * 3
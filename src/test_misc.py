@@ -0,0 +1,56 @@
+import numpy as np
+
+import misc
+import model_platooning
+
+
+def test_sample_batch_designs():
+    pg = misc.ParametersHyperparallelepiped(np.linspace(0, 1, 11), 5., np.linspace(-2, 2, 5))
+
+    for method in ['random', 'sobol', 'halton', 'lhs']:
+        samples = pg.sample_batch(64, sigma=0., method=method)
+        assert samples.shape == (64, 3)
+        assert np.all(samples[:, 1] == 5.)
+        assert np.all(np.isin(samples[:, 0], np.linspace(0, 1, 11)))
+        assert len(np.unique(samples[:, 2])) == 5
+
+    # the grid points are chosen (almost) equally often by the low-discrepancy designs
+    samples = pg.sample_batch(55, sigma=0., method='lhs')
+    assert np.all(np.unique(samples[:, 0], return_counts=True)[1] == 5)
+    samples = pg.sample_batch(55, sigma=0., method='halton')
+    assert np.all(np.abs(np.unique(samples[:, 0], return_counts=True)[1] - 5) <= 1)
+
+    first = next(pg.sample(sigma=0.))
+    assert isinstance(first, list) and len(first) == 3
+
+
+def test_sampler():
+    pg = misc.ParametersHyperparallelepiped(np.linspace(0, 1, 11), 5., np.linspace(-2, 2, 5))
+
+    # the single points are drawn one at a time from the global random state
+    np.random.seed(0)
+    points = [next(pg.sample(sigma=0.)) for _ in range(3)]
+    np.random.seed(0)
+    assert points == pg.sample_batch(1, sigma=0.).tolist() + \
+                     pg.sample_batch(1, sigma=0.).tolist() + pg.sample_batch(1, sigma=0.).tolist()
+
+    np.random.seed(0)
+    batch = pg.sample(sigma=0.).batch(4)
+    np.random.seed(0)
+    assert np.array_equal(batch, pg.sample_batch(4, sigma=0.))
+
+    sampler = pg.sample(sigma=0., chunk=4)
+    assert len([next(sampler) for _ in range(6)]) == 6
+
+
+def test_model_batch_initialization():
+    pg = misc.ParametersHyperparallelepiped(np.linspace(0, 1, 11), 5., np.linspace(-2, 2, 5), 3.)
+    model = model_platooning.Model(pg.sample(sigma=0.))
+
+    np.random.seed(0)
+    model.initialize_random_batch(8)
+    np.random.seed(0)
+    expected = pg.sample_batch(8, sigma=0.)
+
+    assert np.array_equal(np.stack(model._last_init, axis=-1), expected)
+    assert model.state.shape == (8, 4)
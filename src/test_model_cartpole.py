@@ -0,0 +1,35 @@
+import torch
+
+import model_cartpole
+
+
+def simulate(init, inputs, dt=0.05):
+    m = model_cartpole.Model(None)
+    m.reinitialize(*init)
+
+    for acc in inputs:
+        m.step(None, acc, dt)
+
+    return m
+
+
+def test_state_layout():
+    m = model_cartpole.Model(None)
+    m.reinitialize([0., 1.], [2., 3.], [.1, .2], [.3, .4])
+
+    state = m.agent._cartpole.state
+    assert state.shape == (2, 4)
+    assert torch.equal(m.agent.x, torch.tensor([0., 1.]))
+    assert torch.equal(m.agent.dot_theta, torch.tensor([.3, .4]))
+
+
+def test_batch_rows_are_independent():
+    init = ([0., .5, -.5], [.1, -.2, .3], [.05, -.1, .15], [-.2, .2, 0.])
+    inputs = [torch.tensor([1., -1., .5]) * (i % 3 - 1) for i in range(50)]
+
+    batch = simulate(init, inputs)
+
+    for row in range(3):
+        single = simulate([c[row] for c in init], [acc[row] for acc in inputs])
+        assert torch.allclose(batch.agent._cartpole.state[row],
+                              single.agent._cartpole.state[0])
@@ -0,0 +1,55 @@
+import pytest
+import torch
+
+import architecture
+import model_cruisecontrol
+
+
+def test_road_slope_lookup():
+    env = model_cruisecontrol.Environment()
+    parameters = torch.tensor([1., -2., 1.5, .2, .3, .25], requires_grad=True)
+    env.update(parameters, 0.05)
+
+    x = torch.tensor([[5., 20.3], [29.9, 41.]], dtype=torch.float32)
+    w, sigma = parameters.detach().float().reshape(2, model_cruisecontrol.BUMPS)
+    d = x[..., None] - torch.tensor([20., 30., 40.], dtype=x.dtype)
+    expected = (w * -2 * sigma**2 * d * torch.exp(-(d * sigma)**2)).sum(-1)
+
+    slope = env.get_steepness(x)
+    assert slope.shape == (2, 2)
+    assert torch.allclose(slope, expected, atol=1e-3)
+
+    slope.sum().backward()
+    assert parameters.grad is not None and torch.all(torch.isfinite(parameters.grad))
+
+
+def test_road_profile_once_per_episode():
+    env = model_cruisecontrol.Environment()
+    env.update(torch.tensor([1., -2., 1.5, .2, .3, .25]), 0.05)
+    slopes = env._slopes
+
+    # the attacker's noise changes the parameters at every step
+    env.update(torch.tensor([1., -2., 1.5, .2, .3, .25]), 0.05)
+    env.update(torch.tensor([2., 1., -1., .1, .2, .3]), 0.05)
+    assert env._slopes is slopes
+
+    env.reset()
+    env.update(torch.tensor([1., -2., 1.5, .2, .3, .25]), 0.05)
+    assert env._slopes is not slopes
+
+
+def test_custom_profile():
+    env = model_cruisecontrol.Environment()
+    env.set_profile(lambda x: 0.1 * x)
+
+    slope = env.get_steepness(torch.tensor([1., 50., 500.]))
+    height = env.get_fn(torch.tensor([0., 30.]))
+    assert torch.allclose(slope, torch.full_like(slope, 0.1), atol=1e-4)
+    assert torch.allclose(height, torch.tensor([0., 3.], dtype=height.dtype), atol=1e-4)
+
+
+def test_batched_tests_unsupported():
+    model = model_cruisecontrol.Model(None, device='cpu')
+    tester = architecture.Tester(model, None, None, None)
+    with pytest.raises(NotImplementedError, match="model_cruisecontrol"):
+        tester.test_batch(8, 10, 0.05)
@@ -0,0 +1,48 @@
+import torch
+
+import architecture
+import model_platooning
+
+
+def test_platoon_matches_single_cars():
+    torch.manual_seed(0)
+    defender = architecture.Defender(model_platooning.Model(None), 2, 10, 2)
+    n_followers, dt = 4, 0.05
+
+    platoon = model_platooning.Platoon(n_followers, n_platoons=3)
+    platoon.initialize(torch.tensor([2., 5., 8.]), torch.tensor([1., 3., 5.]))
+
+    # reference: one Car per vehicle of the second platoon, one policy per follower
+    cars = [model_platooning.Car() for _ in range(n_followers + 1)]
+    for i, car in enumerate(cars):
+        car.position = torch.tensor(5. * (n_followers - i))
+        car.velocity = torch.tensor(3.)
+
+    for step in range(100):
+        leader_acc = torch.tensor([1., -1., 2.]) * (-1) ** (step // 30)
+
+        with torch.no_grad():
+            inputs = [defender(torch.stack((ahead.velocity, car.velocity,
+                                            ahead.position - car.position)))(dt)
+                      for ahead, car in zip(cars[:-1], cars[1:])]
+        cars[0].update(leader_acc[1], dt)
+        for car, acc in zip(cars[1:], inputs):
+            car.update(acc, dt)
+
+        followers_acc = platoon.step(leader_acc, defender, dt)
+
+        assert followers_acc.shape == (3, n_followers)
+        assert torch.allclose(followers_acc[1], torch.stack(inputs).reshape(-1))
+
+    assert torch.allclose(platoon.positions[1], torch.stack([c.position for c in cars]).reshape(-1))
+    assert torch.allclose(platoon.velocities[1], torch.stack([c.velocity for c in cars]).reshape(-1))
+
+
+def test_platoon_status():
+    platoon = model_platooning.Platoon(1000, n_platoons=2)
+    platoon.initialize(3., 2.)
+
+    assert platoon.positions.shape == (2, 1001)
+    assert torch.all(platoon.distances == 3.)
+    assert platoon.followers_status.shape == (2, 1000, 3)
+    assert torch.equal(platoon.leader_status, platoon.followers_status[:, 0])
@@ -0,0 +1,70 @@
+import torch
+import numpy as np
+
+import model_platooning_energy
+
+
+def test_efficiency_interpolates_map():
+    motor = model_platooning_energy.ElMotor()
+    speed, torque = np.meshgrid(motor.EM_w_list, motor.EM_T_list)
+    valid = ~np.isnan(motor.efficiency)
+
+    eff = motor.getEfficiency(torch.tensor(speed[valid], dtype=torch.float64),
+                              torch.tensor(torque[valid], dtype=torch.float64))
+    assert np.allclose(eff.numpy(), motor.efficiency[valid])
+
+
+def test_efficiency_batched_and_differentiable():
+    motor = model_platooning_energy.ElMotor()
+    speed = torch.linspace(0., 1140., 50, dtype=torch.float64)
+    torque = torch.linspace(-180., 180., 50, dtype=torch.float64, requires_grad=True)
+
+    eff = motor.getEfficiency(speed, torque)
+    assert eff.shape == (50,)
+    assert torch.all(torch.isfinite(eff)) and torch.all((eff > 0.4) & (eff < 1.))
+
+    eff.sum().backward()
+    assert torch.all(torch.isfinite(torque.grad))
+
+
+def test_torque_limits_match_curve():
+    motor = model_platooning_energy.ElMotor()
+    speed = torch.linspace(-100., 1300., 200, dtype=torch.float64)
+
+    min_tq, max_tq = motor.getMinMaxTorque(speed)
+    expected = np.interp(speed.numpy(), motor.EM_w_list, motor.EM_T_max_list)
+    assert np.allclose(max_tq.numpy(), expected)
+    assert torch.equal(min_tq, -max_tq)
+
+
+def test_batched_training():
+    import misc
+    import architecture
+    from settings_platooning_energy import get_settings
+
+    agent_position, agent_velocity, leader_position, leader_velocity, \
+            atk_arch, def_arch, train_par, test_par, \
+            robustness_formula = get_settings("default", mode="train")
+
+    pg = misc.ParametersHyperparallelepiped(agent_position, agent_velocity,
+                                            leader_position, leader_velocity)
+    physical_model = model_platooning_energy.Model(pg.sample(sigma=0.05))
+    robustness_computer = model_platooning_energy.RobustnessComputer(robustness_formula)
+
+    attacker = architecture.Attacker(physical_model, *atk_arch.values(), horizon=train_par["horizon"])
+    defender = architecture.Defender(physical_model, *def_arch.values(), horizon=train_par["horizon"])
+    trainer = architecture.Trainer(physical_model, robustness_computer,
+                                   attacker, defender, train_par["lr"])
+
+    atk_loss, def_loss = trainer.train(1, 1, 10, 0.05, False, batch_size=4)
+    assert np.isfinite(atk_loss) and np.isfinite(def_loss)
+
+    # rho is only known at the end of the episode, early exit is skipped
+    tester = architecture.Tester(physical_model, robustness_computer, attacker, defender)
+    rho = tester.test_batch(4, 10, 0.05, early_exit=True)
+    assert rho.shape == (4,) and torch.all(torch.isfinite(rho))
+
+    for batch_size, rows in [(4, 4), (None, 1)]:
+        trainer.initialize_random(batch_size)
+        trainer.defender_loss(10, 0.05, False)
+        assert physical_model.traces['dist'].shape == (rows, 10)
@@ -0,0 +1,39 @@
+import os
+import torch
+
+from profiling import PhaseProfiler
+from test_architecture import build
+
+
+def test_training_phases(tmp_path):
+    trainer = build()
+    trainer.profiler = PhaseProfiler(every=2, trace_dir=str(tmp_path), trace_steps=(1, 2),
+                                     verbose=False)
+
+    trainer.run(4, 5, 0.05)
+
+    assert [summary['step'] for summary in trainer.profiler.history] == [2, 4]
+    phases = trainer.profiler.history[-1]['phases']
+    assert list(phases) == ['physics', 'policy', 'robustness', 'backward', 'optimizer']
+
+    # 2 steps, each with 1 attacker and 1 defender episode of 5 instants
+    assert phases['physics']['calls'] == 2 * 2 * 5
+    assert phases['robustness']['calls'] == 2 * 2
+    assert phases['policy']['tensors'] > 0
+    assert all(stats['time'] > 0 for stats in phases.values())
+
+    assert os.path.exists(tmp_path / 'trace_steps=1-2.json')
+
+
+def test_nested_phases_count_innermost():
+    profiler = PhaseProfiler(verbose=False)
+
+    with profiler.phase('policy'):
+        torch.zeros(3)
+        with profiler.phase('physics'):
+            torch.ones(3) + 1
+
+    phases = profiler.summary()['phases']
+    assert phases['policy']['tensors'] == 1
+    assert phases['physics']['tensors'] == 2
+    assert phases['policy']['time'] >= phases['physics']['time']
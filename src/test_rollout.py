@@ -0,0 +1,125 @@
+import pytest
+import torch
+import numpy as np
+
+import architecture
+import benchmark
+import rollout
+
+
+def build(name):
+    torch.manual_seed(0)
+    np.random.seed(0)
+    model, robustness_computer, attacker, defender, train_par = benchmark.build(name)
+    return model, robustness_computer, attacker, defender
+
+
+def test_trainer_matches_eager():
+    model, robustness_computer, attacker, defender = build('cartpole')
+    eager = architecture.Trainer(model, robustness_computer, attacker, defender, lr=0.)
+    compiled = architecture.Trainer(model, robustness_computer, attacker, defender, lr=0.,
+                                    compiled='trace')
+
+    model.initialize_random_batch(16)
+    losses, traces = [], []
+    for trainer in [eager, compiled, compiled]:
+        model.initialize_rewind()
+        torch.manual_seed(1)
+        losses.append(trainer.attacker_loss(30, 0.05, False))
+        traces.append(model.traces['theta'].clone())
+
+    assert traces[0].shape == (16, 30)
+    for loss, trace in zip(losses[1:], traces[1:]):
+        assert torch.equal(loss, losses[0])
+        assert torch.equal(trace, traces[0])
+
+
+@pytest.mark.parametrize('method', ['trace', 'compile'])
+def test_tester_matches_eager(method):
+    if method == 'compile' and not hasattr(torch, 'compile'):
+        pytest.skip("torch.compile is not available")
+
+    rho = []
+    for compiled in [None, method]:
+        model, robustness_computer, attacker, defender = build('platooning')
+        tester = architecture.Tester(model, robustness_computer, attacker, defender,
+                                     compiled=compiled)
+        torch.manual_seed(1)
+        rho.append(tester.test_batch(8, 50, 0.1))
+
+    assert rho[0].shape == (8,)
+    assert torch.equal(rho[0], rho[1])
+
+
+def test_parameters_shared():
+    model, robustness_computer, attacker, defender = build('platooning')
+    step = rollout.CompiledRollout(model, attacker, defender)
+
+    model.initialize_random_batch(4)
+    initial = model.state
+    step.step(0., 0., 0.1)
+
+    # updates of the optimizers are seen by the compiled graph
+    with torch.no_grad():
+        for param in defender.parameters():
+            param.add_(0.1)
+
+    model.state = initial
+    torch.manual_seed(2)
+    step.step(0., 0.1, 0.1)
+    compiled_state = model.state
+
+    model.state = initial
+    torch.manual_seed(2)
+    trainer = architecture.Trainer(model, robustness_computer, attacker, defender, lr=0.)
+    z, oa, oe = trainer.observe()
+    model.step(attacker(torch.cat((z, oe), dim=-1))(0.), defender(oa)(0.1), 0.1)
+
+    assert torch.equal(compiled_state, model.state)
+
+
+def test_unsupported():
+    model, robustness_computer, attacker, defender = build('cartpole_target')
+    with pytest.raises(NotImplementedError):
+        rollout.CompiledRollout(model, attacker, defender)
+
+    model, robustness_computer, attacker, defender = build('cartpole')
+    with pytest.raises(ValueError):
+        rollout.CompiledRollout(model, attacker, defender, method='script')
+
+
+@pytest.mark.parametrize('player, passive', [('attacker', 'defender'), ('defender', 'attacker')])
+def test_passive_player_gradients(player, passive):
+    model, robustness_computer, attacker, defender = build('platooning')
+    nets = {'attacker': attacker, 'defender': defender}
+    eager = architecture.Trainer(model, robustness_computer, attacker, defender, lr=0.)
+    compiled = architecture.Trainer(model, robustness_computer, attacker, defender, lr=0.,
+                                    compiled='trace')
+
+    model.initialize_random_batch(8)
+    grads = []
+    for trainer in [eager, compiled]:
+        model.initialize_rewind()
+        torch.manual_seed(1)
+        getattr(trainer, f'{player}_loss')(20, 0.1, False).backward()
+
+        # the passive player is not part of the graph of the loss
+        assert all(p.grad is None and p.requires_grad for p in nets[passive].parameters())
+        grads.append([p.grad.clone() for p in nets[player].parameters()])
+        nets[player].zero_grad(set_to_none=True)
+
+    for a, b in zip(*grads):
+        assert torch.allclose(a, b)
+
+
+def test_fixed_policy_falls_back(monkeypatch):
+    monkeypatch.setattr(architecture, 'FIXED_POLICY', True)
+    model, robustness_computer, attacker, defender = build('platooning')
+    with pytest.warns(UserWarning, match="FIXED_POLICY"):
+        trainer = architecture.Trainer(model, robustness_computer, attacker, defender, lr=0.,
+                                       compiled='trace')
+    assert trainer.rollout is None
+
+    for loss in [trainer.attacker_loss, trainer.defender_loss]:
+        model.initialize_random_batch(4)
+        loss(10, 0.1, False).backward()
@@ -0,0 +1,49 @@
+import json
+import os
+
+import numpy as np
+import torch
+
+from simstore import SimulationWriter, SimulationStore
+
+
+def episode(i, steps=6):
+    return {'init': {'x': torch.tensor([float(i)]), 'theta': torch.tensor(0.1 * i)},
+            'sim_t': np.arange(steps) * 0.05,
+            'sim_x': np.full(steps, float(i))}
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / 'sims')
+    with SimulationWriter(path, 3, meta={'seed': 7, 'test_par': {'dt': 0.05}}) as writer:
+        for i in range(3):
+            writer.append({'const': episode(i), 'atk': episode(-i)})
+
+    records = SimulationStore(path)
+    assert len(records) == 3
+    assert records.meta['seed'] == 7 and records.meta['test_par'] == {'dt': 0.05}
+    assert records.modes == ['const', 'atk']
+
+    assert records[2]['const']['init']['x'] == 2.
+    assert np.isclose(records[1]['atk']['init']['theta'], -0.1)
+    assert np.all(records[1]['const']['sim_x'] == 1.)
+
+    sim_x = records.channel('atk', 'sim_x')
+    assert isinstance(sim_x, np.memmap) and sim_x.shape == (3, 6)
+    assert np.all(sim_x[:, 0] == [0., -1., -2.])
+
+
+def test_partial_store(tmp_path):
+    path = str(tmp_path / 'sims')
+    writer = SimulationWriter(path, 10, flush_every=2)
+    for i in range(3):
+        writer.append({'const': episode(i)})
+
+    # the flushed episodes are readable while the run goes on
+    records = SimulationStore(path)
+    assert len(records) == 2
+    assert records.channel('const', 'sim_x').shape == (2, 6)
+    writer.close()
+
+    with open(os.path.join(path, 'meta.json')) as f:
+        assert json.load(f)['episodes'] == 3
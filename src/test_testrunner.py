@@ -0,0 +1,73 @@
+import numpy as np
+import torch
+
+import misc
+from simstore import SimulationWriter, SimulationStore
+from testrunner import TestRunner
+from settings_cartpole import get_settings
+from test_architecture import build
+
+
+def setup():
+    # same weights in every worker, as loaded by the testers
+    torch.manual_seed(0)
+    trainer = build()
+    # the initial configurations are drawn from the seed of each job
+    *ranges, atk_arch, def_arch, train_par, test_par, formula = get_settings("testing", mode="test")
+    pg = misc.ParametersHyperparallelepiped(*ranges)
+    trainer.model._param_generator = pg.sample(sigma=0.05)
+    return trainer
+
+
+def run(trainer, mode=None):
+    trainer.initialize_random_batch(1)
+    z, oa, oe = trainer.observe()
+    x = [float(trainer.model.agent.x)]
+
+    for i in range(5):
+        with torch.no_grad():
+            atk_input = trainer.attacker(torch.cat((z, oe), dim=-1))(0.)
+            def_input = trainer.defender(oa)(0.) * mode
+        trainer.model.step(atk_input, def_input, 0.05)
+        x.append(float(trainer.model.agent.x))
+
+    return {'init': {'x': x[0]}, 'sim_x': np.array(x), 'noise': np.random.rand(3)}
+
+
+def test_results_independent_of_workers():
+    modes = {'zero': 0, 'unit': 1}
+    serial = list(TestRunner(setup, run, modes, seed=3, n_workers=0).results(4))
+    parallel = list(TestRunner(setup, run, modes, seed=3, n_workers=2).results(4))
+
+    assert len(serial) == len(parallel) == 4
+    for a, b in zip(serial, parallel):
+        assert list(a) == list(b) == ['zero', 'unit']
+        for mode in modes:
+            assert np.array_equal(a[mode]['sim_x'], b[mode]['sim_x'])
+            assert np.array_equal(a[mode]['noise'], b[mode]['noise'])
+
+    # every job has its own seed
+    assert not np.array_equal(serial[0]['zero']['noise'], serial[0]['unit']['noise'])
+    assert not np.array_equal(serial[0]['zero']['noise'], serial[1]['zero']['noise'])
+
+
+def test_serial_keeps_threads():
+    threads = torch.get_num_threads()
+    if threads == 1:
+        torch.set_num_threads(2)
+    try:
+        expected = torch.get_num_threads()
+        list(TestRunner(setup, run, {'const': 0}, n_workers=0).results(1))
+        assert torch.get_num_threads() == expected
+    finally:
+        torch.set_num_threads(threads)
+
+
+def test_write(tmp_path):
+    runner = TestRunner(setup, run, {'const': 0}, n_workers=2)
+    with SimulationWriter(str(tmp_path), 3) as writer:
+        runner.write(writer, 3)
+
+    records = SimulationStore(str(tmp_path))
+    assert len(records) == 3
+    assert records.channel('const', 'sim_x').shape == (3, 6)
@@ -0,0 +1,63 @@
+import torch
+
+from traces import TraceBuffer
+
+
+def test_append_and_grow():
+    traces = TraceBuffer('a', 'b', capacity=2)
+    traces.reset()
+
+    for i in range(5):
+        traces.append(a=torch.full((3,), float(i)), b=torch.tensor(-i))
+
+    assert len(traces) == 5
+    assert traces['a'].shape == (3, 5)
+    assert torch.equal(traces['a'][1], torch.arange(5.))
+    assert torch.equal(traces['b'][2], -torch.arange(5.))
+
+
+def test_gradients_flow_through_writes():
+    traces = TraceBuffer('x', capacity=4)
+    traces.reset()
+
+    w = torch.tensor([1., 2.], requires_grad=True)
+    for i in range(3):
+        traces.append(x=w * i)
+
+    traces['x'].sum().backward()
+    assert torch.equal(w.grad, torch.tensor([3., 3.]))
+
+
+def test_reset_allocates_new_storage():
+    traces = TraceBuffer('x')
+    traces.reset()
+    traces.append(x=torch.ones(2))
+    first = traces['x']
+
+    traces.reset()
+    traces.append(x=torch.zeros(4))
+    assert traces['x'].shape == (4, 1)
+    assert torch.equal(first, torch.ones(2, 1))
+
+
+def test_storage_depends_on_gradients():
+    w = torch.tensor([1., 2.], requires_grad=True)
+
+    # with gradients the steps are stacked, the graph has no copy of the buffer
+    traces = TraceBuffer('x', 'y')
+    traces.reset()
+    for i in range(3):
+        traces.append(x=w * i, y=torch.tensor(1.))
+    assert traces['x'].shape == (2, 3)
+    assert torch.equal(traces['y'], torch.ones(2, 3))
+    assert 'CopySlices' not in type(traces['x'].grad_fn).__name__
+
+    traces.append(x=w * 3, y=torch.tensor(1.))
+    traces['x'].sum().backward()
+    assert torch.equal(w.grad, torch.tensor([6., 6.]))
+
+    # without them the steps are written into the preallocated buffer
+    with torch.no_grad():
+        traces.reset()
+        traces.append(x=w, y=torch.tensor(1.))
+    assert traces._steps is None and traces._data.shape == (2, 2, 128)
@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_batched_training_script(tmp_path):
+    # the experiments are saved in ../experiments, relative to the working directory
+    run_dir = tmp_path / 'run'
+    run_dir.mkdir()
+    env = dict(os.environ, PYTHONPATH=SRC)
+    subprocess.run([sys.executable, os.path.join(SRC, 'train_platooning.py'), '--batch_size', '4'],
+                   cwd=run_dir, env=env, check=True, capture_output=True)
+
+    experiment, = (tmp_path / 'experiments').iterdir()
+    files = os.listdir(experiment)
+    assert 'checkpoint.pt' in files and 'metrics.csv' in files
+    assert any(f.startswith('attacker_') for f in files)
+    assert any(f.startswith('defender_') for f in files)
@@ -1,5 +1,4 @@
 import os
-import pickle
 import model_cartpole_target
 from misc import *
 import architecture
@@ -7,12 +6,15 @@ import torch
 import torch.nn as nn
 import numpy as np
 from argparse import ArgumentParser
-from tqdm import tqdm
+from simstore import SimulationWriter
+from testrunner import TestRunner
 from settings_cartpole_target import get_settings
 
 parser = ArgumentParser()
 parser.add_argument("-r", "--repetitions", type=int, default=1, help="simulation repetions")
 parser.add_argument("--architecture", type=str, default="default", help="architecture's name")
+parser.add_argument("--seed", type=int, default=0, help="random seed")
+parser.add_argument("--workers", type=int, default=None, help="number of processes, 0 runs in this one")
 args = parser.parse_args()
 
 cart_position, cart_velocity, pole_angle, pole_ang_velocity, x_target, \
@@ -22,16 +24,19 @@ cart_position, cart_velocity, pole_angle, pole_ang_velocity, x_target, \
 pg = ParametersHyperparallelepiped(cart_position, cart_velocity, 
                                         pole_angle, pole_ang_velocity, x_target)
 
-physical_model = model_cartpole_target.Model(pg.sample(sigma=0.05))
-
-attacker = architecture.Attacker(physical_model, *atk_arch.values())
-defender = architecture.Defender(physical_model, *def_arch.values())
-
 relpath = get_relpath(main_dir="cartpole_target_"+args.architecture, train_params=train_par)
 
-load_models(attacker, defender, EXP+relpath)
+def setup():
+    # the initial configurations are drawn one at a time from the seed of each job
+    physical_model = model_cartpole_target.Model(pg.sample(sigma=0.05), integrator=test_par['integrator'])
+
+    attacker = architecture.Attacker(physical_model, *atk_arch.values(), horizon=train_par["horizon"])
+    defender = architecture.Defender(physical_model, *def_arch.values(), horizon=train_par["horizon"])
+    load_models(attacker, defender, EXP+relpath)
+    return physical_model, attacker, defender
 
-def run(mode=None):
+def run(models, mode=None):
+    physical_model, attacker, defender = models
     physical_model.initialize_random()
     conf_init = {
         'x': physical_model.agent.x,
@@ -114,15 +119,13 @@ def run(mode=None):
             'sim_def_acc': np.array(sim_def_acc),
     }
 
-records = []
-for i in tqdm(range(args.repetitions)):
-    sim = {}
-    sim['const'] = run(0)
-    sim['pulse'] = run(1)
-    sim['atk'] = run()
-    records.append(sim)
-    
+modes = {'const': 0, 'pulse': 1, 'atk': None}
+
 filename = get_sims_filename(repetitions=args.repetitions, test_params=test_par)
-           
-with open(os.path.join(EXP+relpath, filename), 'wb') as f:
-    pickle.dump(records, f)
+meta = {'architecture': args.architecture, 'seed': args.seed, 'modes': list(modes),
+        'train_par': train_par, 'test_par': test_par}
+
+runner = TestRunner(setup, run, modes, seed=args.seed, n_workers=args.workers)
+
+with SimulationWriter(os.path.join(EXP+relpath, filename), args.repetitions, meta) as writer:
+    runner.write(writer, args.repetitions)
@@ -1,5 +1,4 @@
 import os
-import pickle
 
 import model_cruisecontrol
 import misc
@@ -8,7 +7,9 @@ import architecture
 import torch
 import torch.nn as nn
 import numpy as np
-from tqdm import tqdm
+
+from simstore import SimulationWriter
+from testrunner import TestRunner
 
 from argparse import ArgumentParser
 
@@ -17,23 +18,29 @@ parser.add_argument("-d", "--dir", dest="dirname", default="../experiments/cruis
                     help="model's directory")
 parser.add_argument("-r", "--repetitions", dest="repetitions", type=int, default=1,
                     help="simulation repetions")
+parser.add_argument("--seed", type=int, default=0, help="random seed")
+parser.add_argument("--workers", type=int, default=None, help="number of processes, 0 runs in this one")
 args = parser.parse_args()
 
 agent_position = 0
 agent_velocity = np.linspace(-12, 12, 25)
 pg = misc.ParametersHyperparallelepiped(agent_position, agent_velocity)
 
-physical_model = model_cruisecontrol.Model(pg.sample(sigma=0.05))
+def setup():
+    # the initial configurations are drawn one at a time from the seed of each job
+    physical_model = model_cruisecontrol.Model(pg.sample(sigma=0.05))
 
-attacker = architecture.Attacker(physical_model, 1, 10, 5, n_coeff=1)
-defender = architecture.Defender(physical_model, 2, 10)
+    attacker = architecture.Attacker(physical_model, 1, 10, 5, n_coeff=1)
+    defender = architecture.Defender(physical_model, 2, 10)
 
-misc.load_models(attacker, defender, args.dirname)
+    misc.load_models(attacker, defender, args.dirname)
+    return physical_model, attacker, defender
 
 dt = 0.05
 steps = 30 #0
 
-def run(mode=None):
+def run(models, mode=None):
+    physical_model, attacker, defender = models
     physical_model.initialize_random()
     conf_init = {
         'ag_pos': physical_model.agent.position,
@@ -59,9 +66,9 @@ def run(mode=None):
         atk_policy = attacker(z)
         
     if mode is not None:
-        physical_model.environment._fn = rbf
+        physical_model.environment.set_profile(rbf)
     
-    for i in tqdm(range(steps)):
+    for i in range(steps):
         oa = torch.tensor(physical_model.agent.status).float()
         
         with torch.no_grad():
@@ -80,7 +87,7 @@ def run(mode=None):
         t += dt
         
     x = np.arange(0, 100, physical_model.environment._dx)
-    y = physical_model.environment.get_fn(torch.tensor(x))
+    y = physical_model.environment.get_fn(torch.tensor(x)).cpu().numpy()
 
     return {'init': conf_init,
             'space': {'x': x, 'y': y},
@@ -90,14 +97,10 @@ def run(mode=None):
             'sim_ag_acc': np.array(sim_ag_acc),
     }
 
-records = []
-for i in range(args.repetitions):
-    sim = {}
-    sim['up'] = run(0)
-    sim['down'] = run(1)
-    sim['atk'] = run()
-    
-    records.append(sim)
-    
-with open(os.path.join(args.dirname, 'sims.pkl'), 'wb') as f:
-    pickle.dump(records, f)
+modes = {'up': 0, 'down': 1, 'atk': None}
+meta = {'seed': args.seed, 'modes': list(modes), 'dt': dt, 'steps': steps}
+
+runner = TestRunner(setup, run, modes, seed=args.seed, n_workers=args.workers)
+
+with SimulationWriter(os.path.join(args.dirname, 'sims'), args.repetitions, meta) as writer:
+    runner.write(writer, args.repetitions)
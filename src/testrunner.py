@@ -0,0 +1,90 @@
+import os
+import random
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from tqdm import tqdm
+
+# state of a worker process, built once by the initializer
+_worker = {}
+
+
+def job_seed(seed, repetition, mode):
+    """ Seed of a single simulation, independent of the worker that runs it """
+    return int(np.random.SeedSequence([seed, repetition, mode]).generate_state(1)[0])
+
+
+def _initialize(setup, run, seed):
+    _worker['models'] = setup()
+    _worker['run'] = run
+    _worker['seed'] = seed
+
+
+def _initialize_pool_worker(setup, run, seed):
+    # the workers already run in parallel, one thread each avoids oversubscription
+    torch.set_num_threads(1)
+    _initialize(setup, run, seed)
+
+
+def _job(job):
+    repetition, index, name, mode = job
+
+    seed = job_seed(_worker['seed'], repetition, index)
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+
+    return repetition, name, _worker['run'](_worker['models'], mode)
+
+
+class TestRunner:
+    """ Runs the simulations of a tester over a pool of worker processes.
+        Each (repetition, mode) pair is a job seeded from its indices,
+        so the results do not depend on the number of workers.
+        `setup()` builds the models, it is called once by every worker,
+        `run(models, mode)` simulates an episode and returns its record.
+        The modes are a dictionary name -> argument given to run.
+    """
+
+    def __init__(self, setup, run, modes, seed=0, n_workers=None):
+        self.setup = setup
+        self.run = run
+        self.modes = modes
+        self.seed = seed
+        self.n_workers = os.cpu_count() if n_workers is None else n_workers
+
+    def jobs(self, repetitions):
+        for repetition in range(repetitions):
+            for index, (name, mode) in enumerate(self.modes.items()):
+                yield repetition, index, name, mode
+
+    def results(self, repetitions):
+        """ Yields the simulations of each repetition in order,
+            as dictionaries mode -> record
+        """
+        jobs = self.jobs(repetitions)
+
+        if self.n_workers == 0:
+            _initialize(self.setup, self.run, self.seed)
+            yield from self._collect(map(_job, jobs))
+            return
+
+        # forked workers inherit setup and run, no pickling required
+        context = mp.get_context('fork')
+        with context.Pool(self.n_workers, initializer=_initialize_pool_worker,
+                          initargs=(self.setup, self.run, self.seed)) as pool:
+            yield from self._collect(pool.imap(_job, jobs))
+
+    def _collect(self, results):
+        sim = {}
+        for repetition, name, record in results:
+            sim[name] = record
+            if len(sim) == len(self.modes):
+                yield sim
+                sim = {}
+
+    def write(self, writer, repetitions):
+        """ Streams the simulations into a SimulationWriter """
+        for sim in tqdm(self.results(repetitions), total=repetitions):
+            writer.append(sim)
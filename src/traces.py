@@ -0,0 +1,90 @@
+import torch
+
+
+class TraceBuffer:
+    """ Storage for the signals recorded during an episode.
+        Each named channel is a (batch, time) tensor written one step at
+        a time. Without gradients the steps are written into a preallocated
+        buffer and reading a channel returns a view on the steps recorded
+        so far. When the signals require gradients, every in-place write
+        would add a copy of the whole buffer to the graph, making backward
+        quadratic in the length of the episode: the values of each step
+        are then kept in a list and every channel is stacked once, when
+        it is first read.
+    """
+
+    def __init__(self, *channels, capacity=128):
+        self.channels = channels
+        self._index = {name: i for i, name in enumerate(channels)}
+        self._capacity = capacity
+        self._data = None
+        self._steps = None
+        self._stacked = None
+        self._length = 0
+
+    def reserve(self, capacity):
+        """ Sets the number of steps allocated at the beginning of an episode """
+        self._capacity = max(int(capacity), 1)
+
+    def reset(self):
+        """ Discards the recorded steps, the storage of the next episode is
+            allocated at its first step, when the batch size is known
+        """
+        self._data = None
+        self._steps = None
+        self._stacked = None
+        self._length = 0
+
+    def _allocate(self, values):
+        self._batch_size = max(torch.as_tensor(v).numel() for v in values.values())
+
+        if torch.is_grad_enabled() and any(torch.is_tensor(v) and v.requires_grad
+                                           for v in values.values()):
+            self._steps = []
+        else:
+            self._data = torch.zeros(len(self.channels), self._batch_size, self._capacity)
+
+    def _grow(self):
+        self._capacity *= 2
+        padding = torch.zeros(self._data.shape[:-1] + (self._capacity - self._length,))
+        self._data = torch.cat((self._data, padding), dim=-1)
+
+    def append(self, **values):
+        """ Records one step, each value has shape (batch,) or broadcasts to it """
+        if self._data is None and self._steps is None:
+            self._allocate(values)
+
+        if self._steps is not None:
+            self._steps.append(values)
+            self._stacked = {}
+        else:
+            if self._length == self._data.shape[-1]:
+                self._grow()
+
+            for name, value in values.items():
+                self._data[self._index[name], :, self._length] = value
+
+        self._length += 1
+
+    def _expand(self, value):
+        if torch.is_tensor(value) and value.shape == (self._batch_size,) \
+                and value.dtype == torch.get_default_dtype():
+            return value
+        return torch.as_tensor(value, dtype=torch.get_default_dtype()).expand(self._batch_size)
+
+    def __getitem__(self, name):
+        """ (batch, time) tensor of the recorded steps of a channel """
+        if self._steps is not None:
+            if name not in self._stacked:
+                self._stacked[name] = torch.stack([self._expand(step.get(name, 0.))
+                                                   for step in self._steps], dim=-1)
+            return self._stacked[name]
+        if self._data is None:
+            return torch.zeros(1, 0)
+        return self._data[self._index[name], :, :self._length]
+
+    def __len__(self):
+        return self._length
+
+    def keys(self):
+        return self.channels
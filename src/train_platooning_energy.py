@@ -5,11 +5,20 @@ import numpy as np
 import torch.nn as nn
 from argparse import ArgumentParser
 import architecture
+from profiling import PhaseProfiler
+from checkpoint import Checkpointer
 import model_platooning_energy
 from settings_platooning_energy import get_settings
 
 parser = ArgumentParser()
 parser.add_argument("--architecture", type=str, default="default", help="architecture's name")
+parser.add_argument("--workers", type=int, default=0, help="number of parallel training processes")
+parser.add_argument("--profile", type=int, default=0, help="reports the time spent in each phase every N steps")
+parser.add_argument("--batch_size", type=int, default=None,
+                    help="scenarios simulated at once in each step, overrides the settings")
+parser.add_argument("--checkpoint_every", type=int, default=100, help="steps between checkpoints")
+parser.add_argument("--checkpoint_minutes", type=float, default=10., help="minutes between checkpoints")
+parser.add_argument("--resume", default=False, action="store_true", help="resumes from the last checkpoint")
 args = parser.parse_args()
 
 agent_position, agent_velocity, leader_position, leader_velocity, \
@@ -19,20 +28,41 @@ agent_position, agent_velocity, leader_position, leader_velocity, \
 pg = ParametersHyperparallelepiped(agent_position, agent_velocity, 
                                     leader_position, leader_velocity)
 
-physical_model = model_platooning_energy.Model(pg.sample(sigma=0.05))
+physical_model = model_platooning_energy.Model(pg.sample(sigma=0.05), integrator=train_par['integrator'])
 robustness_computer = model_platooning_energy.RobustnessComputer(robustness_formula)
 
 relpath = get_relpath(main_dir="platooning_energy_"+args.architecture, train_params=train_par)
 
-attacker = architecture.Attacker(physical_model, *atk_arch.values())
-defender = architecture.Defender(physical_model, *def_arch.values())
-trainer = architecture.Trainer(physical_model, robustness_computer, \
-                            attacker, defender, train_par["lr"], EXP+relpath)
+# the chrome trace covers the second step, the first one warms up
+profiler = PhaseProfiler(every=args.profile, trace_dir=EXP+relpath, trace_steps=(1, 2)) \
+            if args.profile > 0 else None
+
+attacker = architecture.Attacker(physical_model, *atk_arch.values(), horizon=train_par["horizon"])
+defender = architecture.Defender(physical_model, *def_arch.values(), horizon=train_par["horizon"])
+if args.workers > 0:
+    trainer = architecture.ParallelTrainer(lambda: model_platooning_energy.Model(pg.sample(sigma=0.05), integrator=train_par['integrator']), \
+                            robustness_computer, attacker, defender, train_par["lr"], \
+                            EXP+relpath, rho_quantile=train_par["rho_quantile"], \
+                            n_workers=args.workers, profiler=profiler)
+else:
+    trainer = architecture.Trainer(physical_model, robustness_computer, \
+                            attacker, defender, train_par["lr"], EXP+relpath, \
+                            rho_quantile=train_par["rho_quantile"], profiler=profiler)
 tester = architecture.Tester(physical_model, robustness_computer, \
                             attacker, defender, EXP+relpath)
 
+checkpointer = Checkpointer(EXP+relpath, every_steps=args.checkpoint_every, \
+                            every_seconds=60*args.checkpoint_minutes)
+start_step = checkpointer.load(trainer) if args.resume else 0
+
 simulation_horizon = int(train_par["horizon"] / train_par["dt"])
+batch_size = args.batch_size if args.batch_size is not None else train_par["batch_size"]
 trainer.run(train_par["train_steps"], simulation_horizon, train_par["dt"], 
-            atk_steps=train_par["atk_steps"], def_steps=train_par["def_steps"])
+            atk_steps=train_par["atk_steps"], def_steps=train_par["def_steps"],
+            batch_size=batch_size, checkpointer=checkpointer,
+            start_step=start_step)
+
+if args.workers > 0:
+    trainer.close()
 
 save_models(attacker, defender, EXP+relpath)
\ No newline at end of file